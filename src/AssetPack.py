@@ -0,0 +1,200 @@
+"""Build step and loader for the binary asset pack.
+
+    python AssetPack.py [path]
+
+bakes the generated textures, the level texture atlas, the primitive and
+NPC body meshes and the glyph atlases into one file. Run it again after
+changing any of them, a pack from an older format version is ignored.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from Constants import ASSET_PACK, PACKED_FONT_SIZES
+
+MAGIC = b"VBAIPACK"
+PACK_VERSION = 1
+ALIGNMENT = 64  # Every array starts on a cache line
+# magic, version, alignment, table offset, table size
+HEADER = struct.Struct("<8sIIQQ")
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class PackWriter:
+    """Collects named arrays (plus JSON metadata) and writes them as a pack"""
+
+    def __init__(self, **info):
+        self.info = info  # Pack-wide metadata, checked by the loader
+        self.entries = {}  # name -> (array, meta)
+
+    def add(self, name, array, **meta):
+        self.entries[name] = (np.ascontiguousarray(array), meta)
+
+    def write(self, path):
+        table = {}
+        offset = align(HEADER.size)
+        for name, (array, meta) in self.entries.items():
+            table[name] = {
+                "offset": offset, "dtype": array.dtype.str, "shape": array.shape, "meta": meta,
+            }
+            offset = align(offset + array.nbytes)
+        toc = json.dumps({"info": self.info, "entries": table}).encode()
+
+        # Write next to the target and rename, a running game may have it mapped
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, PACK_VERSION, ALIGNMENT, offset, len(toc)))
+            for name, (array, meta) in self.entries.items():
+                f.seek(table[name]["offset"])
+                f.write(array.tobytes())
+            f.seek(offset)
+            f.write(toc)
+        os.replace(temp_path, path)
+
+
+class AssetPack:
+    """Read-only view of a pack file through mmap.
+
+    array() returns NumPy arrays that point straight into the mapping, so
+    nothing is copied or decoded at load time and pages are only read when
+    the data is first used, typically by the GL upload itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, alignment, toc_offset, toc_size = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an asset pack")
+        if version != PACK_VERSION or alignment != ALIGNMENT:
+            self.close()
+            raise ValueError(f"{path} has format version {version}, expected {PACK_VERSION}")
+        toc = json.loads(self.data[toc_offset:toc_offset + toc_size])
+        self.info = toc["info"]
+        self.entries = toc["entries"]
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def array(self, name):
+        """Read-only array backed by the mapped file"""
+        entry = self.entries[name]
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        count = int(np.prod(shape))
+        return np.frombuffer(self.data, dtype, count, entry["offset"]).reshape(shape)
+
+    def meta(self, name):
+        return self.entries[name]["meta"]
+
+    def close(self):
+        self.data.close()
+
+
+def pack_info():
+    """What the baked assets depend on besides the pack format"""
+    import pygame
+
+    # Glyph rasterization differs between pygame / SDL_ttf versions
+    return {"pygame": pygame.version.ver}
+
+
+_pack = None
+_pack_loaded = False
+
+
+def get_asset_pack():
+    """The game's shared AssetPack, or None to build everything at runtime"""
+    global _pack, _pack_loaded
+    if not _pack_loaded:
+        _pack_loaded = True
+        if not os.path.exists(ASSET_PACK):
+            print(f"[AssetPack] {ASSET_PACK} not found, building assets at runtime")
+        else:
+            try:
+                pack = AssetPack(ASSET_PACK)
+            except ValueError as e:
+                print(f"[AssetPack] {e}, building assets at runtime")
+            else:
+                if pack.info != pack_info():
+                    print(f"[AssetPack] {ASSET_PACK} was built with {pack.info}, building assets at runtime")
+                    pack.close()
+                else:
+                    _pack = pack
+    return _pack
+
+
+def set_asset_pack(pack):
+    """Replace the shared pack, None makes every asset build at runtime"""
+    global _pack, _pack_loaded
+    _pack = pack
+    _pack_loaded = True
+
+
+def build_pack(path=ASSET_PACK):
+    """Bake every asset the game builds at startup into a pack at `path`"""
+    import pygame
+
+    from mesh_cache import get_cube_mesh, get_sphere_mesh
+    from NPC import BODY_PARTS, LOD_SPHERE_DETAIL
+    from NPCRenderer import BodyTemplate
+    from TextRenderer import GlyphAtlas, get_font
+    from TextureManager import TextureManager, atlas_key, mip_chain
+    from World import LEVEL_TEXTURES
+
+    # Everything below must come from the builders, not an existing pack
+    set_asset_pack(None)
+    pygame.font.init()
+    writer = PackWriter(**pack_info())
+
+    textures = TextureManager()
+    for name in ("wall", "floor", "ceiling"):
+        writer.add(f"texture/{name}", textures.pixels(name))
+    atlas = textures.atlas(LEVEL_TEXTURES.values())
+    key = atlas_key(LEVEL_TEXTURES.values())
+    # Mips are baked too, generating them is the slowest part of a texture upload
+    mips = mip_chain(atlas.pixels, atlas.max_level)
+    writer.add(key, atlas.pixels, uv_rects=atlas.uv_rects, levels=len(mips))
+    for level, image in enumerate(mips, 1):
+        writer.add(f"{key}/mip{level}", image)
+
+    cube = get_cube_mesh()
+    writer.add("mesh/cube/positions", cube.positions)
+    writer.add("mesh/cube/normals", cube.normals)
+    sphere_sizes = [size for slot, shape, offset, size in BODY_PARTS if shape == "sphere"]
+    for detail in LOD_SPHERE_DETAIL:
+        if detail is not None:
+            for radius in sphere_sizes:
+                sphere = get_sphere_mesh(radius, detail, detail)
+                writer.add(f"mesh/sphere/{radius}/{detail}/{detail}/positions", sphere.positions)
+                writer.add(f"mesh/sphere/{radius}/{detail}/{detail}/normals", sphere.normals)
+        body = BodyTemplate(detail)
+        writer.add(f"mesh/body/{detail}/positions", body.positions)
+        writer.add(f"mesh/body/{detail}/normals", body.normals)
+        writer.add(f"mesh/body/{detail}/slots", body.slots)
+
+    for size in PACKED_FONT_SIZES:
+        glyphs = GlyphAtlas(get_font(size))
+        writer.add(
+            f"glyphs/{size}", glyphs.pixels(),
+            glyphs=glyphs.glyphs, cursor=glyphs.cursor, line_height=glyphs.line_height,
+        )
+
+    writer.write(path)
+    print(f"[AssetPack] Wrote {len(writer.entries)} assets to {path}")
+
+
+if __name__ == "__main__":
+    # Go through the imported module, its shared pack is the one the game modules see
+    import AssetPack
+
+    AssetPack.build_pack(*sys.argv[1:])
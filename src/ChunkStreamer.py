@@ -0,0 +1,211 @@
+import math
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SYNC_REACH = 1  # load() builds the center cell and this many cells around it right away
+
+
+class ChunkStreamer:
+    """Keeps the chunks of a grid resident around a moving point.
+
+    `build(cell)` runs on a background thread and must not touch GL. Its
+    result is handed to `upload(cell, data)` on the main thread, and the
+    returned value stays resident until `release(cell, chunk)`. Uploads stop
+    once `upload_budget` seconds have been spent in a frame. Chunks past
+    `unload_radius` are released, and if more than `max_resident` remain, the
+    least recently used go too. Resident memory therefore depends on the
+    radii, not on the map size. A build that raises is queued again, up to
+    `max_retries` times in a row, before the cell is left empty until the
+    center moves to another cell.
+    """
+
+    def __init__(self, build, upload, release, chunk_size, extent,
+                 load_radius, unload_radius, max_resident, upload_budget, max_retries=3):
+        self.build = build
+        self.upload = upload
+        self.release = release
+        self.chunk_size = chunk_size
+        self.extent = extent  # (cx0, cz0, cx1, cz1) inclusive range of cells that exist
+        self.load_radius = load_radius
+        self.unload_radius = max(unload_radius, load_radius)
+        self.max_resident = max_resident
+        self.upload_budget = upload_budget
+        self.max_retries = max_retries
+
+        self.resident = OrderedDict()  # cell -> chunk, least recently used first
+        self.loading = set()  # Cells handed to the builder whose result is not uploaded yet
+        self.center = (0.0, 0.0)
+        self.center_cell = None
+        self.generation = 0  # Bumped by clear() so stale builds are dropped
+        self.failures = {}  # cell -> failed builds in a row
+
+        # Shared with the builder thread
+        self.condition = threading.Condition()
+        self.wanted = set()  # Cells waiting to be built, nearest first
+        self.ready = queue.Queue()  # (generation, cell, data)
+        self.thread = None
+        self.running = False
+
+    def distance(self, cell, x=None, z=None):
+        """Distance from (x, z), the current center by default, to the nearest point of `cell`"""
+        if x is None:
+            x, z = self.center
+        s = self.chunk_size
+        dx = max(cell[0] * s - x, 0.0, x - (cell[0] + 1) * s)
+        dz = max(cell[1] * s - z, 0.0, z - (cell[1] + 1) * s)
+        return math.hypot(dx, dz)
+
+    def cells_near(self, x, z, radius):
+        cx0, cz0, cx1, cz1 = self.extent
+        s = self.chunk_size
+        reach = int(math.ceil(radius / s))
+        col, row = math.floor(x / s), math.floor(z / s)
+        cxs = np.arange(max(cx0, col - reach), min(cx1, col + reach) + 1)
+        czs = np.arange(max(cz0, row - reach), min(cz1, row + reach) + 1)
+        # Per-axis distance to the nearest edge of each cell, then combine
+        dx = np.maximum(np.maximum(cxs * s - x, x - (cxs + 1) * s), 0.0)
+        dz = np.maximum(np.maximum(czs * s - z, z - (czs + 1) * s), 0.0)
+        near = np.hypot(dx[:, None], dz[None, :]) <= radius
+        return {(int(cxs[i]), int(czs[j])) for i, j in zip(*np.nonzero(near))}
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.build_loop, name="ChunkStreamer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def build_loop(self):
+        while True:
+            with self.condition:
+                while self.running and not self.wanted:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                cell = min(self.wanted, key=self.distance)
+                self.wanted.discard(cell)
+                generation = self.generation
+            self.ready.put((generation, cell, self.try_build(cell)))
+
+    def try_build(self, cell):
+        """build(cell), or None if it raised"""
+        try:
+            return self.build(cell)
+        except Exception as e:
+            print(f"[ChunkStreamer] Failed to build chunk {cell}: {e}")
+            return None
+
+    def load(self, x, z):
+        """Build and upload the cell at (x, z) and its neighbours right away,
+        e.g. before the first frame. The rest stay queued for the builder."""
+        self.recenter(x, z)
+        col, row = self.center_cell
+        with self.condition:
+            cells = {
+                cell for cell in self.wanted
+                if abs(cell[0] - col) <= SYNC_REACH and abs(cell[1] - row) <= SYNC_REACH
+            }
+            self.wanted -= cells
+        for cell in sorted(cells, key=self.distance):
+            self.loading.discard(cell)
+            data = self.try_build(cell)
+            if data is None:
+                self.retry(cell)
+                continue
+            self.failures.pop(cell, None)
+            self.resident[cell] = self.upload(cell, data)
+
+    def update(self, x, z):
+        """Request, upload and evict chunks for a frame centred on (x, z)"""
+        self.start()
+        self.recenter(x, z)
+
+        # Upload finished chunks until this frame's budget is spent
+        start = time.perf_counter()
+        while time.perf_counter() - start < self.upload_budget:
+            try:
+                generation, cell, data = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue
+            self.loading.discard(cell)
+            if data is None:
+                self.retry(cell)
+                continue
+            self.failures.pop(cell, None)
+            if cell in self.resident or self.distance(cell) > self.unload_radius:
+                continue
+            self.resident[cell] = self.upload(cell, data)
+
+        while len(self.resident) > self.max_resident:
+            cell, chunk = self.resident.popitem(last=False)
+            self.release(cell, chunk)
+
+    def retry(self, cell):
+        """Queue a cell whose build failed again, unless it failed too often or is out of range"""
+        failures = self.failures.get(cell, 0) + 1
+        self.failures[cell] = failures
+        if failures > self.max_retries:
+            if failures == self.max_retries + 1:
+                print(f"[ChunkStreamer] Giving up on chunk {cell} after {failures} failed builds")
+            return
+        if self.distance(cell) > self.load_radius:
+            return
+        with self.condition:
+            self.wanted.add(cell)
+            self.loading.add(cell)
+            self.condition.notify()
+
+    def recenter(self, x, z):
+        self.center = (x, z)
+        cell = (math.floor(x / self.chunk_size), math.floor(z / self.chunk_size))
+        if cell == self.center_cell:
+            return
+        self.center_cell = cell
+
+        # Release chunks that are now far away, oldest first
+        for far in [c for c in self.resident if self.distance(c) > self.unload_radius]:
+            self.release(far, self.resident.pop(far))
+
+        needed = self.cells_near(x, z, self.load_radius)
+        with self.condition:
+            # Drop requests that are out of range before they are built
+            dropped = self.wanted - needed
+            self.wanted -= dropped
+            self.loading -= dropped
+            missing = needed - self.loading - self.resident.keys()
+            # Cells given up on get a fresh set of retries from a new center
+            for cell in missing:
+                self.failures.pop(cell, None)
+            self.wanted |= missing
+            self.loading |= missing
+            if self.wanted:
+                self.condition.notify()
+
+    def touch(self, cell):
+        """Mark a resident chunk as used this frame"""
+        self.resident.move_to_end(cell)
+
+    def clear(self):
+        """Release every chunk and forget pending builds, e.g. after the source data changed"""
+        with self.condition:
+            self.generation += 1
+            self.wanted.clear()
+        for cell, chunk in self.resident.items():
+            self.release(cell, chunk)
+        self.resident.clear()
+        self.loading.clear()
+        self.failures.clear()
+        self.center_cell = None
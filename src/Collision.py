@@ -0,0 +1,240 @@
+import math
+
+# Gap kept between a circle and whatever it was stopped by
+SKIN = 1e-4
+
+
+def ray_box(x, z, dx, dz, box):
+    """Slab test of the ray (x, z) + t * (dx, dz) against an XZ box.
+
+    Returns (t_enter, t_exit, nx, nz) with the normal of the entry face, or
+    None if the ray's line misses the box.
+    """
+    x0, z0, x1, z1 = box
+    t_enter, t_exit = -math.inf, math.inf
+    nx = nz = 0.0
+    for origin, direction, lo, hi, axis in ((x, dx, x0, x1, 0), (z, dz, z0, z1, 1)):
+        if direction == 0:
+            if origin < lo or origin > hi:
+                return None
+            continue
+        t0, t1 = (lo - origin) / direction, (hi - origin) / direction
+        if t0 > t1:
+            t0, t1 = t1, t0
+        if t0 > t_enter:
+            t_enter = t0
+            sign = -1.0 if direction > 0 else 1.0
+            nx, nz = (sign, 0.0) if axis == 0 else (0.0, sign)
+        t_exit = min(t_exit, t1)
+    if t_enter > t_exit:
+        return None
+    return t_enter, t_exit, nx, nz
+
+
+def ray_circle(x, z, dx, dz, cx, cz, radius):
+    """First t at which the ray enters the circle, None if it misses or starts inside"""
+    ox, oz = x - cx, z - cz
+    c = ox * ox + oz * oz - radius * radius
+    if c < 0:
+        return None
+    a = dx * dx + dz * dz
+    b = ox * dx + oz * dz
+    disc = b * b - a * c
+    if a == 0 or disc < 0 or b > 0:
+        return None
+    return (-b - math.sqrt(disc)) / a
+
+
+def sweep_circle_box(x, z, dx, dz, radius, box):
+    """Time of impact in [0, 1] of a circle moving by (dx, dz) against a box.
+
+    The box grown by `radius` is the union of two rectangles and four corner
+    circles, the earliest entering hit among them wins. Returns (t, nx, nz)
+    or None. Starting out overlapping is left to CollisionGrid.depenetrate.
+    """
+    x0, z0, x1, z1 = box
+    best = None
+    for rect in ((x0 - radius, z0, x1 + radius, z1), (x0, z0 - radius, x1, z1 + radius)):
+        hit = ray_box(x, z, dx, dz, rect)
+        if hit is not None and 0 <= hit[0] <= 1 and (best is None or hit[0] < best[0]):
+            best = (hit[0], hit[2], hit[3])
+    for cx, cz in ((x0, z0), (x1, z0), (x0, z1), (x1, z1)):
+        t = ray_circle(x, z, dx, dz, cx, cz, radius)
+        if t is not None and 0 <= t <= 1 and (best is None or t < best[0]):
+            best = (t, (x + dx * t - cx) / radius, (z + dz * t - cz) / radius)
+    return best
+
+
+class CollisionGrid:
+    """Solid geometry of a level on the XZ plane, bucketed by map tile.
+
+    Wall tiles come straight from the Level, other solids (furniture, NPCs)
+    are boxes registered under every tile they overlap. Every query only
+    visits the tiles it touches, never the full list of objects. Keys of
+    wall hits are ("wall", col, row), boxes keep the key they were added with.
+    """
+
+    def __init__(self, level):
+        self.level = level
+        self.cell_size = level.tile_size
+        self.boxes = {}  # key -> (x0, z0, x1, z1)
+        self.cells = {}  # (col, row) -> set of keys
+
+    def tile_range(self, x0, z0, x1, z1):
+        col0, row0 = self.level.world_to_tile(x0, z0)
+        col1, row1 = self.level.world_to_tile(x1, z1)
+        return [(col, row) for col in range(col0, col1 + 1) for row in range(row0, row1 + 1)]
+
+    def tile_box(self, col, row):
+        ox, oz = self.level.origin
+        s = self.cell_size
+        return (ox + col * s, oz + row * s, ox + (col + 1) * s, oz + (row + 1) * s)
+
+    def add_box(self, key, lo, hi):
+        """Register a solid from its (lo, hi) 3D bounds, only X and Z are used"""
+        box = (float(lo[0]), float(lo[2]), float(hi[0]), float(hi[2]))
+        self.boxes[key] = box
+        for cell in self.tile_range(*box):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove_box(self, key):
+        box = self.boxes.pop(key)
+        for cell in self.tile_range(*box):
+            self.cells[cell].discard(key)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def update_box(self, key, lo, hi):
+        """Move a solid, cheap when it did not move"""
+        box = (float(lo[0]), float(lo[2]), float(hi[0]), float(hi[2]))
+        if self.boxes.get(key) == box:
+            return
+        if key in self.boxes:
+            self.remove_box(key)
+        self.add_box(key, lo, hi)
+
+    def candidates(self, x0, z0, x1, z1, ignore=()):
+        """Broadphase: {key: box} of every solid on the tiles overlapping the rectangle"""
+        found = {}
+        for col, row in self.tile_range(x0, z0, x1, z1):
+            if self.level.is_wall(col, row):
+                found[("wall", col, row)] = self.tile_box(col, row)
+            for key in self.cells.get((col, row), ()):
+                if key not in ignore:
+                    found[key] = self.boxes[key]
+        return found
+
+    def depenetrate(self, x, z, radius, ignore=()):
+        """Push a circle out of any solid it overlaps"""
+        for _ in range(4):
+            pushed = False
+            boxes = self.candidates(x - radius, z - radius, x + radius, z + radius, ignore)
+            for x0, z0, x1, z1 in boxes.values():
+                px, pz = min(max(x, x0), x1), min(max(z, z0), z1)
+                ox, oz = x - px, z - pz
+                distance = math.hypot(ox, oz)
+                if distance >= radius:
+                    continue
+                if distance > 0:
+                    push = radius - distance + SKIN
+                    x, z = x + ox / distance * push, z + oz / distance * push
+                else:
+                    # Centre inside the box, leave through the nearest face
+                    exits = ((x - x0, -1, 0), (x1 - x, 1, 0), (z - z0, 0, -1), (z1 - z, 0, 1))
+                    depth, nx, nz = min(exits)
+                    x, z = x + nx * (depth + radius + SKIN), z + nz * (depth + radius + SKIN)
+                pushed = True
+            if not pushed:
+                break
+        return x, z
+
+    def move(self, x, z, dx, dz, radius, ignore=(), max_slides=3):
+        """Sweep a circle by (dx, dz), sliding along whatever it hits.
+
+        Returns the reachable (x, z). The circle can never pass through a
+        solid however large the step, since the whole path is swept.
+        """
+        for _ in range(max_slides):
+            # Resolving one contact can leave the circle touching another
+            x, z = self.depenetrate(x, z, radius, ignore)
+            if dx == 0 and dz == 0:
+                break
+            boxes = self.candidates(
+                min(x, x + dx) - radius, min(z, z + dz) - radius,
+                max(x, x + dx) + radius, max(z, z + dz) + radius, ignore,
+            )
+            hit = None
+            for box in boxes.values():
+                impact = sweep_circle_box(x, z, dx, dz, radius, box)
+                if impact is not None and (hit is None or impact[0] < hit[0]):
+                    hit = impact
+            if hit is None:
+                x, z = x + dx, z + dz
+                break
+
+            t, nx, nz = hit
+            x, z = x + dx * t + nx * SKIN, z + dz * t + nz * SKIN
+            # Slide: keep the part of the remaining motion along the surface
+            dx, dz = dx * (1 - t), dz * (1 - t)
+            into = dx * nx + dz * nz
+            dx, dz = dx - into * nx, dz - into * nz
+        return self.depenetrate(x, z, radius, ignore)
+
+    def raycast(self, x, z, dx, dz, max_distance, ignore=(), walls_only=False):
+        """First solid along a ray, walking the tile grid with a DDA.
+
+        Returns (distance, key) or None when nothing is hit within
+        `max_distance`. The direction does not have to be normalized.
+        """
+        length = math.hypot(dx, dz)
+        if length == 0:
+            return None
+        dx, dz = dx / length, dz / length
+        s = self.cell_size
+        ox, oz = self.level.origin
+        col, row = self.level.world_to_tile(x, z)
+
+        # Distance along the ray to the next column / row boundary, and between boundaries
+        step_col = 1 if dx > 0 else -1
+        step_row = 1 if dz > 0 else -1
+        next_x = ox + (col + (dx > 0)) * s
+        next_z = oz + (row + (dz > 0)) * s
+        t_col = (next_x - x) / dx if dx else math.inf
+        t_row = (next_z - z) / dz if dz else math.inf
+        delta_col = s / abs(dx) if dx else math.inf
+        delta_row = s / abs(dz) if dz else math.inf
+
+        t = 0.0
+        tested = set()
+        while t <= max_distance:
+            if self.level.is_wall(col, row) and ("wall", col, row) not in ignore:
+                return (t, ("wall", col, row))
+
+            # Objects in this tile, hits are only final if they happen inside it
+            t_next = min(t_col, t_row)
+            best = None
+            if not walls_only:
+                for key in self.cells.get((col, row), ()):
+                    if key in ignore or key in tested:
+                        continue
+                    hit = ray_box(x, z, dx, dz, self.boxes[key])
+                    if hit is None or hit[1] < 0:
+                        tested.add(key)
+                        continue
+                    t_hit = max(hit[0], 0.0)
+                    if t_hit <= t_next and (best is None or t_hit < best[0]):
+                        best = (t_hit, key)
+            if best is not None:
+                return best if best[0] <= max_distance else None
+
+            if t_col < t_row:
+                t, t_col, col = t_col, t_col + delta_col, col + step_col
+            else:
+                t, t_row, row = t_row, t_row + delta_row, row + step_row
+        return None
+
+    def line_of_sight(self, x0, z0, x1, z1, ignore=(), walls_only=False):
+        """True if nothing solid lies between the two points"""
+        distance = math.hypot(x1 - x0, z1 - z0)
+        hit = self.raycast(x0, z0, x1 - x0, z1 - z0, distance, ignore, walls_only)
+        return hit is None or hit[0] >= distance
@@ -1,9 +1,42 @@
+import os
 
 # Constants
 WINDOW_WIDTH = 800
 WINDOW_HEIGHT = 600
 TILE_SIZE = 32
 FPS = 60
+IDLE_FPS = 10  # Checks per second for changes while the screen is idle
+
+# Camera projection
+FIELD_OF_VIEW = 45
+NEAR_PLANE = 0.1
+FAR_PLANE = 50.0
+
+# Scene light, a point light fixed in world space above the office. Static
+# geometry has it baked in (lighting.py), only NPCs are lit per frame
+LIGHT_POSITION = (0.0, 5.0, 0.0, 1.0)
+LIGHT_AMBIENT = (0.5, 0.5, 0.5, 1.0)
+LIGHT_DIFFUSE = (1.0, 1.0, 1.0, 1.0)
+LIGHT_MODEL_AMBIENT = (0.2, 0.2, 0.2, 1.0)  # Fixed-function GL_LIGHT_MODEL_AMBIENT default
+
+# Dynamic resolution (--dynamic-resolution), fractions of the window size
+DYNAMIC_RESOLUTION_MIN_SCALE = 0.5
+DYNAMIC_RESOLUTION_MAX_SCALE = 1.0
+DYNAMIC_RESOLUTION_STEP = 0.05  # Scales are rounded to this
+
+# World streaming
+CHUNK_SIZE = 4.0  # World units per chunk side, also the culling cell size
+CHUNK_LOAD_RADIUS = FAR_PLANE  # Chunks this close to the player are built
+CHUNK_UNLOAD_RADIUS = FAR_PLANE + 2 * CHUNK_SIZE  # and released past this
+MAX_RESIDENT_CHUNKS = 1024
+CHUNK_UPLOAD_BUDGET = 0.002  # Seconds of display list compiles per frame
+
+# Asset files live next to the sources, whatever the working directory
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+TEXTURE_DIR = os.path.join(ASSET_DIR, "textures")  # Written by texture_generator.py
+ASSET_PACK = os.path.join(ASSET_DIR, "assets.pack")  # Written by AssetPack.py
+PVS_DIR = os.path.join(ASSET_DIR, "pvs")  # Written by PVS.level_pvs
+PACKED_FONT_SIZES = (24,)  # get_text_renderer sizes whose glyph atlases are baked
 
 # Colors
 BLACK = (0, 0, 0)
@@ -21,19 +54,37 @@ MENU_BG_COLOR = (0, 0, 0)  # Black background
 MENU_TEXT_COLOR = (0, 255, 0)  # Matrix-style green
 MENU_HIGHLIGHT_COLOR = (0, 200, 0)  # Slightly darker green for effects
 
-# Game map
+# Minimap overlay, in window pixels
+MINIMAP_SIZE = 160  # Longest side, the map is scaled to fit
+MINIMAP_MARGIN = 20  # From the top-right corner of the window
+
+# Game map, one character per tile:
+# W wall, . floor, D doorway, P player spawn, N NPC spawn (role from NPC_SPAWN_ROLES)
+MAP_TILE_SIZE = 0.5  # World units per tile, the 20x20 inner tiles make the 10x10 office
+WALL_HEIGHT = 2.0
+# Role of the NPC at each N tile, by (col, row) of GAME_MAP
+NPC_SPAWN_ROLES = {(4, 6): "HR", (17, 13): "CEO"}
 GAME_MAP = [
-    "WWWWWWWWWWWWWWWWWWWW",
-    "W..................W",
-    "W..................W",
-    "W........N.........W",
-    "W..................W",
-    "W..................W",
-    "W..................W",
-    "W....P.............W",
-    "W..................W",
-    "W..................W",
-    "W..................W",
-    "W..................W",
-    "WWWWWWWWWWWWWWWWWWWW",
-]
\ No newline at end of file
+    "WWWWWWWWWWWWWWWWWWWWWW",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W...N................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W..........P.........W",
+    "W....................W",
+    "W................N...W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "W....................W",
+    "WWWWWWWWWWWWWWWWWWWWWW",
+]
@@ -0,0 +1,335 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+from Constants import (
+    FAR_PLANE, FIELD_OF_VIEW, LIGHT_AMBIENT, LIGHT_DIFFUSE, LIGHT_MODEL_AMBIENT, LIGHT_POSITION,
+    NEAR_PLANE
+)
+from GLState import get_gl_state
+from transforms import ortho_matrix, perspective_matrix
+
+# Attribute locations shared by every program and mesh
+POSITION, NORMAL, COLOR, TEXCOORD = range(4)
+
+# Per-frame data, bound to uniform buffer binding point 0 for every program
+FRAME_BLOCK = """
+layout(std140) uniform Frame {
+    mat4 projection;
+    mat4 view;
+    mat4 ui_projection;
+    vec4 light_position;  // Eye space
+    vec4 light_ambient;
+    vec4 light_diffuse;
+    vec4 global_ambient;
+};
+"""
+
+# Per-vertex lighting, the same model as the fixed-function GL_LIGHT0 with
+# GL_COLOR_MATERIAL driving ambient and diffuse. Scene geometry is already
+# in world space (chunks and NPC instances are built on the CPU), so there
+# is no model matrix
+SCENE_VERTEX_SHADER = """
+#version 330 core
+""" + FRAME_BLOCK + """
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec3 normal;
+layout(location = 2) in vec3 color;
+layout(location = 3) in vec2 texcoord;
+out vec4 lit_color;
+out vec2 uv;
+
+void main() {
+    vec4 eye_position = view * vec4(position, 1.0);
+    vec3 n = mat3(view) * normal;
+    vec3 l = normalize(light_position.xyz - eye_position.xyz);
+    float diffuse = max(dot(n, l), 0.0);
+    vec3 light = global_ambient.rgb + light_ambient.rgb + light_diffuse.rgb * diffuse;
+    lit_color = vec4(min(color * light, 1.0), 1.0);
+    uv = texcoord;
+    gl_Position = projection * eye_position;
+}
+"""
+
+# Static geometry with its lighting baked into vertex colors
+UNLIT_SCENE_VERTEX_SHADER = """
+#version 330 core
+""" + FRAME_BLOCK + """
+layout(location = 0) in vec3 position;
+layout(location = 2) in vec3 color;
+layout(location = 3) in vec2 texcoord;
+out vec4 lit_color;
+out vec2 uv;
+
+void main() {
+    lit_color = vec4(color, 1.0);
+    uv = texcoord;
+    gl_Position = projection * view * vec4(position, 1.0);
+}
+"""
+
+# Untextured and textured variants are separate programs, a uniform
+# branch would still pay for the texture fetch on software rasterizers
+SCENE_FRAGMENT_SHADER = """
+#version 330 core
+in vec4 lit_color;
+out vec4 frag_color;
+
+void main() {
+    frag_color = lit_color;
+}
+"""
+
+# Texcoords count whole copies of the texture, repeated inside its
+# (u0, v0, u1, v1) `uv_rect` of an atlas. The mip level comes from the
+# unwrapped coordinates, fract() would jump at every repeat otherwise
+TEXTURED_SCENE_FRAGMENT_SHADER = """
+#version 330 core
+uniform sampler2D image;
+uniform vec4 uv_rect;
+in vec4 lit_color;
+in vec2 uv;
+out vec4 frag_color;
+
+void main() {
+    vec2 size = uv_rect.zw - uv_rect.xy;
+    vec2 wrapped = uv_rect.xy + fract(uv) * size;
+    frag_color = lit_color * textureGrad(image, wrapped, dFdx(uv) * size, dFdy(uv) * size);
+}
+"""
+
+UI_VERTEX_SHADER = """
+#version 330 core
+""" + FRAME_BLOCK + """
+uniform vec2 offset;
+layout(location = 0) in vec2 position;
+layout(location = 3) in vec2 texcoord;
+out vec2 uv;
+
+void main() {
+    uv = texcoord;
+    gl_Position = ui_projection * vec4(position + offset, 0.0, 1.0);
+}
+"""
+
+UI_FRAGMENT_SHADER = """
+#version 330 core
+uniform sampler2D image;
+uniform vec4 color;
+in vec2 uv;
+out vec4 frag_color;
+
+void main() {
+    frag_color = texture(image, uv) * color;
+}
+"""
+
+# Corners of each quad, as two triangles
+QUAD_TRIANGLES = np.array((0, 1, 2, 0, 2, 3))
+
+
+def compile_program(vertex_source, fragment_source):
+    """Compile and link a shader program, raises RuntimeError with the log on failure"""
+    program = glCreateProgram()
+    shaders = []
+    for kind, source in ((GL_VERTEX_SHADER, vertex_source), (GL_FRAGMENT_SHADER, fragment_source)):
+        shader = glCreateShader(kind)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+            raise RuntimeError(f"Shader compile failed: {glGetShaderInfoLog(shader).decode()}")
+        glAttachShader(program, shader)
+        shaders.append(shader)
+    glLinkProgram(program)
+    for shader in shaders:
+        glDetachShader(program, shader)
+        glDeleteShader(shader)
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        raise RuntimeError(f"Program link failed: {glGetProgramInfoLog(program).decode()}")
+    glUniformBlockBinding(program, glGetUniformBlockIndex(program, "Frame"), 0)
+    return program
+
+
+def quad_triangles(quads):
+    """(n * 4, k) quad corners to (n * 6, k) triangle corners"""
+    corners = QUAD_TRIANGLES + 4 * np.arange(len(quads) // 4)[:, None]
+    return quads[corners.ravel()]
+
+
+class CoreMesh:
+    """Vertex arrays in GL buffers, drawn through one VAO.
+
+    Every attribute is its own tightly packed buffer. Without per-vertex
+    colors, `color` is set as the constant value of the color attribute.
+    update() replaces the contents, for meshes rebuilt on the CPU.
+    """
+
+    def __init__(self, positions, normals=None, texcoords=None, colors=None,
+                 color=(1.0, 1.0, 1.0), usage=GL_STATIC_DRAW):
+        self.vao = glGenVertexArrays(1)
+        self.buffers = {}  # attribute location -> buffer
+        self.color = color
+        self.usage = usage
+        self.vertex_count = 0
+        self.lit = False
+        self.textured = False
+        self.update(positions, normals, texcoords, colors)
+
+    def update(self, positions, normals=None, texcoords=None, colors=None):
+        glBindVertexArray(self.vao)
+        attributes = ((POSITION, positions), (NORMAL, normals), (COLOR, colors), (TEXCOORD, texcoords))
+        for location, data in attributes:
+            if data is None:
+                glDisableVertexAttribArray(location)
+                continue
+            data = np.ascontiguousarray(data, dtype=np.float32)
+            if location not in self.buffers:
+                self.buffers[location] = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.buffers[location])
+            glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, self.usage)
+            glVertexAttribPointer(location, data.shape[1], GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(0))
+            glEnableVertexAttribArray(location)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.vertex_count = len(positions)
+        self.has_colors = colors is not None
+        self.lit = normals is not None  # Baked meshes have colors and no normals
+        self.textured = texcoords is not None
+
+    def release(self):
+        glDeleteBuffers(len(self.buffers), list(self.buffers.values()))
+        glDeleteVertexArrays(1, [self.vao])
+        self.buffers = {}
+
+
+class CoreRenderer:
+    """OpenGL 3.3 core profile backend for the World, NPCs and UI.
+
+    Replaces fixed-function lighting, matrix stacks and immediate mode with
+    small shader programs (lit or pre-lit scene geometry, textured 2D UI),
+    vertex array objects, and one uniform buffer holding the camera and
+    light, uploaded once per frame by begin_frame(). All matrices are
+    computed with NumPy (see transforms.py).
+    """
+
+    def __init__(self, display_size):
+        self.scene_programs = {  # By whether the mesh is (lit, textured)
+            (lit, textured): compile_program(
+                SCENE_VERTEX_SHADER if lit else UNLIT_SCENE_VERTEX_SHADER,
+                TEXTURED_SCENE_FRAGMENT_SHADER if textured else SCENE_FRAGMENT_SHADER,
+            )
+            for lit in (False, True) for textured in (False, True)
+        }
+        self.uv_rect_locations = {
+            lit: glGetUniformLocation(self.scene_programs[lit, True], "uv_rect") for lit in (False, True)
+        }
+        self.ui_program = compile_program(UI_VERTEX_SHADER, UI_FRAGMENT_SHADER)
+        self.ui_color_location = glGetUniformLocation(self.ui_program, "color")
+        self.ui_offset_location = glGetUniformLocation(self.ui_program, "offset")
+        self.frame_buffer = glGenBuffers(1)
+        self.frame_data = np.zeros(3 * 16 + 4 * 4, dtype=np.float32)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.frame_buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.frame_data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, 0, self.frame_buffer)
+        self.ui_quads = CoreMesh(np.zeros((0, 2)), usage=GL_STREAM_DRAW)  # Reused by every draw_quads()
+        self.rect_meshes = {}  # (width, height) -> quad_mesh() of draw_rect(), at the origin
+        self.state = get_gl_state()
+        self.resize(display_size)
+        # The menu draws UI before any 3D frame
+        self.begin_frame(np.identity(4))
+
+        self.state.enable(GL_DEPTH_TEST)
+        self.state.enable(GL_BLEND)
+        self.state.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+    def resize(self, display_size):
+        width, height = display_size
+        self.projection = perspective_matrix(FIELD_OF_VIEW, width / height, NEAR_PLANE, FAR_PLANE)
+        self.ui_projection = ortho_matrix(0, width, height, 0, -1, 1)  # Top-left origin, in pixels
+
+    def begin_frame(self, view):
+        """Upload this frame's camera and light, before any draw_mesh()"""
+        # std140 mat4s are column-major, our matrices are row-major
+        matrices = [self.projection, view, self.ui_projection]
+        self.frame_data[:48] = np.concatenate([m.T.ravel() for m in matrices])
+        # The light is fixed in the world, like glLightfv after the camera transform
+        light_position = view @ np.array(LIGHT_POSITION)
+        lights = (light_position, LIGHT_AMBIENT, LIGHT_DIFFUSE, LIGHT_MODEL_AMBIENT)
+        self.frame_data[48:] = np.concatenate(lights)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.frame_buffer)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.frame_data.nbytes, self.frame_data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def upload_batches(self, batches):
+        """{material: CoreMesh} for {material: MeshBatch}, like compile_batches"""
+        return {
+            name: CoreMesh(batch.positions, batch.normals, batch.texcoords, batch.colors, batch.color)
+            for name, batch in batches.items()
+        }
+
+    def release_meshes(self, meshes):
+        for mesh in meshes.values():
+            mesh.release()
+
+    def draw_mesh(self, mesh, firsts=None, counts=None, uv_rect=(0.0, 0.0, 1.0, 1.0)):
+        """Draw a whole mesh, or the ranges given by `firsts` and `counts`.
+
+        Textured meshes sample the bound texture, repeated inside `uv_rect`,
+        meshes without normals are drawn with their baked colors.
+        """
+        self.state.use_program(self.scene_programs[mesh.lit, mesh.textured])
+        if mesh.textured:
+            glUniform4f(self.uv_rect_locations[mesh.lit], *uv_rect)
+        glBindVertexArray(mesh.vao)
+        if not mesh.has_colors:
+            glVertexAttrib3f(COLOR, *mesh.color)
+        if firsts is None:
+            glDrawArrays(GL_TRIANGLES, 0, mesh.vertex_count)
+        else:
+            glMultiDrawArrays(GL_TRIANGLES, firsts, counts, len(firsts))
+        glBindVertexArray(0)
+
+    def begin_ui(self):
+        """2D drawing in window pixels over the scene, until end_ui()"""
+        self.state.disable(GL_DEPTH_TEST)
+        self.state.use_program(self.ui_program)
+
+    def end_ui(self):
+        self.state.enable(GL_DEPTH_TEST)
+
+    def quad_mesh(self, positions, texcoords):
+        """CoreMesh of textured quads given as (n * 4, 2) pixel corners, for
+        2D geometry drawn unchanged over many frames with draw_ui_mesh()"""
+        return CoreMesh(
+            quad_triangles(np.asarray(positions, dtype=np.float32)),
+            texcoords=quad_triangles(np.asarray(texcoords, dtype=np.float32)),
+        )
+
+    def draw_ui_mesh(self, mesh, texture, color=(1, 1, 1, 1), offset=(0, 0)):
+        """Draw a quad_mesh() moved by `offset` pixels, expects begin_ui()"""
+        self.state.bind_texture(texture)
+        glUniform4f(self.ui_color_location, *color)
+        glUniform2f(self.ui_offset_location, *offset)
+        glBindVertexArray(mesh.vao)
+        glDrawArrays(GL_TRIANGLES, 0, mesh.vertex_count)
+        glBindVertexArray(0)
+
+    def draw_quads(self, positions, texcoords, texture, color=(1, 1, 1, 1), offset=(0, 0)):
+        """Draw textured quads given as (n * 4, 2) pixel corners, expects begin_ui()"""
+        if not len(positions):
+            return
+        positions = quad_triangles(np.asarray(positions, dtype=np.float32))
+        texcoords = quad_triangles(np.asarray(texcoords, dtype=np.float32))
+        self.ui_quads.update(positions, texcoords=texcoords)
+        self.draw_ui_mesh(self.ui_quads, texture, color, offset)
+
+    def draw_rect(self, texture, x, y, width, height, color=(1, 1, 1, 1)):
+        """Draw a whole texture over a window rectangle, expects begin_ui()"""
+        mesh = self.rect_meshes.get((width, height))
+        if mesh is None:
+            positions = ((0, 0), (width, 0), (width, height), (0, height))
+            mesh = self.quad_mesh(positions, ((0, 0), (1, 0), (1, 1), (0, 1)))
+            self.rect_meshes[width, height] = mesh
+        self.draw_ui_mesh(mesh, texture, color, (x, y))
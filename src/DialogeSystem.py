@@ -9,6 +9,10 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 
 from Constants import *
+from FrameScheduler import request_redraw
+from GLState import get_gl_state
+from TextRenderer import get_font, get_text_renderer
+from UICompositor import UICompositor
 
 
 # Load environment variables
@@ -29,15 +33,16 @@ client = OpenAI(api_key=api_key)
 
 # Dialogue System
 class DialogueSystem:
-    def __init__(self, tts_system, voice_system=None, realtime_voice=None):
+    def __init__(self, tts_system, voice_system=None, realtime_voice=None, renderer=None):
         self.active = False
+        self.renderer = renderer  # CoreRenderer, or None for fixed-function drawing
         self.user_input = ""
         self.tts_system = tts_system  # Store the TTS system instance
         self.voice_system = voice_system  # Store the voice system instance
         self.realtime_voice = realtime_voice  # Store the realtime voice system
         try:
-            pygame.font.init()
-            self.font = pygame.font.Font(None, 24)
+            self.font = get_font(24)
+            self.text = get_text_renderer(24)
             print("[DialogueSystem] Font loaded successfully")
         except Exception as e:
             print("[DialogueSystem] Font loading failed:", e)
@@ -47,53 +52,22 @@ class DialogueSystem:
         self.current_npc = None
         self.initial_player_pos = None
 
-        # Create a surface for the UI
-        self.ui_surface = pygame.Surface(
-            (WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SRCALPHA
-        ).convert_alpha()
-        self.ui_texture = glGenTextures(1)
-
-    def render_text(self, surface, text, x, y):
-        max_width = WINDOW_WIDTH - 40
-        line_height = 25
-
-        words = text.split()
-        lines = []
-        current_line = []
-        current_width = 0
-
-        # Always use pure white with full opacity
-        text_color = (255, 255, 255)
-
-        for word in words:
-            word_surface = self.font.render(word + " ", True, text_color)
-            word_width = word_surface.get_width()
-
-            if current_width + word_width <= max_width:
-                current_line.append(word)
-                current_width += word_width
-            else:
-                lines.append(" ".join(current_line))
-                current_line = [word]
-                current_width = word_width
-
-        if current_line:
-            lines.append(" ".join(current_line))
-
-        # Render each line in pure white
-        for i, line in enumerate(lines):
-            text_surface = self.font.render(
-                line, True, (255, 255, 255)
-            )  # Force white color
-            surface.blit(text_surface, (x, y + i * line_height))
-
-        return len(lines) * line_height
+        # The UI texture only covers the dialogue box, text is drawn on top
+        # of it from the shared glyph atlas
+        self.box_height = 200
+        self.box_width = WINDOW_WIDTH - 40
+        self.box_y = WINDOW_HEIGHT - self.box_height - 20
+        self.ui = UICompositor(20, self.box_y, self.box_width, self.box_height)
+        self.ui.set_background(self.draw_box)
 
     def start_conversation(self, npc_role="HR", player_pos=None):
         self.active = True
         self.input_active = True
         self.current_npc = npc_role
-        self.initial_player_pos = player_pos if player_pos else [0, 0.5, 0]
+        # Copy, player_pos is a live view into the entity store
+        self.initial_player_pos = (
+            [float(p) for p in player_pos] if player_pos is not None else [0, 0.5, 0]
+        )
         print(f"[DialogueSystem] Dialogue started with {npc_role}")
 
         # Base personality framework for consistent behavior
@@ -229,111 +203,74 @@ class DialogueSystem:
             self.npc_message = "I apologize, but I'm having trouble connecting to our systems right now."
             print(f"[DialogueSystem] Error: {e}")
 
-    def render(self):
-        if not self.active:
-            return
+    def draw_box(self, surface):
+        # Make the background MUCH darker - almost black with some transparency
+        box_color = (0, 0, 0, 230)  # Changed to very dark, mostly opaque background
+        pygame.draw.rect(surface, box_color, (0, 0, self.box_width, self.box_height))
 
-        self.ui_surface.fill((0, 0, 0, 0))
+        # White border
+        pygame.draw.rect(
+            surface, (255, 255, 255, 255), (0, 0, self.box_width, self.box_height), 2
+        )
 
-        if self.active:
-            box_height = 200
-            box_y = WINDOW_HEIGHT - box_height - 20
+    def draw_text(self):
+        x = 40
+        max_width = self.box_width - 40  # Wrap inside the box border
 
-            # Make the background MUCH darker - almost black with some transparency
-            box_color = (0, 0, 0, 230)  # Changed to very dark, mostly opaque background
-            pygame.draw.rect(
-                self.ui_surface, box_color, (20, box_y, WINDOW_WIDTH - 40, box_height)
-            )
+        # Render ALL text in pure white (255, 255, 255)
+        self.text.draw("Press Shift+Q to exit", x, self.box_y + 10, renderer=self.renderer)
+        # Voice command instructions (for both roles)
+        self.text.draw("Press Shift+T to start voice chat", x, self.box_y + 35, renderer=self.renderer)
+        self.text.draw("Press Shift+Y to stop voice chat", x, self.box_y + 60, renderer=self.renderer)
 
-            # White border
-            pygame.draw.rect(
-                self.ui_surface,
-                (255, 255, 255, 255),
-                (20, box_y, WINDOW_WIDTH - 40, box_height),
-                2,
-            )
+        # NPC message, wrapped layout is cached until the message changes
+        if self.npc_message:
+            self.text.draw(self.npc_message, x, self.box_y + 90, max_width, renderer=self.renderer)
 
-            # Render ALL text in pure white (255, 255, 255)
-            # Quit instruction
-            quit_text_surface = self.font.render(
-                "Press Shift+Q to exit", True, (255, 255, 255)
+        if self.input_active:
+            self.text.draw(
+                "> " + self.user_input + "_", x, self.box_y + self.box_height - 40,
+                renderer=self.renderer,
             )
-            self.ui_surface.blit(quit_text_surface, (40, box_y + 10))
 
-            # Voice command instructions (for both roles)
-            voice_start_text = self.font.render(
-                "Press Shift+T to start voice chat", True, (255, 255, 255)
-            )
-            self.ui_surface.blit(voice_start_text, (40, box_y + 35))
+    def render(self):
+        if not self.active:
+            return
 
-            voice_stop_text = self.font.render(
-                "Press Shift+Y to stop voice chat", True, (255, 255, 255)
-            )
-            self.ui_surface.blit(voice_stop_text, (40, box_y + 60))
-
-            # NPC message in white
-            if self.npc_message:
-                self.render_text(self.ui_surface, self.npc_message, 40, box_y + 90)
-
-            # Input prompt in white
-            if self.input_active:
-                input_prompt = "> " + self.user_input + "_"
-                input_surface = self.font.render(input_prompt, True, (255, 255, 255))
-                self.ui_surface.blit(input_surface, (40, box_y + box_height - 40))
-
-        # Convert surface to OpenGL texture
-        texture_data = pygame.image.tostring(self.ui_surface, "RGBA", True)
-
-        # Save current OpenGL state
-        glPushAttrib(GL_ALL_ATTRIB_BITS)
-        glMatrixMode(GL_PROJECTION)
-        glPushMatrix()
-        glLoadIdentity()
-        glOrtho(0, WINDOW_WIDTH, 0, WINDOW_HEIGHT, -1, 1)
-        glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-        glLoadIdentity()
-
-        # Setup for 2D rendering
-        glDisable(GL_DEPTH_TEST)
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glEnable(GL_TEXTURE_2D)
-
-        # Bind and update texture
-        glBindTexture(GL_TEXTURE_2D, self.ui_texture)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexImage2D(
-            GL_TEXTURE_2D,
-            0,
-            GL_RGBA,
-            WINDOW_WIDTH,
-            WINDOW_HEIGHT,
-            0,
-            GL_RGBA,
-            GL_UNSIGNED_BYTE,
-            texture_data,
-        )
+        if self.renderer is not None:
+            self.renderer.begin_ui()
+            self.ui.draw(self.renderer)
+            self.draw_text()
+            self.renderer.end_ui()
+            return
 
-        # Draw the UI texture
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0)
-        glVertex2f(0, 0)
-        glTexCoord2f(1, 0)
-        glVertex2f(WINDOW_WIDTH, 0)
-        glTexCoord2f(1, 1)
-        glVertex2f(WINDOW_WIDTH, WINDOW_HEIGHT)
-        glTexCoord2f(0, 1)
-        glVertex2f(0, WINDOW_HEIGHT)
-        glEnd()
-
-        # Restore OpenGL state
-        glMatrixMode(GL_PROJECTION)
-        glPopMatrix()
-        glMatrixMode(GL_MODELVIEW)
-        glPopMatrix()
-        glPopAttrib()
+        # Only the state changed below is put back afterwards
+        with get_gl_state().saved() as state:
+            state.matrix_mode(GL_PROJECTION)
+            glPushMatrix()
+            glLoadIdentity()
+            glOrtho(0, WINDOW_WIDTH, WINDOW_HEIGHT, 0, -1, 1)
+            state.matrix_mode(GL_MODELVIEW)
+            glPushMatrix()
+            glLoadIdentity()
+
+            # Setup for 2D rendering
+            state.disable(GL_DEPTH_TEST)
+            state.disable(GL_LIGHTING)
+            state.enable(GL_BLEND)
+            state.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+            state.enable(GL_TEXTURE_2D)
+            state.color(1, 1, 1, 1)
+
+            # Box texture is uploaded once, text comes from the glyph atlas
+            self.ui.draw()
+            self.draw_text()
+
+            # Restore the matrices
+            state.matrix_mode(GL_PROJECTION)
+            glPopMatrix()
+            state.matrix_mode(GL_MODELVIEW)
+            glPopMatrix()
 
     def handle_input(self, event):
         if not self.active or not self.input_active:
@@ -402,3 +339,5 @@ class DialogueSystem:
         """Update NPC message with text from voice API"""
         if text:
             self.npc_message = text
+            # Called from the voice thread, wake the game loop if it is idle
+            request_redraw()
@@ -0,0 +1,105 @@
+import math
+
+from OpenGL.GL import *
+
+from Constants import (
+    DYNAMIC_RESOLUTION_MAX_SCALE, DYNAMIC_RESOLUTION_MIN_SCALE, DYNAMIC_RESOLUTION_STEP, FPS
+)
+
+
+class DynamicResolution:
+    """Renders the 3D pass offscreen at a scale that tracks a frame-time target.
+
+    The framebuffer object is allocated once at full window size; a lower
+    scale only renders into the bottom-left part of it, so changing scale
+    never reallocates. end() upscales that part onto the window with a
+    linear blit, anything drawn afterwards (dialogue, menus) is at native
+    resolution. Call update() once per frame with how long the frame's work
+    took: the scale follows a smoothed frame time, only moving when it is
+    over the target or has enough headroom, and settles for a while after
+    every change.
+    """
+
+    def __init__(self, display_size, target_frame_time=1.0 / FPS,
+                 min_scale=DYNAMIC_RESOLUTION_MIN_SCALE, max_scale=DYNAMIC_RESOLUTION_MAX_SCALE,
+                 smoothing=0.1, headroom=0.8, settle_frames=30):
+        self.width, self.height = display_size
+        self.target_frame_time = target_frame_time
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.smoothing = smoothing  # Weight of the newest frame in the average
+        self.headroom = headroom  # Scale up only below this fraction of the target
+        self.settle_frames = settle_frames
+        self.scale = max_scale
+        self.average_frame_time = None
+        self.frames_since_change = 0
+        self.target = 0  # Framebuffer bound before begin(), usually the window
+
+        self.framebuffer = glGenFramebuffers(1)
+        self.color, self.depth = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.color)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, self.width, self.height)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, self.width, self.height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            self.release()
+            raise RuntimeError(f"Offscreen framebuffer incomplete (status 0x{status:x})")
+
+    @property
+    def render_size(self):
+        """Pixel size the 3D pass is currently rendered at"""
+        return max(1, round(self.width * self.scale)), max(1, round(self.height * self.scale))
+
+    def begin(self):
+        """Redirect drawing to the scaled offscreen buffer and clear it"""
+        self.target = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glViewport(0, 0, *self.render_size)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+    def end(self):
+        """Upscale the 3D pass onto the window and draw there again"""
+        width, height = self.render_size
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffer)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.target)
+        glBlitFramebuffer(
+            0, 0, width, height, 0, 0, self.width, self.height, GL_COLOR_BUFFER_BIT, GL_LINEAR
+        )
+        glBindFramebuffer(GL_FRAMEBUFFER, self.target)
+        glViewport(0, 0, self.width, self.height)
+
+    def update(self, frame_time):
+        """Feed the last frame's time in seconds, adjusts the scale for the next one"""
+        if self.average_frame_time is None:
+            self.average_frame_time = frame_time
+        else:
+            self.average_frame_time += self.smoothing * (frame_time - self.average_frame_time)
+        self.frames_since_change += 1
+        if self.frames_since_change < self.settle_frames:
+            return
+
+        ratio = self.target_frame_time / self.average_frame_time
+        if 1.0 <= ratio <= 1.0 / self.headroom:
+            return  # Within the target, with too little headroom to grow
+        # Fill cost goes with the pixel count, the square of the scale
+        scale = self.scale * math.sqrt(ratio)
+        scale = round(scale / DYNAMIC_RESOLUTION_STEP) * DYNAMIC_RESOLUTION_STEP
+        scale = min(max(scale, self.min_scale), self.max_scale)
+        if scale != self.scale:
+            print(
+                f"[DynamicResolution] Scale {self.scale:.2f} -> {scale:.2f} "
+                f"({self.width * scale:.0f}x{self.height * scale:.0f}), frame time "
+                f"{self.average_frame_time * 1000:.1f} ms, target {self.target_frame_time * 1000:.1f} ms"
+            )
+            self.scale = scale
+            self.frames_since_change = 0
+
+    def release(self):
+        glDeleteFramebuffers(1, [self.framebuffer])
+        glDeleteRenderbuffers(2, [self.color, self.depth])
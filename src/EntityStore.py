@@ -0,0 +1,112 @@
+import numpy as np
+
+# Color slots per entity, NPC.palette() returns them in this order
+COLOR_SLOTS = ("skin", "hair", "primary", "secondary")
+
+
+class EntityStore:
+    """Struct-of-arrays storage for every player and NPC.
+
+    Each component is one contiguous NumPy array indexed by entity id, so
+    systems (stepping, interpolation, proximity, render transforms) handle all
+    entities in a single vectorized pass. Player and NPC objects are thin
+    views that only hold their id. Rows of removed entities are reused.
+    Arrays are reallocated as the store grows, so take component slices
+    fresh from the store rather than keeping them around.
+    """
+
+    def __init__(self, capacity=64):
+        self.count = 0  # Rows [0, count) have been handed out
+        self.free = []  # Removed ids, reused first
+        self.role_names = []  # Role code -> name
+        self.capacity = 0
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        def resize(name, shape, dtype, fill=0):
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            if self.capacity:
+                array[:self.capacity] = getattr(self, name)
+            setattr(self, name, array)
+
+        resize("positions", (3,), np.float64)
+        resize("prev_positions", (3,), np.float64)  # At the start of the last simulation step
+        resize("rotations", (3,), np.float64)  # Degrees about X, Y and Z
+        resize("scales", (), np.float32, 1.0)
+        resize("colors", (len(COLOR_SLOTS), 3), np.float32)
+        resize("roles", (), np.int16, -1)
+        resize("alive", (), bool, False)
+        self.capacity = capacity
+
+    def create(self, position, role=None, scale=1.0):
+        """Add an entity and return its id"""
+        if self.free:
+            entity = self.free.pop()
+        else:
+            if self.count == self.capacity:
+                self.grow(self.capacity * 2)
+            entity = self.count
+            self.count += 1
+        self.positions[entity] = position
+        self.prev_positions[entity] = position
+        self.rotations[entity] = 0
+        self.scales[entity] = scale
+        self.colors[entity] = 0
+        self.roles[entity] = -1 if role is None else self.role_code(role)
+        self.alive[entity] = True
+        return entity
+
+    def remove(self, entity):
+        self.alive[entity] = False
+        self.free.append(entity)
+
+    def role_code(self, name):
+        if name not in self.role_names:
+            self.role_names.append(name)
+        return self.role_names.index(name)
+
+    # Systems, each one pass over the arrays
+
+    def begin_step(self):
+        """Remember every position at the start of a simulation step"""
+        self.prev_positions[:self.count] = self.positions[:self.count]
+
+    def interpolated(self, alpha, ids=None):
+        """Positions between the last two simulation steps, for rendering"""
+        ids = slice(self.count) if ids is None else ids
+        prev = self.prev_positions[ids]
+        return prev + (self.positions[ids] - prev) * alpha
+
+    def distances(self, point, ids=None):
+        """Distance from `point` to each entity in `ids` (all rows if None)"""
+        ids = slice(self.count) if ids is None else ids
+        return np.linalg.norm(self.positions[ids] - np.asarray(point, dtype=np.float64), axis=1)
+
+    def transforms(self, ids):
+        """(positions, scales, palettes) of the given entities as float32, for instancing"""
+        return (
+            self.positions[ids].astype(np.float32),
+            self.scales[ids].copy(),
+            self.colors[ids].copy(),
+        )
+
+
+def component(name, index=None):
+    """Property reading and writing one entity's row of an EntityStore array"""
+    if index is None:
+        def get(self):
+            return getattr(self.store, name)[self.id]
+
+        def set(self, value):
+            getattr(self.store, name)[self.id] = value
+    else:
+        def get(self):
+            return getattr(self.store, name)[self.id, index]
+
+        def set(self, value):
+            getattr(self.store, name)[self.id, index] = value
+    return property(get, set)
+
+
+# Store shared by the game's player and NPCs
+ENTITIES = EntityStore()
@@ -0,0 +1,104 @@
+import time
+
+import pygame
+
+from Constants import FPS, IDLE_FPS
+
+# Posted to wake an idle loop when something other than input changes the screen
+WAKE_EVENT = pygame.event.custom_type()
+
+
+def request_redraw():
+    """Wake an idle FrameScheduler so the next frame is drawn, safe from any thread"""
+    if pygame.display.get_init():
+        pygame.event.post(pygame.event.Event(WAKE_EVENT))
+
+
+class FrameScheduler:
+    """Fixed-timestep simulation with decoupled, frame-limited rendering.
+
+    Each frame call begin_frame(), run the simulation once per dt yielded
+    by steps(), render with interpolation factor `alpha`, then end_frame().
+    Frames whose work takes longer than the frame budget are counted as late
+    and summarised every `report_interval` seconds.
+
+    A frame that would look exactly like the last one is ended with
+    end_frame(idle=True) instead of being drawn: rather than waiting out the
+    frame budget, the loop sleeps until an event arrives (input, window, or
+    a request_redraw() from another thread) or `idle_fps` says to check
+    again, whichever is first. The first drawn frame is back at full rate.
+    """
+
+    def __init__(self, sim_rate=FPS, max_fps=FPS, max_steps=5, report_interval=5.0, idle_fps=IDLE_FPS):
+        self.dt = 1.0 / sim_rate
+        self.max_fps = max_fps
+        self.frame_budget = 1.0 / max_fps
+        self.max_steps = max_steps  # Drop simulation time instead of spiralling on very slow hosts
+        self.report_interval = report_interval
+        self.idle_interval = 1.0 / idle_fps
+        self.clock = pygame.time.Clock()
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+        self.frame_start = self.last_time
+        self.work_time = 0.0  # Of the last finished frame, without the limiter's sleep
+
+        # Frame time statistics since the last report
+        self.last_report = self.last_time
+        self.frames = 0
+        self.late_frames = 0
+        self.worst_frame = 0.0
+
+    @property
+    def alpha(self):
+        """How far rendering is between the previous and the current simulation step"""
+        return self.accumulator / self.dt
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        frame_time = min(now - self.last_time, self.max_steps * self.dt)
+        self.last_time = now
+        self.frame_start = now
+        self.accumulator += frame_time
+
+    def steps(self):
+        while self.accumulator >= self.dt:
+            self.accumulator -= self.dt
+            yield self.dt
+
+    def end_frame(self, idle=False, timeout=None):
+        """Finish a frame. An `idle` one was not drawn, it sleeps until the
+        next event, `timeout` seconds or the idle check, whichever is first"""
+        if idle:
+            self.wait_for_event(self.idle_interval if timeout is None else min(timeout, self.idle_interval))
+            return
+
+        work_time = time.perf_counter() - self.frame_start
+        self.work_time = work_time
+        self.frames += 1
+        self.worst_frame = max(self.worst_frame, work_time)
+        if work_time > self.frame_budget:
+            self.late_frames += 1
+
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_interval:
+            if self.late_frames:
+                print(
+                    f"[FrameScheduler] {self.late_frames}/{self.frames} frames over the "
+                    f"{self.frame_budget * 1000:.1f} ms budget, worst {self.worst_frame * 1000:.1f} ms"
+                )
+            self.last_report = now
+            self.frames = 0
+            self.late_frames = 0
+            self.worst_frame = 0.0
+
+        # Sleep off whatever is left of the frame budget
+        self.clock.tick(self.max_fps)
+
+    def wait_for_event(self, timeout):
+        """Sleep until an event is queued or `timeout` seconds pass, leaving the queue as it was"""
+        event = pygame.event.wait(max(1, int(timeout * 1000)))
+        if event.type != pygame.NOEVENT:
+            # Put it back in front of anything queued since, for the frame loop to handle
+            pending = pygame.event.get()
+            for queued in [event] + pending:
+                pygame.event.post(queued)
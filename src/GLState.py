@@ -0,0 +1,223 @@
+import sys
+import time
+from contextlib import contextmanager
+
+from OpenGL.GL import *
+
+from Constants import ASSET_DIR
+
+
+class GLState:
+    """Shadow copy of the GL state the draw code keeps changing.
+
+    Tracks enable bits, the bound 2D texture, blend function, current
+    color, color material, matrix mode and shader program, and only issues
+    a call when the value actually changes. Every draw function sets what
+    it needs instead of putting things back afterwards, so consecutive
+    draws with the same needs cost nothing. Inside saved() the old value of
+    everything changed is recorded and put back on exit, only what was
+    touched, unlike glPushAttrib(GL_ALL_ATTRIB_BITS).
+
+    State changed behind its back (display lists, vertex color arrays
+    leaving the current color undefined, or raw GL calls) has to be
+    forgotten with invalidate(), the next set then always reaches GL.
+    """
+
+    def __init__(self):
+        self.values = {}  # key -> last value sent to GL, missing if unknown
+        self.saves = []  # One {key: previous value} per open saved()
+        self.counter = None  # GLCallCounter told about skipped calls, if counting
+
+    def set(self, key, value, apply, query):
+        """Send `value` through apply(value) unless GL already has it.
+
+        query() reads the value back from GL, only needed inside saved()
+        when nothing set it yet.
+        """
+        known = self.values.get(key, self)
+        if known == value:
+            if self.counter is not None:
+                self.counter.skipped()
+            return
+        if self.saves and key not in self.saves[-1]:
+            if known is self:
+                known = query()
+            self.saves[-1][key] = (known, apply, query)
+            if known == value:
+                self.values[key] = value
+                return
+        self.values[key] = value
+        apply(value)
+
+    def set_enabled(self, cap, enabled):
+        self.set(
+            ("enable", cap), bool(enabled),
+            lambda enabled: glEnable(cap) if enabled else glDisable(cap),
+            lambda: bool(glIsEnabled(cap)),
+        )
+
+    def enable(self, cap):
+        self.set_enabled(cap, True)
+
+    def disable(self, cap):
+        self.set_enabled(cap, False)
+
+    def bind_texture(self, texture):
+        """Bind a GL_TEXTURE_2D texture, every 2D bind should go through here"""
+        self.set(
+            "texture", int(texture), lambda texture: glBindTexture(GL_TEXTURE_2D, texture),
+            lambda: int(glGetIntegerv(GL_TEXTURE_BINDING_2D)),
+        )
+
+    def blend_func(self, source, destination):
+        self.set(
+            "blend_func", (source, destination), lambda func: glBlendFunc(*func),
+            lambda: (int(glGetIntegerv(GL_BLEND_SRC)), int(glGetIntegerv(GL_BLEND_DST))),
+        )
+
+    def color(self, r, g, b, a=1.0):
+        self.set(
+            "color", (r, g, b, a), lambda color: glColor4f(*color),
+            lambda: tuple(float(c) for c in glGetFloatv(GL_CURRENT_COLOR)),
+        )
+
+    def color_material(self, face, mode):
+        self.set(
+            "color_material", (face, mode), lambda value: glColorMaterial(*value),
+            lambda: (int(glGetIntegerv(GL_COLOR_MATERIAL_FACE)), int(glGetIntegerv(GL_COLOR_MATERIAL_PARAMETER))),
+        )
+
+    def matrix_mode(self, mode):
+        self.set("matrix_mode", mode, glMatrixMode, lambda: int(glGetIntegerv(GL_MATRIX_MODE)))
+
+    def use_program(self, program):
+        self.set("program", program, glUseProgram, lambda: int(glGetIntegerv(GL_CURRENT_PROGRAM)))
+
+    def invalidate(self, *keys):
+        """Forget the given keys (all of them if none), GL may no longer match"""
+        for key in keys or list(self.values):
+            self.values.pop(key, None)
+
+    def forget_texture(self, texture):
+        """Call when deleting a texture, GL rebinds 0 if it was bound"""
+        if self.values.get("texture") == texture:
+            self.values["texture"] = 0
+
+    @contextmanager
+    def saved(self):
+        """Put back everything set through this object inside the block"""
+        self.saves.append({})
+        try:
+            yield self
+        finally:
+            for key, (value, apply, query) in self.saves.pop().items():
+                self.set(key, value, apply, query)
+
+
+class GLCallCounter:
+    """Counts the GL calls made from the game's own modules, per frame.
+
+    Every gl* function imported into those modules is wrapped, so only turn
+    it on to investigate (app.py --count-gl-calls, benchmark.py
+    --count-gl-calls). Calls go to the subsystem named by the last begin(),
+    calls skipped by GLState are counted next to them. Calls a display
+    list makes are not counted, it is a single glCallList here.
+    """
+
+    def __init__(self, modules=None, report_interval=5.0):
+        self.modules = game_modules() if modules is None else modules
+        self.report_interval = report_interval
+        self.current = "other"
+        self.frame = {}  # subsystem -> [calls, skipped] in this frame
+        self.totals = {}  # subsystem -> [calls, skipped] since the last report
+        self.frames = 0
+        self.last_report = time.perf_counter()
+        self.originals = {}  # (module, name) -> function
+        for module in self.modules:
+            for name, value in list(vars(module).items()):
+                if name.startswith("gl") and name[2:3].isupper() and callable(value):
+                    self.originals[module, name] = value
+                    setattr(module, name, self.wrap(value))
+
+    def wrap(self, function):
+        def counted(*args, **kwargs):
+            self.counts()[0] += 1
+            return function(*args, **kwargs)
+        return counted
+
+    def counts(self):
+        if self.current not in self.frame:
+            self.frame[self.current] = [0, 0]
+        return self.frame[self.current]
+
+    def skipped(self):
+        self.counts()[1] += 1
+
+    def begin(self, subsystem):
+        """Attribute the following calls to `subsystem`"""
+        self.current = subsystem
+
+    def end_frame(self):
+        """Finish a frame, returns {subsystem: (calls, skipped)} of it"""
+        frame = {name: tuple(counts) for name, counts in self.frame.items()}
+        for name, (calls, skipped) in frame.items():
+            totals = self.totals.setdefault(name, [0, 0])
+            totals[0] += calls
+            totals[1] += skipped
+        self.frame = {}
+        self.frames += 1
+
+        now = time.perf_counter()
+        if self.report_interval is not None and now - self.last_report >= self.report_interval:
+            print(f"[GLCallCounter] {self.report()}")
+            self.totals = {}
+            self.frames = 0
+            self.last_report = now
+        return frame
+
+    def averages(self):
+        """{subsystem: (calls, skipped)} per frame since the last report"""
+        frames = max(self.frames, 1)
+        return {
+            name: (calls / frames, skipped / frames)
+            for name, (calls, skipped) in sorted(self.totals.items())
+        }
+
+    def report(self):
+        parts = [
+            f"{name} {calls:.0f} ({skipped:.0f} skipped)"
+            for name, (calls, skipped) in self.averages().items()
+        ]
+        return "GL calls per frame: " + ", ".join(parts)
+
+    def release(self):
+        """Put the unwrapped functions back"""
+        for (module, name), function in self.originals.items():
+            setattr(module, name, function)
+        self.originals = {}
+
+
+def game_modules():
+    """The loaded modules that live next to this one"""
+    return [
+        module for module in list(sys.modules.values())
+        if getattr(module, "__file__", None) and module.__file__.startswith(ASSET_DIR)
+    ]
+
+
+_state = None
+
+
+def get_gl_state():
+    """The GLState shared by all draw code, there is one GL context"""
+    global _state
+    if _state is None:
+        _state = GLState()
+    return _state
+
+
+def count_gl_calls(modules=None, report_interval=5.0):
+    """Start counting GL calls, returns the GLCallCounter"""
+    counter = GLCallCounter(modules, report_interval)
+    get_gl_state().counter = counter
+    return counter
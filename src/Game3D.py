@@ -1,37 +1,82 @@
 import math
 import time
 
+import numpy as np
 import pygame
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from Constants import *
+from Collision import CollisionGrid
 from DialogeSystem import DialogueSystem
+from FrameScheduler import FrameScheduler
+from InteractionSystem import InteractionSystem
+from Level import Level
 from MenuScreen import MenuScreen
-from NPC import NPC
+from Minimap import Minimap
+from LODSelector import LODSelector
+from NPC import LOD_DISTANCES, NPC
+from NPCRenderer import NPCRenderer
 from Player import Player
 from World import World
 from VoiceSystem import VoiceSystem
 from TextToSpeechSystem import TextToSpeechSystem
 from RealtimeVoiceSystem import RealtimeVoiceSystem
 from RealtimeSpeechToSpeech import RealtimeSpeechToSpeech
+from SceneIndex import Frustum, SceneIndex
+from TextureManager import TextureManager
+from transforms import perspective_matrix, view_matrix
 
 
 class Game3D:
-    def __init__(self):
-        self.menu = MenuScreen()
+    def __init__(self, renderer=None, resolution=None, gl_calls=None):
+        # CoreRenderer for the GL 3.3 core profile, None for fixed-function GL
+        self.renderer = renderer
+        # DynamicResolution to render the 3D view offscreen, None for the window directly
+        self.resolution = resolution
+        # GLCallCounter when counting GL calls per subsystem, else None
+        self.gl_calls = gl_calls
+        self.menu = MenuScreen(renderer)
+        self.level = Level(GAME_MAP)
         self.player = Player()
-        self.world = World()
+        spawn_x, spawn_z = self.level.player_spawn
+        self.player.pos = [spawn_x, self.player.pos[1], spawn_z]
+        self.player.snap()
+        self.textures = TextureManager()
+        self.world = World(self.level, self.textures, renderer)
+        self.minimap = Minimap(self.level, renderer)  # M toggles it
         self.voice_system = VoiceSystem()
         self.tts_system = TextToSpeechSystem(self.voice_system)
         self.realtime_voice = RealtimeSpeechToSpeech()
         self.dialogue = DialogueSystem(
-            self.tts_system, self.voice_system, self.realtime_voice
+            self.tts_system, self.voice_system, self.realtime_voice, renderer
         )
-        self.hr_npc = NPC(-3.3, 0, -2, "HR")  # Moved beside the desk
-        self.ceo_npc = NPC(3.3, 0, 1, "CEO")  # Moved beside the desk
+        # NPCs stand on their map spawn tiles, beside the desks
+        self.npcs = [NPC(x, 0, z, role) for role, x, z in self.level.npc_spawns]
+        self.npc_ids = np.array([npc.id for npc in self.npcs], dtype=np.intp)
+        self.entities = self.player.store  # Shared by the player and every NPC
+        self.npc_renderer = NPCRenderer(renderer)
+        self.npc_lod = LODSelector(LOD_DISTANCES)
+        self.npc_index = SceneIndex(cell_size=4.0)
+        for i, npc in enumerate(self.npcs):
+            self.npc_index.insert(i, *npc.bounds())
+        self.projection = perspective_matrix(
+            FIELD_OF_VIEW, WINDOW_WIDTH / WINDOW_HEIGHT, NEAR_PLANE, FAR_PLANE
+        )
+        # Walls come from the map, furniture and NPCs are registered as boxes
+        self.collision = CollisionGrid(self.level)
+        for i, (lo, hi) in enumerate(self.world.collision_boxes()):
+            self.collision.add_box(("object", i), lo, hi)
+        for i, npc in enumerate(self.npcs):
+            self.collision.add_box(("npc", i), *npc.bounds())
+        self.player.collision = self.collision
         self.interaction_distance = 2.0
-        self.last_interaction_time = 0
+        self.interactions = InteractionSystem(
+            self.npcs, self.npc_index, self.interaction_distance, self.can_see_npc
+        )
+        self.conversation_npc = None  # NPC the current dialogue is with
         self.recording_active = False
+        self.scheduler = FrameScheduler()
+        self.last_frame = None  # frame_state() of the last frame drawn
 
     def move_player_away_from_npc(self, npc_pos):
         # Calculate direction vector from NPC to player
@@ -44,16 +89,93 @@ class Game3D:
             dx /= distance
             dz /= distance
 
-        # Move player back by 3 units
-        self.player.pos[0] = npc_pos[0] + (dx * 3)
-        self.player.pos[2] = npc_pos[2] + (dz * 3)
+        # Move player back by 3 units, stopping at anything in the way
+        self.player.move_by(
+            npc_pos[0] + (dx * 3) - self.player.pos[0],
+            npc_pos[2] + (dz * 3) - self.player.pos[2],
+        )
+        self.player.snap()
+
+    def can_see_npc(self, x, z, i):
+        """Whether no wall stands between (x, z) and NPC i"""
+        npc = self.npcs[i]
+        return self.collision.line_of_sight(x, z, npc.pos[0], npc.pos[2], walls_only=True)
+
+    def looked_at_npc(self, max_distance):
+        """Index of the NPC straight ahead of the player, if nothing else is in the way"""
+        forward_x, forward_z = self.player.forward()
+        hit = self.collision.raycast(
+            self.player.pos[0], self.player.pos[2], forward_x, forward_z, max_distance
+        )
+        if hit is not None and hit[1][0] == "npc":
+            return hit[1][1]
+        return None
+
+    def update(self, dt):
+        """Advance the simulation by one fixed step"""
+        self.entities.begin_step()
+
+        # Handle keyboard input for movement (keep this blocked during dialogue)
+        if not self.dialogue.active:
+            keys = pygame.key.get_pressed()
+            if keys[pygame.K_w]:
+                self.player.move(0, -1, dt)
+            if keys[pygame.K_s]:
+                self.player.move(0, 1, dt)
+            if keys[pygame.K_a]:
+                self.player.move(-1, 0, dt)
+            if keys[pygame.K_d]:
+                self.player.move(1, 0, dt)
+
+        # Keep NPC bounds in the scene index and collision grid current
+        # (no-op when they stay put)
+        for i, npc in enumerate(self.npcs):
+            self.npc_index.update(i, *npc.bounds())
+            self.collision.update_box(("npc", i), *npc.bounds())
+
+        # Walking up to NPCs starts a conversation with the one the player is
+        # looking at, or else the nearest one in sight
+        x, z = self.player.pos[0], self.player.pos[2]
+        entered, exited = self.interactions.update(x, z)
+        if entered and not self.dialogue.active:
+            target = self.looked_at_npc(self.interaction_distance)
+            if target is None:
+                target = self.interactions.nearest(x, z)
+            self.conversation_npc = self.npcs[target]
+            self.dialogue.start_conversation(self.conversation_npc.role, self.player.pos)
+            if self.dialogue.npc_message:
+                self.tts_system.speak(self.dialogue.npc_message)
+
+    def frame_state(self, pos):
+        """Everything the game frame drawn from `pos` depends on, equal
+        states draw identical frames"""
+        return (
+            tuple(pos), tuple(self.player.rot),
+            self.entities.positions[self.npc_ids].tobytes(),
+            self.dialogue.active, self.dialogue.input_active,
+            self.dialogue.user_input, self.dialogue.npc_message,
+            None if self.resolution is None else self.resolution.scale,
+            self.minimap.visible,
+        )
+
+    def count_gl_calls(self, subsystem):
+        """Attribute the following GL calls to `subsystem`, if they are counted"""
+        if self.gl_calls is not None:
+            self.gl_calls.begin(subsystem)
 
     def run(self):
         running = True
         while running:
+            self.scheduler.begin_frame()
+            self.count_gl_calls("frame")
+            # Frames that would look like the last one are not drawn, the
+            # scheduler sleeps until something happens instead
+            events = pygame.event.get()
+            idle = False
+            timeout = None
             if self.menu.active:
                 # Menu loop
-                for event in pygame.event.get():
+                for event in events:
                     if event.type == pygame.QUIT:
                         running = False
                     elif event.type == pygame.KEYDOWN:
@@ -63,15 +185,25 @@ class Game3D:
                             > (len(TITLE) / 15 + 1)
                         ):
                             self.menu.active = False
+                            self.menu.release()
                             pygame.mouse.set_visible(False)
                             pygame.event.set_grab(True)
                         elif event.key == pygame.K_ESCAPE:
                             running = False
 
-                self.menu.render()
+                if events or self.menu.changed():
+                    self.count_gl_calls("menu")
+                    self.menu.render()
+                else:
+                    # Sleep through until the prompt next blinks
+                    idle = True
+                    timeout = self.menu.next_change()
+                # Drain the accumulator so the game starts without a catch-up burst
+                for _ in self.scheduler.steps():
+                    pass
             else:
                 # Main game loop
-                for event in pygame.event.get():
+                for event in events:
                     if event.type == pygame.QUIT:
                         running = False
                     elif event.type == pygame.KEYDOWN:
@@ -79,6 +211,8 @@ class Game3D:
                             pygame.mouse.set_visible(True)
                             pygame.event.set_grab(False)
                             running = False
+                        elif event.key == pygame.K_m and not self.dialogue.active:
+                            self.minimap.visible = not self.minimap.visible
 
                         # Handle dialogue key commands
                         keys = pygame.key.get_pressed()
@@ -96,12 +230,7 @@ class Game3D:
                                 self.dialogue.input_active = False
                                 print("[Game3D] Chat ended")
                                 # Move player away from NPC
-                                current_npc = (
-                                    self.hr_npc
-                                    if self.dialogue.current_npc == "HR"
-                                    else self.ceo_npc
-                                )
-                                self.move_player_away_from_npc(current_npc.pos)
+                                self.move_player_away_from_npc(self.conversation_npc.pos)
 
                         # Shift+T to start real-time voice
                         elif keys[pygame.K_LSHIFT] and event.key == pygame.K_t:
@@ -137,89 +266,82 @@ class Game3D:
                                 and result.get("command") == "move_player_back"
                             ):
                                 # Move player away from NPC
-                                current_npc = (
-                                    self.hr_npc
-                                    if self.dialogue.current_npc == "HR"
-                                    else self.ceo_npc
-                                )
-                                self.move_player_away_from_npc(current_npc.pos)
+                                self.move_player_away_from_npc(self.conversation_npc.pos)
 
                     elif event.type == pygame.MOUSEMOTION:
                         x, y = event.rel
                         self.player.update_rotation(x, y)
 
-                # Handle keyboard input for movement (keep this blocked during dialogue)
-                if not self.dialogue.active:
-                    keys = pygame.key.get_pressed()
-                    if keys[pygame.K_w]:
-                        self.player.move(0, -1)
-                    if keys[pygame.K_s]:
-                        self.player.move(0, 1)
-                    if keys[pygame.K_a]:
-                        self.player.move(-1, 0)
-                    if keys[pygame.K_d]:
-                        self.player.move(1, 0)
-
-                # Check NPC interactions
-                current_time = time.time()
-                if (
-                    current_time - self.last_interaction_time > 0.5
-                ):  # Cooldown on interactions
-                    # Check distance to HR NPC
-                    dx = self.player.pos[0] - self.hr_npc.pos[0]
-                    dz = self.player.pos[2] - self.hr_npc.pos[2]
-                    hr_distance = math.sqrt(dx * dx + dz * dz)
-
-                    # Check distance to CEO NPC
-                    dx = self.player.pos[0] - self.ceo_npc.pos[0]
-                    dz = self.player.pos[2] - self.ceo_npc.pos[2]
-                    ceo_distance = math.sqrt(dx * dx + dz * dz)
-
-                    if (
-                        hr_distance < self.interaction_distance
-                        and not self.dialogue.active
-                    ):
-                        self.dialogue.start_conversation("HR", self.player.pos)
-                        if self.dialogue.npc_message:
-                            self.tts_system.speak(self.dialogue.npc_message)
-                        self.last_interaction_time = current_time
-                    elif (
-                        ceo_distance < self.interaction_distance
-                        and not self.dialogue.active
-                    ):
-                        self.dialogue.start_conversation("CEO", self.player.pos)
-                        if self.dialogue.npc_message:
-                            self.tts_system.speak(self.dialogue.npc_message)
-                        self.last_interaction_time = current_time
-
-                # Clear the screen and depth buffer
-                glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-                # Save the current matrix
-                glPushMatrix()
-
-                # Apply player rotation and position
-                glRotatef(self.player.rot[0], 1, 0, 0)
-                glRotatef(self.player.rot[1], 0, 1, 0)
-                glTranslatef(
-                    -self.player.pos[0], -self.player.pos[1], -self.player.pos[2]
-                )
-
-                # Draw the world and NPCs
-                self.world.draw()
-                self.hr_npc.draw()
-                self.ceo_npc.draw()
-
-                # Restore the matrix
-                glPopMatrix()
-
-                # Render dialogue system (if active)
-                self.dialogue.render()
-
-                # Swap the buffers
-                pygame.display.flip()
-
-                # Maintain 60 FPS
-                pygame.time.Clock().tick(60)
+                # Fixed-timestep simulation, independent of the render rate
+                for dt in self.scheduler.steps():
+                    self.update(dt)
+
+                # Interpolate between simulation steps for smooth motion
+                pos = self.player.render_pos(self.scheduler.alpha)
+                frame = self.frame_state(pos)
+                if not events and frame == self.last_frame and self.world.settled:
+                    idle = True
+                else:
+                    self.last_frame = frame
+
+                    # Clear the screen and depth buffer
+                    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+                    if self.resolution is not None:
+                        self.resolution.begin()
+                    view = view_matrix(pos, self.player.rot)
+                    if self.renderer is not None:
+                        self.renderer.begin_frame(view)
+                    else:
+                        # Save the current matrix
+                        glPushMatrix()
+
+                        # Apply player rotation and position
+                        glRotatef(self.player.rot[0], 1, 0, 0)
+                        glRotatef(self.player.rot[1], 0, 1, 0)
+                        glTranslatef(-pos[0], -pos[1], -pos[2])
+                        # Re-place the light under the camera transform so it stays put in the world
+                        glLightfv(GL_LIGHT0, GL_POSITION, LIGHT_POSITION)
+
+                    # Stream world chunks in and out around the player, then draw
+                    # only the chunks and NPCs inside the view frustum, in rooms
+                    # visible from the player's
+                    self.count_gl_calls("world")
+                    self.world.update(pos)
+                    frustum = Frustum(self.projection @ view)
+                    self.world.draw(frustum, (pos[0], pos[2]))
+                    self.count_gl_calls("npcs")
+                    npc_distances = self.entities.distances(pos, self.npc_ids)
+                    visible_npcs = self.world.pvs.cull(
+                        pos[0], pos[2], self.npc_index.query(frustum), self.entities.positions[self.npc_ids]
+                    )
+                    self.npc_renderer.draw(self.npcs, visible_npcs, self.npc_lod.select(npc_distances))
+
+                    # Restore the matrix
+                    self.count_gl_calls("frame")
+                    if self.renderer is None:
+                        glPopMatrix()
+
+                    if self.resolution is not None:
+                        self.resolution.end()
+
+                    # Map overlay, then the dialogue (if active) on top
+                    self.count_gl_calls("minimap")
+                    self.minimap.render(pos, self.player.forward(), self.entities.positions[self.npc_ids])
+
+                    self.count_gl_calls("dialogue")
+                    self.dialogue.render()
+
+                    # Swap the buffers
+                    pygame.display.flip()
+
+            # Frame limiting and late-frame reporting
+            self.scheduler.end_frame(idle, timeout)
+            if idle:
+                continue
+            if self.resolution is not None:
+                self.resolution.update(self.scheduler.work_time)
+            if self.gl_calls is not None:
+                self.gl_calls.end_frame()
 
         pygame.quit()
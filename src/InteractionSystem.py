@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class InteractionSystem:
+    """Proximity triggers between the player and NPCs.
+
+    Candidates come from the NPC SceneIndex, so a query only looks at the
+    few grid cells around the player however many NPCs exist. An NPC is
+    "in range" when its position is within `radius` of the player on the XZ
+    plane and, if a `line_of_sight(x, z, i)` check is given, visible from
+    it. update() reports which NPCs entered or left that range since the
+    last call.
+    """
+
+    def __init__(self, npcs, index, radius, line_of_sight=None):
+        self.npcs = npcs
+        self.ids = np.array([npc.id for npc in npcs], dtype=np.intp)  # Entity ids, by index
+        self.index = index  # SceneIndex keyed by position in `npcs`
+        self.radius = radius
+        self.line_of_sight = line_of_sight
+        self.in_range = set()
+
+    def within(self, x, z, radius=None):
+        """(distance, index) of every NPC within `radius` of (x, z), nearest first"""
+        radius = self.radius if radius is None else radius
+        candidates = np.fromiter(self.index.query_radius(x, z, radius), dtype=np.intp)
+        if not len(candidates):
+            return []
+        positions = self.npcs[0].store.positions[self.ids[candidates]]
+        distances = np.hypot(positions[:, 0] - x, positions[:, 2] - z)
+        found = sorted(
+            (float(distance), int(i)) for distance, i in zip(distances, candidates) if distance <= radius
+        )
+        if self.line_of_sight is not None:
+            found = [(distance, i) for distance, i in found if self.line_of_sight(x, z, i)]
+        return found
+
+    def nearest(self, x, z, radius=None):
+        """Index of the closest NPC within `radius` of (x, z), or None"""
+        found = self.within(x, z, radius)
+        return found[0][1] if found else None
+
+    def update(self, x, z):
+        """Track who is in range of (x, z), returns (entered, exited) index lists"""
+        in_range = {i for _, i in self.within(x, z)}
+        entered = sorted(in_range - self.in_range)
+        exited = sorted(self.in_range - in_range)
+        self.in_range = in_range
+        return entered, exited
@@ -0,0 +1,27 @@
+import numpy as np
+
+
+class LODSelector:
+    """Picks a detail level per object from its distance, with hysteresis.
+
+    Level i is used between distances[i - 1] and distances[i]. An object only
+    switches once it is `hysteresis` units past a boundary, so objects sitting
+    right on a boundary do not flicker between two levels.
+    """
+
+    def __init__(self, distances, hysteresis=0.5):
+        self.distances = np.asarray(distances, dtype=np.float64)
+        self.hysteresis = hysteresis
+        self.levels = np.zeros(0, dtype=np.int32)
+
+    def select(self, distances):
+        """Update and return the level of every object, indexed like `distances`"""
+        distances = np.asarray(distances, dtype=np.float64)
+        if len(self.levels) != len(distances):
+            self.levels = np.zeros(len(distances), dtype=np.int32)
+
+        # Coarsest level the object has definitely reached, and finest it can still keep
+        coarse = np.count_nonzero(distances[:, None] > self.distances + self.hysteresis, axis=1)
+        fine = np.count_nonzero(distances[:, None] > self.distances - self.hysteresis, axis=1)
+        self.levels = np.clip(self.levels, coarse, fine).astype(np.int32)
+        return self.levels
@@ -0,0 +1,221 @@
+import numpy as np
+
+from Constants import MAP_TILE_SIZE, NPC_SPAWN_ROLES, WALL_HEIGHT
+from mesh_builder import MeshBatch
+
+# Face directions: (name, column step, row step)
+FACES = (("north", 0, -1), ("south", 0, 1), ("west", -1, 0), ("east", 1, 0))
+
+
+def find_runs(mask):
+    """Runs of True values along each row of a 2D mask, as (rows, starts, ends)"""
+    padded = np.pad(mask, ((0, 0), (1, 1))).astype(np.int8)
+    steps = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(steps == 1)
+    _, ends = np.nonzero(steps == -1)
+    return rows, starts, ends
+
+
+def merge_rows(rows, starts, ends):
+    """Merge identical runs on consecutive rows into rectangles (row0, row1, start, end)"""
+    order = np.lexsort((rows, ends, starts))
+    rows, starts, ends = rows[order], starts[order], ends[order]
+    new_group = np.ones(len(rows), dtype=bool)
+    new_group[1:] = (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1]) | (rows[1:] != rows[:-1] + 1)
+    first = np.flatnonzero(new_group)
+    last = np.append(first[1:], len(rows)) - 1
+    return rows[first], rows[last] + 1, starts[first], ends[first]
+
+
+class Level:
+    """A tile map compiled into merged, per-material floor and wall geometry.
+
+    Tile (col, row) covers world x in [col, col + 1) * tile_size and z in
+    [row, row + 1) * tile_size, shifted so the map is centred on the origin.
+    Only wall faces that border a walkable tile are generated, and faces
+    (and floor tiles) in the same row or column are merged into one quad.
+    """
+
+    def __init__(self, rows, tile_size=MAP_TILE_SIZE, wall_height=WALL_HEIGHT, spawn_roles=NPC_SPAWN_ROLES):
+        self.rows = rows
+        self.height = len(rows)
+        self.width = max(len(row) for row in rows)
+        self.tile_size = tile_size
+        self.wall_height = wall_height
+        self.origin = (-self.width * tile_size / 2, -self.height * tile_size / 2)
+
+        text = "".join(row.ljust(self.width, "W") for row in rows).encode()
+        tiles = np.frombuffer(text, dtype="S1").reshape(self.height, self.width)
+        self.walls = tiles == b"W"
+        # Outside the map counts as wall, nobody can look at those faces
+        self.padded_walls = np.pad(self.walls, 1, constant_values=True)
+
+        self.player_spawn = (0.0, 0.0)
+        self.npc_spawns = []  # (role, x, z) in reading order
+        for row, col in zip(*np.nonzero(~self.walls & (tiles != b"."))):
+            char = tiles[row, col].decode()
+            if char == "P":
+                self.player_spawn = self.tile_center(col, row)
+            elif char == "N":
+                # Every spawn names its role, a missing one is a map error
+                if (col, row) not in spawn_roles:
+                    raise ValueError(f"No role for the NPC spawn at column {col}, row {row}")
+                self.npc_spawns.append((spawn_roles[(col, row)], *self.tile_center(col, row)))
+
+    def tile_center(self, col, row):
+        return (
+            float(self.origin[0] + (col + 0.5) * self.tile_size),
+            float(self.origin[1] + (row + 0.5) * self.tile_size),
+        )
+
+    def world_to_tile(self, x, z):
+        return (
+            int(np.floor((x - self.origin[0]) / self.tile_size)),
+            int(np.floor((z - self.origin[1]) / self.tile_size)),
+        )
+
+    def is_wall(self, col, row):
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return bool(self.walls[row, col])
+        return True
+
+    def bounds(self):
+        """World-space (min_x, min_z, max_x, max_z) of the whole map"""
+        return (
+            self.origin[0], self.origin[1],
+            self.origin[0] + self.width * self.tile_size,
+            self.origin[1] + self.height * self.tile_size,
+        )
+
+    def tiles_in(self, min_x, min_z, max_x, max_z):
+        """(col0, row0, col1, row1) of the tiles whose centres lie in the given world rectangle"""
+        ox, oz = self.origin
+        s = self.tile_size
+        return (
+            max(int(np.ceil((min_x - ox) / s - 0.5)), 0),
+            max(int(np.ceil((min_z - oz) / s - 0.5)), 0),
+            min(int(np.ceil((max_x - ox) / s - 0.5)), self.width),
+            min(int(np.ceil((max_z - oz) / s - 0.5)), self.height),
+        )
+
+    def exposed_faces(self, direction, col0=0, row0=0, col1=None, row1=None):
+        """Wall tiles of a region whose neighbour in `direction` is walkable"""
+        _, dc, dr = next(face for face in FACES if face[0] == direction)
+        col1 = self.width if col1 is None else col1
+        row1 = self.height if row1 is None else row1
+        padded = self.padded_walls
+        tiles = padded[1 + row0:1 + row1, 1 + col0:1 + col1]
+        neighbour = padded[1 + row0 + dr:1 + row1 + dr, 1 + col0 + dc:1 + col1 + dc]
+        return tiles & ~neighbour
+
+    def compile_region(self, col0, row0, col1, row1, colors, uv_rects=None, repeat=False):
+        """Build {material: MeshBatch} for tiles [col0, col1) x [row0, row1).
+
+        Neighbours outside the region are still taken into account, so
+        adjacent regions can be compiled separately without extra faces.
+        Materials with an entry in `uv_rects` ((u0, v0, u1, v1) of their
+        texture in an atlas) are textured, one copy of the texture per tile.
+        With `repeat` their quads stay merged and texcoords count tiles, for
+        a renderer that repeats them inside the rectangle (CoreRenderer).
+        Otherwise they get one quad per tile, each mapped to the whole
+        rectangle, since fixed-function GL cannot repeat part of a texture.
+        """
+        uv_rects = uv_rects or {}
+        split = set() if repeat else set(uv_rects)
+        col0, row0 = max(col0, 0), max(row0, 0)
+        col1, row1 = max(min(col1, self.width), col0), max(min(row1, self.height), row0)
+        s = self.tile_size
+        ox, oz = self.origin
+        h = self.wall_height
+        quads = {"floor": [], "walls": []}  # blocks of (corner, axis, n) coordinates
+        texcoords = {"floor": [], "walls": []}  # blocks of (corner, uv, n), in tiles
+
+        # Floor: runs of walkable tiles per row, merged with identical runs below
+        walkable = ~self.walls[row0:row1, col0:col1]
+        if "floor" in split:
+            row_a, start = np.nonzero(walkable)
+            row_b, end = row_a + 1, start + 1
+        else:
+            row_a, row_b, start, end = merge_rows(*find_runs(walkable))
+        x0, x1 = ox + (col0 + start) * s, ox + (col0 + end) * s
+        z0, z1 = oz + (row0 + row_a) * s, oz + (row0 + row_b) * s
+        y = np.zeros(len(x0))
+        quads["floor"].append(((x0, y, z0), (x0, y, z1), (x1, y, z1), (x1, y, z0)))
+        if "floor" in uv_rects:
+            # Map tile coordinates, so the pattern lines up across regions
+            u0, u1, v0, v1 = col0 + start, col0 + end, row0 + row_a, row0 + row_b
+            texcoords["floor"].append(((u0, v0), (u0, v1), (u1, v1), (u1, v0)))
+
+        # Walls: merge exposed faces along the row (north/south) or column (west/east),
+        # or split them per tile and tile height
+        for direction, dc, dr in FACES:
+            exposed = self.exposed_faces(direction, col0, row0, col1, row1)
+            if not dr:
+                exposed = exposed.T
+            if "walls" in split:
+                line, start = np.nonzero(exposed)
+                end = start + 1
+            else:
+                line, start, end = find_runs(exposed)
+            if dr:
+                z = oz + (row0 + line + (dr > 0)) * s
+                a, b = ox + (col0 + start) * s, ox + (col0 + end) * s
+                if dr < 0:
+                    a, b = b, a
+            else:
+                x = ox + (col0 + line + (dc > 0)) * s
+                a, b = oz + (row0 + start) * s, oz + (row0 + end) * s
+                if dc > 0:
+                    a, b = b, a
+            fixed = z if dr else x
+
+            if "walls" in split:
+                # One quad per tile height, the top one may be cut short
+                bottoms = np.arange(0, h, s)
+                count = len(fixed)
+                fixed, a, b, start, end = (np.repeat(v, len(bottoms)) for v in (fixed, a, b, start, end))
+                y0 = np.tile(bottoms, count)
+                y1 = np.minimum(y0 + s, h)
+            else:
+                y0, y1 = np.zeros(len(fixed)), np.full(len(fixed), h)
+
+            if dr:
+                quads["walls"].append(((a, y0, fixed), (b, y0, fixed), (b, y1, fixed), (a, y1, fixed)))
+            else:
+                quads["walls"].append(((fixed, y0, a), (fixed, y0, b), (fixed, y1, b), (fixed, y1, a)))
+            if "walls" in uv_rects:
+                # The image's bottom row at the bottom of each copy, a wall
+                # height that is not whole tiles cuts the top copy short
+                u0, u1 = np.zeros(len(fixed)), (end - start).astype(float)
+                v_bottom = np.ceil((y1 - y0) / s)
+                v_top = v_bottom - (y1 - y0) / s
+                texcoords["walls"].append(((u0, v_bottom), (u1, v_bottom), (u1, v_top), (u0, v_top)))
+
+        batches = {}
+        for name, normal in (("floor", (0, 1, 0)), ("walls", None)):
+            corners = np.concatenate(
+                [np.array(block, dtype=np.float32).transpose(2, 0, 1) for block in quads[name]]
+            )
+            if not len(corners):
+                continue
+            triangle_corners = (0, 1, 2, 0, 2, 3)
+            positions = corners[:, triangle_corners].reshape(-1, 3)
+            if normal is None:
+                normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+                normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+                normals = np.repeat(normals, 6, axis=0)
+            else:
+                normals = np.tile(normal, (len(positions), 1))
+            uvs = None
+            if texcoords[name]:
+                uvs = np.concatenate(
+                    [np.array(block, dtype=np.float32).transpose(2, 0, 1) for block in texcoords[name]]
+                )
+                if name in split:
+                    # Each quad covers one copy, move it into the atlas rectangle
+                    u0, v0, u1, v1 = uv_rects[name]
+                    uvs = uvs - np.floor(uvs.min(axis=1, keepdims=True))
+                    uvs = np.float32((u0, v0)) + uvs * np.float32((u1 - u0, v1 - v0))
+                uvs = uvs[:, triangle_corners].reshape(-1, 2)
+            batches[name] = MeshBatch(positions, normals, colors[name], uvs)
+        return batches
@@ -1,3 +1,4 @@
+import math
 import time
 
 import pygame
@@ -5,88 +6,154 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 
 from Constants import *
+from GLState import get_gl_state
+from TextRenderer import get_font
 
 class MenuScreen:
-    def __init__(self):
-        self.font_large = pygame.font.Font(None, 74)
-        self.font_medium = pygame.font.Font(None, 48)
-        self.font_small = pygame.font.Font(None, 36)
+    def __init__(self, renderer=None):
+        self.renderer = renderer  # CoreRenderer, or None for fixed-function drawing
+        self.font_large = get_font(74)
+        self.font_medium = get_font(48)
+        self.font_small = get_font(36)
         self.active = True
         self.start_time = time.time()
-        
+
+        # Retro scanlines are pre-rendered once and composited over each region
+        self.scanlines = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SRCALPHA)
+        for y in range(0, WINDOW_HEIGHT, 4):
+            pygame.draw.line(self.scanlines, (0, 50, 0), (0, y), (WINDOW_WIDTH, y))
+
+        # Text only changes a handful of times, keep the rendered surfaces
+        self.title_surfaces = {}
+        self.subtitle_surface = self.font_medium.render(SUBTITLE, True, MENU_TEXT_COLOR)
+        self.prompt_surface = self.font_small.render("Press ENTER to start", True, MENU_TEXT_COLOR)
+
+        # One persistent texture, updated region by region
+        self.texture = None
+        self.region_states = {}
+
+    def create_texture(self):
+        self.texture = glGenTextures(1)
+        get_gl_state().bind_texture(self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        texture_data = pygame.image.tostring(self.scanlines, "RGBA")
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, WINDOW_WIDTH, WINDOW_HEIGHT, 0, GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
+        self.region_states = {}
+
+    def release(self):
+        """Free the menu texture once the menu is closed"""
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+            get_gl_state().forget_texture(self.texture)
+            self.texture = None
+
+    def update_region(self, name, state, y, height, text_surface=None, alpha=255):
+        """Re-upload one horizontal band of the menu if its state changed"""
+        if self.region_states.get(name) == state:
+            return
+        self.region_states[name] = state
+
+        region = pygame.Surface((WINDOW_WIDTH, height), pygame.SRCALPHA)
+        if text_surface is not None:
+            text_surface.set_alpha(alpha)
+            text_x = (WINDOW_WIDTH - text_surface.get_width()) // 2
+            region.blit(text_surface, (text_x, 0))
+        region.blit(self.scanlines, (0, 0), (0, y, WINDOW_WIDTH, height))
+
+        texture_data = pygame.image.tostring(region, "RGBA")
+        get_gl_state().bind_texture(self.texture)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, y, WINDOW_WIDTH, height, GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
+
+    def frame_states(self):
+        """{region: state} the menu animation is at right now"""
+        elapsed_time = time.time() - self.start_time
+        # Title with "typing" effect
+        title_chars = int(min(len(TITLE), elapsed_time * 15))  # Type 15 chars per second
+
+        # Subtitle with fade-in effect, starts after title is typed
+        subtitle_alpha = 0
+        if elapsed_time > len(TITLE) / 15:
+            subtitle_alpha = min(255, int((elapsed_time - len(TITLE) / 15) * 255))
+
+        # "Press ENTER" with blinking effect, starts after subtitle fade
+        prompt_visible = elapsed_time > (len(TITLE) / 15 + 1) and bool(int(elapsed_time * 2) % 2)  # Blink every 0.5 seconds
+        return {"title": title_chars, "subtitle": subtitle_alpha, "prompt": prompt_visible}
+
+    def changed(self):
+        """Whether render() would draw anything different from the last time"""
+        return self.texture is None or self.frame_states() != self.region_states
+
+    def next_change(self):
+        """Seconds until the animation next changes the menu, 0 while it is typing or fading"""
+        elapsed_time = time.time() - self.start_time
+        if elapsed_time < len(TITLE) / 15 + 1:
+            return 0.0
+        return (math.floor(elapsed_time * 2) + 1) / 2 - elapsed_time
+
     def render(self):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        
-        # Create a surface for 2D rendering
-        surface = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SRCALPHA)
-        
+
+        if self.texture is None:
+            self.create_texture()
+
         # Calculate vertical positions
         center_y = WINDOW_HEIGHT // 2
         title_y = center_y - 100
         subtitle_y = center_y - 20
         prompt_y = center_y + 100
-        
-        # Render title with "typing" effect
-        elapsed_time = time.time() - self.start_time
-        title_chars = int(min(len(TITLE), elapsed_time * 15))  # Type 15 chars per second
-        partial_title = TITLE[:title_chars]
-        title_surface = self.font_large.render(partial_title, True, MENU_TEXT_COLOR)
-        title_x = (WINDOW_WIDTH - title_surface.get_width()) // 2
-        surface.blit(title_surface, (title_x, title_y))
-        
-        # Render subtitle with fade-in effect
-        if elapsed_time > len(TITLE) / 15:  # Start after title is typed
-            subtitle_alpha = min(255, int((elapsed_time - len(TITLE) / 15) * 255))
-            subtitle_surface = self.font_medium.render(SUBTITLE, True, MENU_TEXT_COLOR)
-            subtitle_surface.set_alpha(subtitle_alpha)
-            subtitle_x = (WINDOW_WIDTH - subtitle_surface.get_width()) // 2
-            surface.blit(subtitle_surface, (subtitle_x, subtitle_y))
-        
-        # Render "Press ENTER" with blinking effect
-        if elapsed_time > (len(TITLE) / 15 + 1):  # Start after subtitle fade
-            if int(elapsed_time * 2) % 2:  # Blink every 0.5 seconds
-                prompt_text = "Press ENTER to start"
-                prompt_surface = self.font_small.render(prompt_text, True, MENU_TEXT_COLOR)
-                prompt_x = (WINDOW_WIDTH - prompt_surface.get_width()) // 2
-                surface.blit(prompt_surface, (prompt_x, prompt_y))
-        
-        # Add some retro effects (scanlines)
-        for y in range(0, WINDOW_HEIGHT, 4):
-            pygame.draw.line(surface, (0, 50, 0), (0, y), (WINDOW_WIDTH, y))
-        
-        # Convert surface to OpenGL texture
-        texture_data = pygame.image.tostring(surface, "RGBA", True)
-        
+
+        states = self.frame_states()
+        title_chars = states["title"]
+        if title_chars not in self.title_surfaces:
+            self.title_surfaces[title_chars] = self.font_large.render(TITLE[:title_chars], True, MENU_TEXT_COLOR)
+        self.update_region(
+            "title", title_chars, title_y, self.font_large.get_height(), self.title_surfaces[title_chars]
+        )
+        subtitle_alpha = states["subtitle"]
+        self.update_region(
+            "subtitle", subtitle_alpha, subtitle_y, self.font_medium.get_height(),
+            self.subtitle_surface if subtitle_alpha else None, subtitle_alpha,
+        )
+        prompt_visible = states["prompt"]
+        self.update_region(
+            "prompt", prompt_visible, prompt_y, self.font_small.get_height(),
+            self.prompt_surface if prompt_visible else None,
+        )
+
+        if self.renderer is not None:
+            self.renderer.begin_ui()
+            self.renderer.draw_rect(self.texture, 0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+            self.renderer.end_ui()
+            pygame.display.flip()
+            return
+
         # Set up orthographic projection for 2D rendering
-        glMatrixMode(GL_PROJECTION)
+        state = get_gl_state()
+        state.matrix_mode(GL_PROJECTION)
         glLoadIdentity()
         glOrtho(0, WINDOW_WIDTH, WINDOW_HEIGHT, 0, -1, 1)
-        glMatrixMode(GL_MODELVIEW)
+        state.matrix_mode(GL_MODELVIEW)
         glLoadIdentity()
 
-        # Render the texture in OpenGL
-        texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texture)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, WINDOW_WIDTH, WINDOW_HEIGHT, 0, GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        
-        # Draw the texture
-        glEnable(GL_TEXTURE_2D)
+        # Draw the texture unlit (rows are stored top-down, matching the ortho projection)
+        state.bind_texture(self.texture)
+        state.disable(GL_LIGHTING)
+        state.enable(GL_TEXTURE_2D)
+        state.color(1, 1, 1, 1)
         glBegin(GL_QUADS)
-        glTexCoord2f(0, 1); glVertex2f(0, 0)
-        glTexCoord2f(1, 1); glVertex2f(WINDOW_WIDTH, 0)
-        glTexCoord2f(1, 0); glVertex2f(WINDOW_WIDTH, WINDOW_HEIGHT)
-        glTexCoord2f(0, 0); glVertex2f(0, WINDOW_HEIGHT)
+        glTexCoord2f(0, 0); glVertex2f(0, 0)
+        glTexCoord2f(1, 0); glVertex2f(WINDOW_WIDTH, 0)
+        glTexCoord2f(1, 1); glVertex2f(WINDOW_WIDTH, WINDOW_HEIGHT)
+        glTexCoord2f(0, 1); glVertex2f(0, WINDOW_HEIGHT)
         glEnd()
-        glDisable(GL_TEXTURE_2D)
-        
-        # Reset OpenGL state for 3D rendering
-        glMatrixMode(GL_PROJECTION)
+
+        # Reset the matrices for 3D rendering, the 3D draw code sets its own state
+        state.matrix_mode(GL_PROJECTION)
         glLoadIdentity()
-        gluPerspective(45, (WINDOW_WIDTH / WINDOW_HEIGHT), 0.1, 50.0)
-        glMatrixMode(GL_MODELVIEW)
+        gluPerspective(FIELD_OF_VIEW, (WINDOW_WIDTH / WINDOW_HEIGHT), NEAR_PLANE, FAR_PLANE)
+        state.matrix_mode(GL_MODELVIEW)
         glLoadIdentity()
-        glEnable(GL_DEPTH_TEST)
+        state.enable(GL_DEPTH_TEST)
 
-        pygame.display.flip()
\ No newline at end of file
+        pygame.display.flip()
@@ -0,0 +1,157 @@
+import numpy as np
+import pygame
+from OpenGL.GL import *
+
+from Constants import MINIMAP_MARGIN, MINIMAP_SIZE, WINDOW_HEIGHT, WINDOW_WIDTH
+from GLState import get_gl_state
+from UICompositor import UICompositor
+
+# RGBA of each kind of tile
+WALL_COLOR = (30, 30, 30, 220)
+FLOOR_COLOR = (150, 130, 100, 200)
+DOORWAY_COLOR = (210, 180, 100, 200)
+BORDER = 2  # Pixels of white frame around the map
+
+# Markers, tinted white quads
+PLAYER_COLOR = (0.2, 1.0, 0.2, 1.0)
+NPC_COLOR = (1.0, 0.3, 0.3, 1.0)
+PLAYER_MARKER_SIZE = 7  # Pixels from the centre to the tip of the arrow
+NPC_MARKER_SIZE = 5  # Side of the square
+
+
+class Minimap:
+    """Top-down map of the level in the top-right corner, with markers.
+
+    The tile map is rasterized once into the background of a UICompositor,
+    the same upload path as the dialogue box, only as large as the map.
+    set_level() rasterizes it again when the map changes. Every frame only
+    adds the player and NPC markers as quads over it: they sample the
+    texture's white border, so they need no texture of their own and each
+    color is a single draw call.
+    """
+
+    def __init__(self, level, renderer=None):
+        self.renderer = renderer  # CoreRenderer, or None for fixed-function drawing
+        self.visible = True
+        self.ui = None
+        self.texcoords = np.zeros((0, 2), dtype=np.float32)  # Grown as markers are added
+        self.set_level(level)
+
+    def set_level(self, level):
+        """Show `level`, rasterizing its map again"""
+        self.level = level
+        tile_pixels = (MINIMAP_SIZE - 2 * BORDER) / max(level.width, level.height)
+        self.map_size = (max(1, round(level.width * tile_pixels)), max(1, round(level.height * tile_pixels)))
+        width, height = self.map_size[0] + 2 * BORDER, self.map_size[1] + 2 * BORDER
+        if self.ui is None or self.ui.rect.size != (width, height):
+            self.release()
+            self.ui = UICompositor(WINDOW_WIDTH - MINIMAP_MARGIN - width, MINIMAP_MARGIN, width, height)
+        self.ui.set_background(self.draw_map)
+
+        # Between the two texels of the left border, both white
+        self.white_uv = (1.0 / width, 0.5)
+        self.texcoords = np.zeros((0, 2), dtype=np.float32)
+
+    def release(self):
+        if self.ui is not None:
+            self.ui.release()
+
+    def draw_map(self, surface):
+        """One pixel per tile, scaled up without filtering"""
+        level = self.level
+        text = "".join(row.ljust(level.width, "W") for row in level.rows).encode()
+        doorways = np.frombuffer(text, dtype="S1").reshape(level.height, level.width) == b"D"
+        pixels = np.empty((level.height, level.width, 4), dtype=np.uint8)
+        pixels[:] = FLOOR_COLOR
+        pixels[doorways] = DOORWAY_COLOR
+        pixels[level.walls] = WALL_COLOR
+        tiles = pygame.image.frombuffer(pixels.tobytes(), (level.width, level.height), "RGBA")
+        surface.blit(pygame.transform.scale(tiles, self.map_size), (BORDER, BORDER))
+        pygame.draw.rect(surface, (255, 255, 255, 255), surface.get_rect(), BORDER)
+
+    def to_window(self, x, z):
+        """Window pixels of world (x, z), arrays or scalars"""
+        level = self.level
+        scale_x = self.map_size[0] / (level.width * level.tile_size)
+        scale_z = self.map_size[1] / (level.height * level.tile_size)
+        return (
+            self.ui.rect.x + BORDER + (np.asarray(x) - level.origin[0]) * scale_x,
+            self.ui.rect.y + BORDER + (np.asarray(z) - level.origin[1]) * scale_z,
+        )
+
+    def player_marker(self, pos, forward):
+        """Corners of an arrow head at `pos` pointing along the XZ `forward`"""
+        center = np.array(self.to_window(pos[0], pos[2]))
+        ahead = np.array(forward) * PLAYER_MARKER_SIZE
+        side = np.array((-ahead[1], ahead[0]))
+        # Convex, so fixed-function GL_QUADS draws it as given
+        corners = (center + ahead, center - 0.4 * ahead + 0.6 * side,
+                   center - 0.7 * ahead, center - 0.4 * ahead - 0.6 * side)
+        return np.array(corners, dtype=np.float32)
+
+    def npc_markers(self, positions):
+        """Corners of a square around each (n, 3) world position"""
+        positions = np.asarray(positions)
+        centers = np.column_stack(self.to_window(positions[:, 0], positions[:, 2]))
+        half = NPC_MARKER_SIZE / 2
+        corners = np.array(((-half, -half), (half, -half), (half, half), (-half, half)))
+        return (centers[:, None] + corners[None]).reshape(-1, 2).astype(np.float32)
+
+    def marker_texcoords(self, count):
+        """`count` copies of the white texel's coordinates"""
+        if len(self.texcoords) < count:
+            self.texcoords = np.tile(np.float32(self.white_uv), (count, 1))
+        return self.texcoords[:count]
+
+    def render(self, player_pos, forward, npc_positions):
+        """Draw the map and markers, `npc_positions` is (n, 3) world positions"""
+        if not self.visible:
+            return
+        markers = (
+            (self.npc_markers(npc_positions), NPC_COLOR),
+            (self.player_marker(player_pos, forward), PLAYER_COLOR),
+        )
+
+        if self.renderer is not None:
+            self.renderer.begin_ui()
+            self.ui.draw(self.renderer)
+            for positions, color in markers:
+                self.renderer.draw_quads(positions, self.marker_texcoords(len(positions)), self.ui.texture, color)
+            self.renderer.end_ui()
+            return
+
+        # Only the state changed below is put back afterwards
+        with get_gl_state().saved() as state:
+            state.matrix_mode(GL_PROJECTION)
+            glPushMatrix()
+            glLoadIdentity()
+            glOrtho(0, WINDOW_WIDTH, WINDOW_HEIGHT, 0, -1, 1)
+            state.matrix_mode(GL_MODELVIEW)
+            glPushMatrix()
+            glLoadIdentity()
+
+            state.disable(GL_DEPTH_TEST)
+            state.disable(GL_LIGHTING)
+            state.enable(GL_BLEND)
+            state.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+            state.enable(GL_TEXTURE_2D)
+            state.color(1, 1, 1, 1)
+            self.ui.draw()
+
+            # The map texture is still bound, markers read its border
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            for positions, color in markers:
+                if not len(positions):
+                    continue
+                state.color(*color)
+                glVertexPointer(2, GL_FLOAT, 0, positions)
+                glTexCoordPointer(2, GL_FLOAT, 0, self.marker_texcoords(len(positions)))
+                glDrawArrays(GL_QUADS, 0, len(positions))
+            glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+            glDisableClientState(GL_VERTEX_ARRAY)
+
+            state.matrix_mode(GL_PROJECTION)
+            glPopMatrix()
+            state.matrix_mode(GL_MODELVIEW)
+            glPopMatrix()
@@ -1,22 +1,61 @@
-from OpenGL.GL import *
-from OpenGL.GLU import *
+from EntityStore import COLOR_SLOTS, ENTITIES, component
+
+# Body parts in NPC-local space, before self.scale is applied:
+# (color slot, shape, offset, size) where size is a radius for spheres
+# and (x, y, z) scale factors for cubes
+BODY_PARTS = [
+    ("skin", "sphere", (0, 0, 0), 0.12),  # Head
+    ("hair", "sphere", (0, 0.05, 0), 0.13),  # Hair (slightly larger than head, slightly above)
+    ("primary", "cube", (0, -0.3, 0), (0.3, 0.4, 0.2)),  # Body (torso)
+    ("secondary", "cube", (-0.2, -0.3, 0), (0.1, 0.4, 0.1)),  # Left arm
+    ("secondary", "cube", (0.2, -0.3, 0), (0.1, 0.4, 0.1)),  # Right arm
+    ("secondary", "cube", (-0.1, -0.8, 0), (0.1, 0.5, 0.1)),  # Left leg
+    ("secondary", "cube", (0.1, -0.8, 0), (0.1, 0.5, 0.1)),  # Right leg
+]
+SPHERE_DETAIL = 16
+
+# Detail levels, from closest to furthest: sphere slices/stacks per level,
+# None draws the spheres as boxes (a cheap box-only impostor)
+LOD_SPHERE_DETAIL = (SPHERE_DETAIL, 10, 6, None)
+LOD_DISTANCES = (5.0, 10.0, 18.0)  # Distances from the player where each next level starts
+
+
+def body_extent():
+    """Local-space (lo, hi) corners around all BODY_PARTS"""
+    lo = [0.0, 0.0, 0.0]
+    hi = [0.0, 0.0, 0.0]
+    for slot, shape, offset, size in BODY_PARTS:
+        half = (size, size, size) if shape == "sphere" else [s / 2 for s in size]
+        for axis in range(3):
+            lo[axis] = min(lo[axis], offset[axis] - half[axis])
+            hi[axis] = max(hi[axis], offset[axis] + half[axis])
+    return lo, hi
+
+
+BODY_EXTENT = body_extent()
 
-from utils import draw_cube, draw_sphere
 
 class NPC:
-    def __init__(self, x, y, z, role="HR"):
-        self.scale = 0.6  # Make NPCs smaller (about 60% of current size)
-        # Position them beside the desks, at ground level
-        
+    """View of one NPC entity, the data lives in an EntityStore"""
+
+    pos = component("positions")
+    scale = component("scales")
+    skin_color = component("colors", 0)
+    hair_color = component("colors", 1)
+    clothes_primary = component("colors", 2)
+    clothes_secondary = component("colors", 3)
+
+    def __init__(self, x, y, z, role="HR", store=ENTITIES):
+        self.store = store
         # Adjust Y position to be half their height (accounting for scale)
-        self.pos = [x, 0.65, z]  # This puts their feet on the ground
+        # This puts their feet on the ground
+        self.id = store.create((x, 0.65, z), role, scale=0.6)  # About 60% of the original size
         self.size = 0.5
-        self.role = role
-        
+
         # Enhanced color palette
         self.skin_color = (0.8, 0.7, 0.6)  # Neutral skin tone
         self.hair_color = (0.2, 0.15, 0.1) if role == "HR" else (0.3, 0.3, 0.3)  # Dark brown vs gray
-        
+
         # Updated clothing colors
         if role == "HR":
             self.clothes_primary = (0.8, 0.2, 0.2)    # Bright red
@@ -25,46 +64,18 @@ class NPC:
             self.clothes_primary = (0.2, 0.3, 0.8)    # Bright blue
             self.clothes_secondary = (0.15, 0.2, 0.6)  # Darker blue
 
-    def draw(self):
-        glPushMatrix()
-        glTranslatef(self.pos[0], self.pos[1], self.pos[2])
-        glScalef(self.scale, self.scale, self.scale)
-        
-        # Head
-        glColor3f(*self.skin_color)
-        draw_sphere(0.12, 16, 16)
-        
-        # Hair (slightly larger than head)
-        glColor3f(*self.hair_color)
-        glPushMatrix()
-        glTranslatef(0, 0.05, 0)  # Slightly above head
-        draw_sphere(0.13, 16, 16)
-        glPopMatrix()
-        
-        # Body (torso)
-        glColor3f(*self.clothes_primary)
-        glPushMatrix()
-        glTranslatef(0, -0.3, 0)  # Move down from head
-        glScalef(0.3, 0.4, 0.2)   # Make it rectangular
-        draw_cube()
-        glPopMatrix()
-        
-        # Arms
-        glColor3f(*self.clothes_secondary)
-        for x_offset in [-0.2, 0.2]:  # Left and right arms
-            glPushMatrix()
-            glTranslatef(x_offset, -0.3, 0)
-            glScalef(0.1, 0.4, 0.1)
-            draw_cube()
-            glPopMatrix()
-        
-        # Legs
-        glColor3f(*self.clothes_secondary)
-        for x_offset in [-0.1, 0.1]:  # Left and right legs
-            glPushMatrix()
-            glTranslatef(x_offset, -0.8, 0)
-            glScalef(0.1, 0.5, 0.1)
-            draw_cube()
-            glPopMatrix()
-        
-        glPopMatrix()
\ No newline at end of file
+    @property
+    def role(self):
+        return self.store.role_names[self.store.roles[self.id]]
+
+    def palette(self):
+        """Colors for each entry of COLOR_SLOTS"""
+        return self.store.colors[self.id]
+
+    def bounds(self):
+        """World-space axis-aligned bounding box as (lo, hi)"""
+        lo, hi = BODY_EXTENT
+        return (
+            [p + v * self.scale for p, v in zip(self.pos, lo)],
+            [p + v * self.scale for p, v in zip(self.pos, hi)],
+        )
@@ -0,0 +1,163 @@
+import numpy as np
+from OpenGL.GL import *
+
+from AssetPack import get_asset_pack
+from CoreRenderer import CoreMesh
+from GLState import get_gl_state
+from mesh_builder import MeshBuilder
+from NPC import BODY_PARTS, COLOR_SLOTS, LOD_SPHERE_DETAIL
+
+
+class BodyTemplate:
+    """All BODY_PARTS merged into one mesh at a given sphere detail.
+
+    `slots` holds the COLOR_SLOTS index of every vertex so per-NPC colors
+    can be gathered without touching the geometry. A sphere detail of None
+    builds the box-only impostor. Templates baked into the AssetPack are
+    mapped from it instead of being rebuilt.
+    """
+
+    def __init__(self, sphere_detail):
+        pack = get_asset_pack()
+        name = f"mesh/body/{sphere_detail}"
+        if pack is not None and f"{name}/slots" in pack:
+            self.positions = pack.array(f"{name}/positions")
+            self.normals = pack.array(f"{name}/normals")
+            self.slots = pack.array(f"{name}/slots")
+        else:
+            self.build(sphere_detail)
+        self.positions_buffer = None
+        self.normals_buffer = None
+        self.colors_buffer = None
+        self.mesh = None  # CoreMesh holding the buffers, with a CoreRenderer
+
+    def build(self, sphere_detail):
+        builder = MeshBuilder()
+        for slot, shape, offset, size in BODY_PARTS:
+            builder.set_material(slot, None)
+            builder.push_matrix()
+            builder.translate(*offset)
+            if shape == "sphere" and sphere_detail is not None:
+                builder.sphere(size, sphere_detail, sphere_detail)
+            elif shape == "sphere":
+                builder.scale(size * 2, size * 2, size * 2)
+                builder.cube()
+            else:
+                builder.scale(*size)
+                builder.cube()
+            builder.pop_matrix()
+
+        batches = builder.build()
+        self.positions = np.concatenate([batch.positions for batch in batches.values()])
+        self.normals = np.concatenate([batch.normals for batch in batches.values()])
+        self.slots = np.concatenate(
+            [np.full(batch.vertex_count, COLOR_SLOTS.index(name)) for name, batch in batches.items()]
+        )
+
+    @property
+    def vertex_count(self):
+        return len(self.positions)
+
+    def instance(self, positions, scales, palettes):
+        """Rebuild the merged buffer holding one copy of the template per NPC"""
+        count = len(positions)
+        vertices = self.positions[None] * scales[:, None, None] + positions[:, None, :]
+        self.positions_buffer = np.ascontiguousarray(vertices.reshape(-1, 3), dtype=np.float32)
+        # Instances are scaled uniformly, so the template normals still hold
+        self.normals_buffer = np.ascontiguousarray(np.tile(self.normals, (count, 1)))
+        self.colors_buffer = np.ascontiguousarray(palettes[:, self.slots].reshape(-1, 3))
+
+    def ranges(self, indices):
+        """(firsts, counts) of the NPCs at sorted `indices` in the merged buffer,
+        neighbouring NPCs are merged into one range"""
+        indices = np.asarray(indices, dtype=np.int32)
+        starts = np.flatnonzero(np.diff(indices, prepend=-2) != 1)
+        run_lengths = np.diff(np.append(starts, len(indices)))
+        firsts = indices[starts] * self.vertex_count
+        counts = (run_lengths * self.vertex_count).astype(np.int32)
+        return firsts, counts
+
+    def draw(self, indices):
+        """Draw the NPCs at `indices`, each is a contiguous range of the buffer"""
+        glVertexPointer(3, GL_FLOAT, 0, self.positions_buffer)
+        glNormalPointer(GL_FLOAT, 0, self.normals_buffer)
+        glColorPointer(3, GL_FLOAT, 0, self.colors_buffer)
+        firsts, counts = self.ranges(indices)
+        glMultiDrawArrays(GL_TRIANGLES, firsts, counts, len(firsts))
+
+
+class NPCRenderer:
+    """Draws any number of NPCs with one draw call per detail level.
+
+    A shared body mesh is built once per level of LOD_SPHERE_DETAIL; every
+    NPC is an instance of it, scaled and translated on the CPU into one merged
+    vertex buffer per level. Those buffers are only rebuilt when an NPC moves
+    or changes colors, switching levels just draws a different range. With
+    a CoreRenderer the buffers live in GL buffer objects instead of client
+    arrays.
+    """
+
+    def __init__(self, renderer=None):
+        self.renderer = renderer
+        self.templates = [BodyTemplate(detail) for detail in LOD_SPHERE_DETAIL]
+        self.instances = None  # (positions, scales, palettes) the buffers were built from
+
+    def update(self, npcs):
+        """Rebuild the merged buffers if any NPC transform or color changed"""
+        if not npcs:
+            return
+        # One gather per component straight from the entity store
+        ids = np.fromiter((npc.id for npc in npcs), dtype=np.intp, count=len(npcs))
+        positions, scales, palettes = npcs[0].store.transforms(ids)
+
+        if self.instances is not None and all(
+            np.array_equal(old, new) for old, new in zip(self.instances, (positions, scales, palettes))
+        ):
+            return
+        self.instances = (positions, scales, palettes)
+        for template in self.templates:
+            template.instance(positions, scales, palettes)
+            if self.renderer is None:
+                continue
+            buffers = template.positions_buffer, template.normals_buffer, None, template.colors_buffer
+            if template.mesh is None:
+                template.mesh = CoreMesh(*buffers, usage=GL_DYNAMIC_DRAW)
+            else:
+                template.mesh.update(*buffers)
+
+    def draw(self, npcs, visible=None, levels=None):
+        """Draw `npcs`, or only those whose indices are in `visible`.
+
+        `levels` gives the detail level of each NPC (all full detail if None).
+        """
+        self.update(npcs)
+        indices = np.arange(len(npcs)) if visible is None else np.array(sorted(visible), dtype=np.int32)
+        if not len(indices):
+            return
+        levels = np.zeros(len(npcs), dtype=np.int32) if levels is None else np.asarray(levels)
+
+        if self.renderer is not None:
+            for level, template in enumerate(self.templates):
+                level_indices = indices[levels[indices] == level]
+                if len(level_indices):
+                    firsts, counts = template.ranges(level_indices)
+                    self.renderer.draw_mesh(template.mesh, firsts, counts)
+            return
+
+        state = get_gl_state()
+        state.enable(GL_LIGHTING)
+        state.disable(GL_TEXTURE_2D)
+        state.color_material(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
+        state.enable(GL_COLOR_MATERIAL)
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        for level, template in enumerate(self.templates):
+            level_indices = indices[levels[indices] == level]
+            if len(level_indices):
+                template.draw(level_indices)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        state.invalidate("color")  # Left undefined by the color array
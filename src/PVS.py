@@ -0,0 +1,207 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from Constants import PVS_DIR
+
+PVS_VERSION = 1  # Bump to ignore caches from an older algorithm
+RAY_STEP = 0.25  # Tiles between samples along a ray
+# Points sampled in each tile, as offsets from its centre in tiles
+TILE_SAMPLES = np.array(((0, 0), (-0.4, -0.4), (0.4, -0.4), (-0.4, 0.4), (0.4, 0.4)))
+RAY_BATCH = 2048  # Rays marched at once, bounds the memory used
+
+
+def label_components(mask):
+    """4-connected components of a 2D mask, (labels with -1 outside, count)"""
+    labels = np.full(mask.shape, -1, dtype=np.int32)
+    count = 0
+    for start in zip(*np.nonzero(mask)):
+        if labels[start] >= 0:
+            continue
+        labels[start] = count
+        stack = [start]
+        while stack:
+            row, col = stack.pop()
+            for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+                if 0 <= r < mask.shape[0] and 0 <= c < mask.shape[1] and mask[r, c] and labels[r, c] < 0:
+                    labels[r, c] = count
+                    stack.append((r, c))
+        count += 1
+    return labels, count
+
+
+def find_doorways(walls, marked=None):
+    """Walkable tiles that are doorways: marked ones, and gaps one tile wide
+    with walls on both sides along one axis and open on the other"""
+    padded = np.pad(walls, 1, constant_values=True)
+    north, south = padded[:-2, 1:-1], padded[2:, 1:-1]
+    west, east = padded[1:-1, :-2], padded[1:-1, 2:]
+    gaps = (west & east & ~north & ~south) | (north & south & ~west & ~east)
+    doorways = ~walls & gaps
+    if marked is not None:
+        doorways |= marked & ~walls
+    return doorways
+
+
+def find_zones(walls, marked_doorways=None):
+    """(zones, room count) with every walkable tile labelled by its zone.
+
+    Rooms come first, then doorways; walls are -1.
+    """
+    doorways = find_doorways(walls, marked_doorways)
+    rooms, room_count = label_components(~walls & ~doorways)
+    doors, door_count = label_components(doorways)
+    zones = np.where(doors >= 0, doors + room_count, rooms)
+    return zones.astype(np.int32), room_count
+
+
+def zone_visibility(zones):
+    """(n, n) bool matrix, True where some sightline joins the two zones.
+
+    From sample points in each zone, rays aim at sample points of the tiles
+    just outside it (its doorways, or the rooms on both sides of a doorway)
+    and carry on until they hit a wall, every zone they cross is visible.
+    Sampling makes it approximate for sightlines a fraction of a tile wide.
+    """
+    count = int(zones.max()) + 1 if zones.size else 0
+    visible = np.identity(count, dtype=bool)
+    height, width = zones.shape
+    padded = np.pad(zones, 1, constant_values=-1)
+    steps = np.arange(0, np.hypot(width, height) + 2, RAY_STEP)
+
+    for zone in range(count):
+        inside = zones == zone
+        neighbours = np.zeros_like(inside)
+        neighbours[1:] |= inside[:-1]
+        neighbours[:-1] |= inside[1:]
+        neighbours[:, 1:] |= inside[:, :-1]
+        neighbours[:, :-1] |= inside[:, 1:]
+        neighbours &= (zones >= 0) & ~inside
+        if not neighbours.any():
+            continue
+        visible[zone, np.unique(zones[neighbours])] = True
+
+        # Tile centres are at +0.5, (col, row) order like x and z
+        origins = (np.argwhere(inside)[:, ::-1] + 0.5)[:, None] + TILE_SAMPLES[None]
+        targets = (np.argwhere(neighbours)[:, ::-1] + 0.5)[:, None] + TILE_SAMPLES[None]
+        origins = np.repeat(origins.reshape(-1, 2), len(targets) * len(TILE_SAMPLES), axis=0)
+        targets = np.tile(targets.reshape(-1, 2), (len(origins) // len(targets) // len(TILE_SAMPLES), 1))
+        directions = targets - origins
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+        for start in range(0, len(origins), RAY_BATCH):
+            points = (
+                origins[start:start + RAY_BATCH, None]
+                + directions[start:start + RAY_BATCH, None] * steps[None, :, None]
+            )
+            # Outside the map is a wall, like Level.padded_walls
+            cols = np.clip(np.floor(points[..., 0]).astype(np.int64) + 1, 0, width + 1)
+            rows = np.clip(np.floor(points[..., 1]).astype(np.int64) + 1, 0, height + 1)
+            crossed = padded[rows, cols]
+            blocked = np.argmax(crossed < 0, axis=1)  # The last step always leaves the map
+            crossed = crossed[np.arange(len(steps))[None] < blocked[:, None]]
+            visible[zone, np.unique(crossed)] = True
+
+    # What A can see can see A, fills in anything the sampling missed one way
+    return visible | visible.T
+
+
+class PotentiallyVisibleSet:
+    """Zone map of a Level and which zones can see each other.
+
+    The map is split into zones: rooms (connected walkable tiles) and the
+    doorways between them (tiles marked D, or walkable gaps one tile wide
+    in a wall). level_pvs() finds which zones see which once and caches
+    it next to the other generated assets, keyed by the map's contents.
+    visible_mask(x, z) is one array lookup per frame, after which testing
+    anything against it is an index into that mask. Zone -1 (walls, or
+    outside the map) is always treated as visible, so nothing is culled for
+    an eye that clipped into a wall.
+    """
+
+    def __init__(self, zones, visible, room_count, origin, tile_size):
+        self.zones = zones  # (height, width) int32, -1 for walls
+        self.visible = visible  # (zone, zone) bool
+        self.room_count = room_count
+        self.origin = origin
+        self.tile_size = tile_size
+        # One mask per eye zone, the extra last entry answers zone -1
+        self.masks = np.column_stack((visible, np.ones(len(visible), dtype=bool)))
+
+    @property
+    def zone_count(self):
+        return len(self.visible)
+
+    def zones_at(self, x, z):
+        """Zone of each world (x, z), -1 for walls and outside the map"""
+        cols = np.floor((np.asarray(x) - self.origin[0]) / self.tile_size).astype(np.int64)
+        rows = np.floor((np.asarray(z) - self.origin[1]) / self.tile_size).astype(np.int64)
+        height, width = self.zones.shape
+        inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+        return np.where(inside, self.zones[np.clip(rows, 0, height - 1), np.clip(cols, 0, width - 1)], -1)
+
+    def zone_at(self, x, z):
+        return int(self.zones_at(x, z))
+
+    def visible_mask(self, x, z):
+        """Bool mask indexed by zone (-1 included) of what an eye at (x, z)
+        may see, None when the eye is in no zone and nothing can be culled"""
+        zone = self.zone_at(x, z)
+        return None if zone < 0 else self.masks[zone]
+
+    def cull(self, x, z, indices, positions):
+        """The `indices` whose (n, 3) world `positions` may be visible from (x, z)"""
+        mask = self.visible_mask(x, z)
+        if mask is None or not len(indices):
+            return indices
+        indices = np.fromiter(indices, dtype=np.intp)
+        positions = np.asarray(positions)[indices]
+        return set(indices[mask[self.zones_at(positions[:, 0], positions[:, 2])]].tolist())
+
+    def zones_in(self, col0, row0, col1, row1, margin=1):
+        """Zones of the tiles [col0, col1) x [row0, row1) plus `margin` around them"""
+        height, width = self.zones.shape
+        region = self.zones[
+            max(row0 - margin, 0):min(row1 + margin, height),
+            max(col0 - margin, 0):min(col1 + margin, width),
+        ]
+        return np.unique(region[region >= 0])
+
+
+def pvs_key(rows):
+    """Cache name of a map's PVS, changes with the map or the algorithm"""
+    digest = hashlib.sha1("\n".join(rows).encode()).hexdigest()[:16]
+    return f"pvs-{PVS_VERSION}-{digest}"
+
+
+def build_pvs(level):
+    """(zones, visible, room_count) computed for a Level"""
+    marked = np.zeros(level.walls.shape, dtype=bool)
+    for row, line in enumerate(level.rows):
+        for col, char in enumerate(line):
+            marked[row, col] = char == "D"
+    zones, room_count = find_zones(level.walls, marked)
+    return zones, zone_visibility(zones), room_count
+
+
+def level_pvs(level, directory=PVS_DIR):
+    """The PotentiallyVisibleSet of a Level, from the cache or built and cached"""
+    path = os.path.join(directory, pvs_key(level.rows) + ".npz")
+    if os.path.exists(path):
+        with np.load(path) as data:
+            zones, visible, room_count = data["zones"], data["visible"], int(data["room_count"])
+    else:
+        start = time.perf_counter()
+        zones, visible, room_count = build_pvs(level)
+        os.makedirs(directory, exist_ok=True)
+        # Write next to the target and rename, so a half-written cache is never read
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, zones=zones, visible=visible, room_count=room_count)
+        os.replace(temp_path, path)
+        print(
+            f"[PVS] {room_count} rooms and {len(visible) - room_count} doorways in "
+            f"{time.perf_counter() - start:.2f} s, cached in {path}"
+        )
+    return PotentiallyVisibleSet(zones, visible, room_count, level.origin, level.tile_size)
@@ -1,31 +1,55 @@
 import math
 
+from EntityStore import ENTITIES, component
+
 class Player:
-    def __init__(self):
-        self.pos = [0, 0.5, 0]  # Lowered Y position to be just above floor
-        self.rot = [0, 0, 0]
-        self.speed = 0.3
+    """View of the player entity, position and rotation live in an EntityStore"""
+
+    pos = component("positions")
+    prev_pos = component("prev_positions")  # Position at the start of the last simulation step
+    rot = component("rotations")
+
+    def __init__(self, store=ENTITIES):
+        self.store = store
+        self.id = store.create((0, 0.5, 0), "player")  # Lowered Y position to be just above floor
+        self.speed = 18.0  # Units per second
+        self.radius = 0.3  # Collision circle, keeps the near plane out of walls
+        self.collision = None  # CollisionGrid to move through, free movement if None
         self.mouse_sensitivity = 0.5
-        
-    def move(self, dx, dz):
+
+    def snap(self):
+        """Skip interpolation after the position was set directly"""
+        self.prev_pos = self.pos
+
+    def render_pos(self, alpha):
+        """Position interpolated between the last two simulation steps"""
+        return self.store.interpolated(alpha, self.id)
+
+    def move(self, dx, dz, dt):
         # Convert rotation to radians (negative because OpenGL uses clockwise rotation)
         angle = math.radians(-self.rot[1])
-        
+
         # Calculate movement vector
-        move_x = (dx * math.cos(angle) + dz * math.sin(angle)) * self.speed
-        move_z = (-dx * math.sin(angle) + dz * math.cos(angle)) * self.speed
-        
-        # Calculate new position
-        new_x = self.pos[0] + move_x
-        new_z = self.pos[2] + move_z
-        
-        # Wall collision check (room is 10x10)
-        room_limit = 4.5  # Slightly less than room size/2 to prevent wall clipping
-        if abs(new_x) < room_limit:
-            self.pos[0] = new_x
-        if abs(new_z) < room_limit:
-            self.pos[2] = new_z
+        move_x = (dx * math.cos(angle) + dz * math.sin(angle)) * self.speed * dt
+        move_z = (-dx * math.sin(angle) + dz * math.cos(angle)) * self.speed * dt
+
+        self.move_by(move_x, move_z)
+
+    def move_by(self, move_x, move_z):
+        """Move in world space, stopping at and sliding along walls and objects"""
+        if self.collision is None:
+            self.pos[0] += move_x
+            self.pos[2] += move_z
+            return
+        self.pos[0], self.pos[2] = self.collision.move(
+            self.pos[0], self.pos[2], move_x, move_z, self.radius
+        )
+
+    def forward(self):
+        """Unit XZ vector the player is facing"""
+        angle = math.radians(self.rot[1])
+        return math.sin(angle), -math.cos(angle)
 
     def update_rotation(self, dx, dy):
         # Multiply mouse movement by sensitivity for faster turning
-        self.rot[1] += dx * self.mouse_sensitivity
\ No newline at end of file
+        self.rot[1] += dx * self.mouse_sensitivity
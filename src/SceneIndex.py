@@ -0,0 +1,138 @@
+import math
+
+import numpy as np
+
+
+class Frustum:
+    """Six clip planes extracted from a projection @ view matrix"""
+
+    def __init__(self, matrix):
+        m = np.asarray(matrix, dtype=np.float64)
+        planes = np.array([
+            m[3] + m[0], m[3] - m[0],  # Left, right
+            m[3] + m[1], m[3] - m[1],  # Bottom, top
+            m[3] + m[2], m[3] - m[2],  # Near, far
+        ])
+        planes /= np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+        self.planes = planes
+        self.matrix = m
+
+    def intersects(self, lo, hi):
+        """Conservative AABB test, true unless the box is fully outside a plane"""
+        normals = self.planes[:, :3]
+        # Corner of the box furthest along each plane normal
+        corner = np.where(normals >= 0, hi, lo)
+        return bool(np.all(np.einsum("ij,ij->i", normals, corner) + self.planes[:, 3] >= 0))
+
+    def xz_bounds(self):
+        """(min_x, min_z, max_x, max_z) around the eight frustum corners"""
+        corners = np.array(
+            [(x, y, z, 1) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=np.float64
+        )
+        world = corners @ np.linalg.inv(self.matrix).T
+        world = world[:, :3] / world[:, 3:]
+        return world[:, 0].min(), world[:, 2].min(), world[:, 0].max(), world[:, 2].max()
+
+
+class SceneIndex:
+    """Uniform grid over the XZ plane holding axis-aligned bounding boxes.
+
+    Entries are registered under every cell their box overlaps. A frustum
+    query only visits cells under the frustum's footprint and skips whole
+    cells whose bounds are outside it, so its cost follows what is on
+    screen rather than how many objects exist.
+    """
+
+    def __init__(self, cell_size=4.0):
+        self.cell_size = cell_size
+        self.entries = {}  # key -> (lo, hi, cells)
+        self.cells = {}  # (cx, cz) -> set of keys
+
+    def cell_of(self, x, z):
+        return (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+
+    def cell_range(self, lo, hi):
+        cx0, cz0 = self.cell_of(lo[0], lo[2])
+        cx1, cz1 = self.cell_of(hi[0], hi[2])
+        return [(cx, cz) for cx in range(cx0, cx1 + 1) for cz in range(cz0, cz1 + 1)]
+
+    def insert(self, key, lo, hi):
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        cells = self.cell_range(lo, hi)
+        self.entries[key] = (lo, hi, cells)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        lo, hi, cells = self.entries.pop(key)
+        for cell in cells:
+            self.cells[cell].discard(key)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def update(self, key, lo, hi):
+        """Move an entry, cheap when it stays within the same cells"""
+        if key in self.entries:
+            old_lo, old_hi, cells = self.entries[key]
+            if np.array_equal(old_lo, lo) and np.array_equal(old_hi, hi):
+                return
+            self.remove(key)
+        self.insert(key, lo, hi)
+
+    def clear(self):
+        self.entries = {}
+        self.cells = {}
+
+    def query(self, frustum):
+        """Keys of every entry whose box intersects the frustum"""
+        min_x, min_z, max_x, max_z = frustum.xz_bounds()
+        cx0, cz0 = self.cell_of(min_x, min_z)
+        cx1, cz1 = self.cell_of(max_x, max_z)
+
+        # Walk whichever is smaller: the cells under the frustum or the occupied ones
+        if (cx1 - cx0 + 1) * (cz1 - cz0 + 1) < len(self.cells):
+            cells = [
+                (cx, cz) for cx in range(cx0, cx1 + 1) for cz in range(cz0, cz1 + 1)
+                if (cx, cz) in self.cells
+            ]
+        else:
+            cells = [
+                (cx, cz) for cx, cz in self.cells if cx0 <= cx <= cx1 and cz0 <= cz <= cz1
+            ]
+
+        visible = set()
+        tested = set()
+        for cx, cz in cells:
+            keys = self.cells[(cx, cz)]
+            y_lo = min(self.entries[key][0][1] for key in keys)
+            y_hi = max(self.entries[key][1][1] for key in keys)
+            cell_lo = (cx * self.cell_size, y_lo, cz * self.cell_size)
+            cell_hi = ((cx + 1) * self.cell_size, y_hi, (cz + 1) * self.cell_size)
+            if not frustum.intersects(cell_lo, cell_hi):
+                continue
+            for key in keys:
+                if key in tested:
+                    continue
+                tested.add(key)
+                lo, hi, _ = self.entries[key]
+                if frustum.intersects(lo, hi):
+                    visible.add(key)
+        return visible
+
+    def query_radius(self, x, z, radius):
+        """Keys of every entry whose box comes within `radius` of (x, z) on the XZ plane"""
+        cx0, cz0 = self.cell_of(x - radius, z - radius)
+        cx1, cz1 = self.cell_of(x + radius, z + radius)
+        found = set()
+        for cx in range(cx0, cx1 + 1):
+            for cz in range(cz0, cz1 + 1):
+                for key in self.cells.get((cx, cz), ()):
+                    if key in found:
+                        continue
+                    lo, hi, _ = self.entries[key]
+                    dx = max(lo[0] - x, 0.0, x - hi[0])
+                    dz = max(lo[2] - z, 0.0, z - hi[2])
+                    if dx * dx + dz * dz <= radius * radius:
+                        found.add(key)
+        return found
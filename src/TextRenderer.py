@@ -0,0 +1,227 @@
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+from OpenGL.GL import *
+
+from AssetPack import get_asset_pack
+from GLState import get_gl_state
+
+_fonts = {}
+
+
+def get_font(size, name=None):
+    """Shared pygame font cache, so every screen reuses the same Font objects"""
+    key = (name, size)
+    if key not in _fonts:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        _fonts[key] = pygame.font.Font(name, size)
+    return _fonts[key]
+
+
+class GlyphAtlas:
+    """Rasterizes each glyph of a font once into a single texture.
+
+    A `packed` (pixels, meta) pair from the AssetPack replaces the initial
+    rasterization, the surface is only recreated if a glyph outside it is
+    ever needed.
+    """
+
+    def __init__(self, font, size=512, packed=None):
+        self.font = font
+        self.size = size
+        self.line_height = font.get_linesize()
+        self.texture = None
+        self.dirty = True
+        if packed is not None:
+            pixels, meta = packed
+            self.packed_pixels = pixels
+            self.surface = None
+            self.glyphs = {char: tuple(glyph) for char, glyph in meta["glyphs"].items()}
+            self.cursor = list(meta["cursor"])
+            return
+        self.packed_pixels = None
+        self.glyphs = {}  # char -> (advance, width, height, u0, v0, u1, v1)
+        self.surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        self.cursor = [1, 1]  # Next free slot, glyphs are packed in rows
+        for code in range(32, 127):
+            self.add_glyph(chr(code))
+
+    def add_glyph(self, char):
+        if self.surface is None:
+            # Blitting needs a surface of our own, the packed pixels are read-only
+            data = self.packed_pixels.tobytes()
+            self.surface = pygame.image.fromstring(data, (self.size, self.size), "RGBA")
+            self.packed_pixels = None
+        glyph_surface = self.font.render(char, True, (255, 255, 255))
+        width, height = glyph_surface.get_size()
+        x, y = self.cursor
+        if x + width + 1 > self.size:
+            x, y = 1, y + self.line_height + 1
+        if y + height + 1 > self.size:
+            # Atlas is full, fall back to a glyph we already have
+            self.glyphs[char] = self.glyphs["?"]
+            return
+        self.surface.blit(glyph_surface, (x, y))
+        self.cursor = [x + width + 1, y]
+        self.glyphs[char] = (
+            width, width, height,
+            x / self.size, y / self.size, (x + width) / self.size, (y + height) / self.size,
+        )
+        self.dirty = True
+
+    def glyph(self, char):
+        if char not in self.glyphs:
+            self.add_glyph(char)
+        return self.glyphs[char]
+
+    def text_width(self, text):
+        return sum(self.glyph(char)[0] for char in text)
+
+    def pixels(self):
+        """(size, size, 4) uint8 RGBA of the atlas, top row first"""
+        if self.surface is None:
+            return self.packed_pixels
+        data = pygame.image.tostring(self.surface, "RGBA")
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.size, self.size, 4)
+
+    def bind(self):
+        if self.texture is None:
+            self.texture = glGenTextures(1)
+            get_gl_state().bind_texture(self.texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        get_gl_state().bind_texture(self.texture)
+        if self.dirty:
+            # Only happens at startup or when a new character shows up
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.size, self.size, 0, GL_RGBA, GL_UNSIGNED_BYTE, self.pixels())
+            self.dirty = False
+
+    def release(self):
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+            get_gl_state().forget_texture(self.texture)
+            self.texture = None
+            self.dirty = True
+
+
+class TextRenderer:
+    """Draws text as textured quads out of a GlyphAtlas.
+
+    Word wrapping and the resulting quad arrays are cached by (text, width),
+    so drawing a block of text that did not change is a single glDrawArrays.
+    Through a CoreRenderer each cached layout also keeps its own vertex
+    buffers, uploaded when the layout is first drawn.
+    """
+
+    def __init__(self, font, cache_size=256, packed=None):
+        self.atlas = GlyphAtlas(font, packed=packed)
+        self.line_height = self.atlas.line_height
+        self.cache_size = cache_size
+        self.layouts = OrderedDict()  # (text, max_width) -> (positions, texcoords)
+        self.meshes = OrderedDict()  # (text, max_width) -> CoreMesh of the layout
+
+    def wrap(self, text, max_width):
+        """Split text into lines no wider than max_width pixels"""
+        if max_width is None:
+            return [text]
+        lines = []
+        current_line = []
+        current_width = 0
+        for word in text.split():
+            word_width = self.atlas.text_width(word + " ")
+            if current_width + word_width <= max_width or not current_line:
+                current_line.append(word)
+                current_width += word_width
+            else:
+                lines.append(" ".join(current_line))
+                current_line = [word]
+                current_width = word_width
+        if current_line:
+            lines.append(" ".join(current_line))
+        return lines
+
+    def layout(self, text, max_width=None):
+        """Quad arrays for `text` with its top-left corner at the origin"""
+        key = (text, max_width)
+        if key in self.layouts:
+            self.layouts.move_to_end(key)
+            return self.layouts[key]
+
+        positions = []
+        texcoords = []
+        for row, line in enumerate(self.wrap(text, max_width)):
+            x = 0
+            y = row * self.line_height
+            for char in line:
+                advance, w, h, u0, v0, u1, v1 = self.atlas.glyph(char)
+                if char != " ":
+                    positions += [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+                    texcoords += [(u0, v0), (u1, v0), (u1, v1), (u0, v1)]
+                x += advance
+
+        layout = (
+            np.array(positions, dtype=np.float32).reshape(-1, 2),
+            np.array(texcoords, dtype=np.float32).reshape(-1, 2),
+        )
+        self.layouts[key] = layout
+        if len(self.layouts) > self.cache_size:
+            self.layouts.popitem(last=False)
+        return layout
+
+    def mesh(self, text, max_width, renderer):
+        """The layout's quads in GL buffers of `renderer`, uploaded once"""
+        key = (text, max_width)
+        if key in self.meshes:
+            self.meshes.move_to_end(key)
+            return self.meshes[key]
+
+        mesh = renderer.quad_mesh(*self.layout(text, max_width))
+        self.meshes[key] = mesh
+        if len(self.meshes) > self.cache_size:
+            self.meshes.popitem(last=False)[1].release()
+        return mesh
+
+    def measure(self, text, max_width=None):
+        """Height in pixels of the wrapped text"""
+        return len(self.wrap(text, max_width)) * self.line_height
+
+    def draw(self, text, x, y, max_width=None, color=(1, 1, 1, 1), renderer=None):
+        """Draw text at (x, y), expects a top-left origin ortho projection
+        with GL_TEXTURE_2D and blending enabled (or CoreRenderer.begin_ui()
+        when drawing through `renderer`)"""
+        positions, texcoords = self.layout(text, max_width)
+        if not len(positions):
+            return
+        self.atlas.bind()
+        if renderer is not None:
+            renderer.draw_ui_mesh(self.mesh(text, max_width, renderer), self.atlas.texture, color, (x, y))
+            return
+        get_gl_state().color(*color)
+        glPushMatrix()
+        glTranslatef(x, y, 0)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, positions)
+        glTexCoordPointer(2, GL_FLOAT, 0, texcoords)
+        glDrawArrays(GL_QUADS, 0, len(positions))
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glPopMatrix()
+
+
+_renderers = {}
+
+
+def get_text_renderer(size, name=None):
+    """Shared TextRenderer per font, so glyph atlases are built only once.
+    Atlases of the default font are mapped from the AssetPack when baked."""
+    key = (name, size)
+    if key not in _renderers:
+        pack = get_asset_pack()
+        packed = None
+        if name is None and pack is not None and f"glyphs/{size}" in pack:
+            packed = pack.array(f"glyphs/{size}"), pack.meta(f"glyphs/{size}")
+        _renderers[key] = TextRenderer(get_font(size, name), packed=packed)
+    return _renderers[key]
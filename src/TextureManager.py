@@ -0,0 +1,218 @@
+import math
+import os
+
+import numpy as np
+import pygame
+from OpenGL.GL import *
+from OpenGL.GLU import gluBuild2DMipmaps
+
+from AssetPack import get_asset_pack
+from Constants import TEXTURE_DIR
+from GLState import get_gl_state
+
+
+def surface_pixels(surface):
+    """(height, width, 4) uint8 RGBA copy of a pygame surface, top row first"""
+    width, height = surface.get_size()
+    if surface.get_flags() & pygame.SRCALPHA:
+        data = pygame.image.tostring(surface, "RGBA")
+        return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)
+    # Without per-pixel alpha the "RGBA" alpha bytes are not reliable, make it opaque
+    data = pygame.image.tostring(surface, "RGB")
+    rgb = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+    return np.dstack((rgb, np.full((height, width), 255, dtype=np.uint8)))
+
+
+def next_power_of_two(n):
+    return 2 ** max(math.ceil(math.log2(max(n, 1))), 0)
+
+
+def mip_chain(pixels, levels):
+    """Box-filtered mip levels 1..levels of a power-of-two RGBA array"""
+    chain = []
+    for _ in range(levels):
+        height, width = pixels.shape[:2]
+        if height == 1 and width == 1:
+            break
+        blocks = pixels.reshape(max(height // 2, 1), min(height, 2), max(width // 2, 1), min(width, 2), 4)
+        pixels = (blocks.astype(np.uint16).sum(axis=(1, 3)) + 2) // (blocks.shape[1] * blocks.shape[3])
+        pixels = pixels.astype(np.uint8)
+        chain.append(pixels)
+    return chain
+
+
+def upload_mipmapped(pixels, max_level=1000, mips=None):
+    """Upload an RGBA array into the bound texture with a full mip chain.
+
+    `mips` are precomputed levels 1..max_level (see mip_chain), uploaded as
+    they are instead of having the driver generate them.
+    """
+    height, width = pixels.shape[:2]
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, max_level if mips is None else len(mips))
+    data = np.ascontiguousarray(pixels)
+    if mips is not None:
+        for level, image in enumerate([data] + list(mips)):
+            height, width = image.shape[:2]
+            glTexImage2D(GL_TEXTURE_2D, level, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, image)
+    elif bool(glGenerateMipmap):
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+        glGenerateMipmap(GL_TEXTURE_2D)
+    else:
+        gluBuild2DMipmaps(GL_TEXTURE_2D, GL_RGBA, width, height, GL_RGBA, GL_UNSIGNED_BYTE, data)
+
+
+def atlas_key(names, padding=8):
+    """Name of the atlas of these images in an AssetPack"""
+    return f"atlas/{'+'.join(sorted(names))}/{padding}"
+
+
+def align_to_padding(n, padding):
+    """Round up to a multiple of the padding, so slots line up with coarse mip texels"""
+    return -(-n // padding) * padding if padding else n
+
+
+def pack_atlas(images, padding=8, max_size=4096):
+    """Pack {name: RGBA array} into one image, returns (pixels, uv_rects).
+
+    Shelf packing, tallest first, into a power-of-two wide enough for the
+    widest image and roughly square overall. See TextureAtlas for padding.
+    """
+    slot_sizes = {
+        name: tuple(align_to_padding(n + 2 * padding, padding) for n in image.shape[:2])
+        for name, image in images.items()
+    }
+    widest = max(w for h, w in slot_sizes.values())
+    area = sum(h * w for h, w in slot_sizes.values())
+    width = next_power_of_two(max(widest, math.sqrt(area)))
+    slots = {}
+    x = y = shelf_height = 0
+    for name in sorted(images, key=lambda name: slot_sizes[name][0], reverse=True):
+        h, w = slot_sizes[name]
+        if x + w > width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        slots[name] = (x, y)
+        x += w
+        shelf_height = max(shelf_height, h)
+    height = next_power_of_two(y + shelf_height)
+    if max(width, height) > max_size:
+        raise ValueError(f"Textures do not fit in a {max_size}x{max_size} atlas")
+
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    uv_rects = {}
+    for name, (x, y) in slots.items():
+        image = images[name]
+        h, w = image.shape[:2]
+        padded = np.pad(image, ((padding, padding), (padding, padding), (0, 0)), mode="edge")
+        pixels[y:y + h + 2 * padding, x:x + w + 2 * padding] = padded
+        x0, y0 = x + padding, y + padding
+        uv_rects[name] = (x0 / width, y0 / height, (x0 + w) / width, (y0 + h) / height)
+    return pixels, uv_rects
+
+
+class TextureAtlas:
+    """Several textures packed into one mipmapped GL texture.
+
+    Each texture gets `padding` pixels of its own edge pixels around it, and
+    slots are aligned to the padding, so mip levels up to log2(padding)
+    never blend neighbouring textures. `uv_rects` maps each name to its
+    (u0, v0, u1, v1) with v growing downwards from the top row. They are
+    known as soon as the atlas is packed, the GL texture is only created by
+    the first bind(). Mip levels baked into an AssetPack are passed as
+    `mips`, otherwise the driver generates them.
+    """
+
+    def __init__(self, pixels, uv_rects, padding=8, mips=None):
+        self.pixels = pixels  # (height, width, 4) from pack_atlas or an AssetPack
+        self.uv_rects = {name: tuple(rect) for name, rect in uv_rects.items()}
+        self.padding = padding
+        self.max_level = int(math.log2(padding)) if padding else 0
+        self.mips = mips
+        self.size = (pixels.shape[1], pixels.shape[0])
+        self.texture = None
+
+    def bind(self):
+        if self.texture is None:
+            self.texture = glGenTextures(1)
+            get_gl_state().bind_texture(self.texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            upload_mipmapped(self.pixels, self.max_level, self.mips)
+        get_gl_state().bind_texture(self.texture)
+
+    def release(self):
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+            get_gl_state().forget_texture(self.texture)
+            self.texture = None
+
+
+class TextureManager:
+    """Loads each texture once and hands out cached GL textures and atlases.
+
+    Pixels and atlases come straight from the AssetPack when there is one,
+    otherwise images are read from `directory` (what texture_generator.py
+    writes) and any that are missing are generated in memory instead.
+    """
+
+    def __init__(self, directory=TEXTURE_DIR, pack=None):
+        self.directory = directory
+        self.pack = get_asset_pack() if pack is None else pack
+        self.surfaces = {}  # name -> pygame Surface
+        self.textures = {}  # name -> GL texture of its own
+        self.atlases = {}  # tuple of names -> TextureAtlas
+
+    def surface(self, name):
+        if name not in self.surfaces:
+            path = os.path.join(self.directory, f"{name}.png")
+            if os.path.exists(path):
+                self.surfaces[name] = pygame.image.load(path)
+            else:
+                from texture_generator import generate_textures
+
+                generated = generate_textures()
+                if name not in generated:
+                    raise KeyError(f"No texture named {name!r}")
+                print(f"[TextureManager] {path} not found, using the generated {name} texture")
+                self.surfaces[name] = generated[name]
+        return self.surfaces[name]
+
+    def pixels(self, name):
+        """(height, width, 4) uint8 RGBA of an image, mapped from the pack if possible"""
+        key = f"texture/{name}"
+        if self.pack is not None and key in self.pack:
+            return self.pack.array(key)
+        return surface_pixels(self.surface(name))
+
+    def texture(self, name):
+        """GL texture (with mipmaps) holding one image on its own"""
+        if name not in self.textures:
+            texture = glGenTextures(1)
+            get_gl_state().bind_texture(texture)
+            upload_mipmapped(self.pixels(name))
+            self.textures[name] = texture
+        return self.textures[name]
+
+    def atlas(self, names, padding=8):
+        """TextureAtlas packing the given images, built once per set of names"""
+        key = tuple(sorted(names))
+        if key not in self.atlases:
+            pack_key = atlas_key(key, padding)
+            if self.pack is not None and pack_key in self.pack:
+                meta = self.pack.meta(pack_key)
+                mips = [self.pack.array(f"{pack_key}/mip{level}") for level in range(1, meta["levels"] + 1)]
+                atlas = TextureAtlas(self.pack.array(pack_key), meta["uv_rects"], padding, mips)
+            else:
+                atlas = TextureAtlas(*pack_atlas({name: self.pixels(name) for name in key}, padding), padding)
+            self.atlases[key] = atlas
+        return self.atlases[key]
+
+    def release(self):
+        if self.textures:
+            glDeleteTextures(list(self.textures.values()))
+            for texture in self.textures.values():
+                get_gl_state().forget_texture(texture)
+            self.textures = {}
+        for atlas in self.atlases.values():
+            atlas.release()
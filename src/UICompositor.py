@@ -0,0 +1,77 @@
+import pygame
+from OpenGL.GL import *
+
+from GLState import get_gl_state
+
+
+class UICompositor:
+    """A pygame-drawn 2D layer as one texture covering part of the window.
+
+    set_background() draws the surface, it is uploaded on the next draw and
+    then only drawn as a textured quad until set_background() is called
+    again, so frames upload nothing. Text goes on top from the glyph atlas
+    (TextRenderer), markers and other changing parts are drawn as quads.
+    """
+
+    def __init__(self, x, y, width, height):
+        self.rect = pygame.Rect(x, y, width, height)  # Window space, origin top-left
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.dirty = True
+        self.texture = None
+
+    def set_background(self, draw_fn):
+        """Redraw the layer with draw_fn(surface)"""
+        self.surface.fill((0, 0, 0, 0))
+        draw_fn(self.surface)
+        self.dirty = True
+
+    def create_texture(self):
+        self.texture = glGenTextures(1)
+        get_gl_state().bind_texture(self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexImage2D(
+            GL_TEXTURE_2D, 0, GL_RGBA, self.rect.width, self.rect.height, 0,
+            GL_RGBA, GL_UNSIGNED_BYTE, None,
+        )
+        self.dirty = True
+
+    def release(self):
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+            get_gl_state().forget_texture(self.texture)
+            self.texture = None
+
+    def flush(self):
+        """Upload the surface if it was redrawn since the last upload"""
+        if self.texture is None:
+            self.create_texture()
+        if not self.dirty:
+            return
+        texture_data = pygame.image.tostring(self.surface, "RGBA")
+        get_gl_state().bind_texture(self.texture)
+        glTexSubImage2D(
+            GL_TEXTURE_2D, 0, 0, 0, self.rect.width, self.rect.height,
+            GL_RGBA, GL_UNSIGNED_BYTE, texture_data,
+        )
+        self.dirty = False
+
+    def draw(self, renderer=None):
+        """Draw the texture as a quad, expects a top-left origin ortho projection
+        (or CoreRenderer.begin_ui() when drawing through `renderer`)"""
+        self.flush()
+        x, y, w, h = self.rect
+        if renderer is not None:
+            renderer.draw_rect(self.texture, x, y, w, h)
+            return
+        get_gl_state().bind_texture(self.texture)
+        glBegin(GL_QUADS)
+        glTexCoord2f(0, 0)
+        glVertex2f(x, y)
+        glTexCoord2f(1, 0)
+        glVertex2f(x + w, y)
+        glTexCoord2f(1, 1)
+        glVertex2f(x + w, y + h)
+        glTexCoord2f(0, 1)
+        glVertex2f(x, y + h)
+        glEnd()
@@ -3,11 +3,34 @@ import math
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
-from utils import draw_cube
+from ChunkStreamer import ChunkStreamer
+from Constants import (
+    CHUNK_LOAD_RADIUS, CHUNK_SIZE, CHUNK_UNLOAD_RADIUS, CHUNK_UPLOAD_BUDGET, GAME_MAP,
+    MAX_RESIDENT_CHUNKS
+)
+from GLState import get_gl_state
+from Level import Level
+from lighting import bake_batches
+from mesh_builder import (
+    MeshBuilder, batch_bounds, compile_batches, delete_display_lists, merge_batches
+)
+from PVS import level_pvs
+from SceneIndex import SceneIndex
+
+# Booth partition walls around a desk: (offset, rotation about Y, scale)
+PARTITION_WALLS = [
+    ((0, 0, 0), 0, (0.05, 1.0, 1.0)),  # Back wall (thinner, normal height, shorter length)
+    ((0, 0, 0.5), 90, (0.05, 1.0, 0.8)),  # Side wall, moved closer
+]
+
+# Level materials drawn textured, and the TextureManager image of each
+LEVEL_TEXTURES = {'floor': 'floor', 'walls': 'wall'}
+
 
 class World:
-    def __init__(self):
-        self.size = 5
+    def __init__(self, level=None, textures=None, renderer=None):
+        self.level = level if level is not None else Level(GAME_MAP)
+        self.renderer = renderer  # CoreRenderer, or None for fixed-function display lists
         # Define office furniture colors
         self.colors = {
             'floor': (0.76, 0.6, 0.42),  # Light wood color
@@ -15,90 +38,181 @@ class World:
             'desk': (0.6, 0.4, 0.2),  # Brown wood
             'chair': (0.2, 0.2, 0.2),  # Dark grey
             'computer': (0.1, 0.1, 0.1),  # Black
+            'pot': (0.4, 0.2, 0.1),  # Brown plant pot
             'plant': (0.2, 0.5, 0.2),  # Green
             'partition': (0.3, 0.3, 0.3)  # Darker solid gray for booth walls
         }
-        
-    def draw_desk(self, x, z, rotation=0):
-        glPushMatrix()
-        glTranslatef(x, 0, z)  # Start at floor level
-        glRotatef(rotation, 0, 1, 0)
-        
+
+        # Level materials drawn with a texture from a TextureManager, all packed
+        # into one atlas so the level needs a single bind per frame
+        self.textured = dict(LEVEL_TEXTURES) if textures is not None else {}
+        self.atlas = textures.atlas(self.textured.values()) if self.textured else None
+        self.uv_rects = {}  # material -> (u0, v0, u1, v1) in the atlas
+        if self.atlas is not None:
+            for material, texture in self.textured.items():
+                self.colors[material] = (1.0, 1.0, 1.0)  # The texture carries the color
+                self.uv_rects[material] = self.atlas.uv_rects[texture]
+
+        # Office layout, in a more realistic arrangement
+        self.desks = [
+            (-4, -2, 90),  # HR Area (left side)
+            (4, 1, -90),  # CEO Area (right side)
+        ]
+        self.chairs = [(-3.5, -2, 90), (3.5, 1, -90)]
+        self.partitions = [(-4, -2), (4, 1)]  # Booth walls for HR and CEO
+        self.plants = [(-4.5, -4.5), (4.5, -4.5), (-4.5, 4.5), (4.5, 4.5)]
+
+        # Static geometry is split into CHUNK_SIZE grid cells, each compiled into
+        # one display list per material with its lighting baked in. Chunks
+        # are built on a background thread and only those near the player
+        # stay resident, the index culls whole resident chunks
+        self.index = SceneIndex(cell_size=CHUNK_SIZE)
+        self.layout = {}  # cell -> [(build_fn, args)] of the furniture in it
+        self.streamer = ChunkStreamer(
+            self.build_chunk, self.upload_chunk, self.release_chunk,
+            CHUNK_SIZE, self.chunk_extent(),
+            CHUNK_LOAD_RADIUS, CHUNK_UNLOAD_RADIUS, MAX_RESIDENT_CHUNKS, CHUNK_UPLOAD_BUDGET,
+        )
+        self.dirty = True
+
+        # Rooms and doorways of the level and which of them see each other,
+        # each resident chunk remembers the zones it touches
+        self.pvs = level_pvs(self.level)
+        self.chunk_zones = {}  # cell -> zone indices
+        self.visible_cells = {}  # eye zone -> frozenset of cells, reset on streaming
+
+    def invalidate(self):
+        """Mark the static geometry as stale, call after changing the layout"""
+        self.dirty = True
+
+    @property
+    def settled(self):
+        """Whether update() has no chunks left to build or upload"""
+        return not self.dirty and not self.streamer.loading
+
+    def chunk_extent(self):
+        min_x, min_z, max_x, max_z = self.level.bounds()
+        return (
+            math.floor(min_x / CHUNK_SIZE), math.floor(min_z / CHUNK_SIZE),
+            math.floor(max_x / CHUNK_SIZE), math.floor(max_z / CHUNK_SIZE),
+        )
+
+    def group_layout(self):
+        """Assign every piece of furniture to the chunk it stands in"""
+        objects = [(self.draw_desk, desk) for desk in self.desks]
+        objects += [(self.draw_chair, chair) for chair in self.chairs]
+        objects += [(self.draw_partition_walls, partition) for partition in self.partitions]
+        objects += [(self.draw_plant, plant) for plant in self.plants]
+        layout = {}
+        for draw_fn, args in objects:
+            cell = self.index.cell_of(args[0], args[1])
+            layout.setdefault(cell, []).append((draw_fn, args))
+        return layout
+
+    def build_chunk(self, cell):
+        """{material: MeshBatch} of one chunk with baked lighting, runs on the streaming thread"""
+        x0, z0 = cell[0] * CHUNK_SIZE, cell[1] * CHUNK_SIZE
+        tiles = self.level.tiles_in(x0, z0, x0 + CHUNK_SIZE, z0 + CHUNK_SIZE)
+        # CoreRenderer repeats textures inside the atlas, display lists cannot
+        repeat = self.renderer is not None
+        objects = [self.level.compile_region(*tiles, self.colors, self.uv_rects, repeat)]
+        for draw_fn, args in self.layout.get(cell, ()):
+            builder = MeshBuilder()
+            draw_fn(builder, *args)
+            objects.append(builder.build())
+        return bake_batches(merge_batches(objects))
+
+    def upload_chunk(self, cell, batches):
+        if not batches:
+            return {}
+        lo, hi = batch_bounds(batches)
+        self.index.insert(cell, lo, hi)
+        # One tile of margin takes in the rooms on both sides of a wall
+        self.chunk_zones[cell] = self.pvs.zones_in(*self.level.tiles_in(lo[0], lo[2], hi[0], hi[2]))
+        self.visible_cells.clear()
+        if self.renderer is not None:
+            return self.renderer.upload_batches(batches)
+        return compile_batches(batches)
+
+    def release_chunk(self, cell, lists):
+        if lists:
+            self.index.remove(cell)
+            del self.chunk_zones[cell]
+            self.visible_cells.clear()
+            if self.renderer is not None:
+                self.renderer.release_meshes(lists)
+            else:
+                delete_display_lists(lists)
+
+    def update(self, pos):
+        """Stream chunks around `pos`, call once per frame before draw()"""
+        if self.dirty:
+            # Rebuild around the player right away, the rest streams in
+            self.streamer.clear()
+            self.layout = self.group_layout()
+            self.streamer.load(pos[0], pos[2])
+            self.dirty = False
+        self.streamer.update(pos[0], pos[2])
+
+    def draw_desk(self, b, x, z, rotation=0):
+        b.push_matrix()
+        b.translate(x, 0, z)  # Start at floor level
+        b.rotate(rotation, 0, 1, 0)
+
         # Desk top (reduced size)
-        glColor3f(*self.colors['desk'])
-        glBegin(GL_QUADS)
-        glVertex3f(-0.4, 0.4, -0.3)
-        glVertex3f(0.4, 0.4, -0.3)
-        glVertex3f(0.4, 0.4, 0.3)
-        glVertex3f(-0.4, 0.4, 0.3)
-        glEnd()
-        
+        b.set_material('desk', self.colors['desk'])
+        b.quad((-0.4, 0.4, 0.3), (0.4, 0.4, 0.3), (0.4, 0.4, -0.3), (-0.4, 0.4, -0.3))
+
         # Desk legs (adjusted for new height)
         for x_offset, z_offset in [(-0.35, -0.25), (0.35, -0.25), (-0.35, 0.25), (0.35, 0.25)]:
-            glBegin(GL_QUADS)
-            glVertex3f(x_offset-0.02, 0, z_offset-0.02)
-            glVertex3f(x_offset+0.02, 0, z_offset-0.02)
-            glVertex3f(x_offset+0.02, 0.4, z_offset-0.02)
-            glVertex3f(x_offset-0.02, 0.4, z_offset-0.02)
-            glEnd()
-        
+            b.quad(
+                (x_offset - 0.02, 0, z_offset - 0.02),
+                (x_offset + 0.02, 0, z_offset - 0.02),
+                (x_offset + 0.02, 0.4, z_offset - 0.02),
+                (x_offset - 0.02, 0.4, z_offset - 0.02),
+            )
+
         # Computer monitor (smaller)
-        glColor3f(*self.colors['computer'])
-        glTranslatef(-0.15, 0.4, 0)
-        glBegin(GL_QUADS)
-        glVertex3f(-0.1, 0, -0.05)
-        glVertex3f(0.1, 0, -0.05)
-        glVertex3f(0.1, 0.2, -0.05)
-        glVertex3f(-0.1, 0.2, -0.05)
-        glEnd()
-        
-        glPopMatrix()
-    
-    def draw_chair(self, x, z, rotation=0):
-        glPushMatrix()
-        glTranslatef(x, 0, z)
-        glRotatef(rotation, 0, 1, 0)
-        glColor3f(*self.colors['chair'])
-        
+        b.set_material('computer', self.colors['computer'])
+        b.translate(-0.15, 0.4, 0)
+        b.quad((-0.1, 0, -0.05), (0.1, 0, -0.05), (0.1, 0.2, -0.05), (-0.1, 0.2, -0.05))
+
+        b.pop_matrix()
+
+    def draw_chair(self, b, x, z, rotation=0):
+        b.push_matrix()
+        b.translate(x, 0, z)
+        b.rotate(rotation, 0, 1, 0)
+        b.set_material('chair', self.colors['chair'])
+
         # Seat (lowered and smaller)
-        glBegin(GL_QUADS)
-        glVertex3f(-0.15, 0.25, -0.15)
-        glVertex3f(0.15, 0.25, -0.15)
-        glVertex3f(0.15, 0.25, 0.15)
-        glVertex3f(-0.15, 0.25, 0.15)
-        glEnd()
-        
+        b.quad((-0.15, 0.25, 0.15), (0.15, 0.25, 0.15), (0.15, 0.25, -0.15), (-0.15, 0.25, -0.15))
+
         # Back (adjusted height)
-        glBegin(GL_QUADS)
-        glVertex3f(-0.15, 0.25, -0.15)
-        glVertex3f(0.15, 0.25, -0.15)
-        glVertex3f(0.15, 0.5, -0.15)
-        glVertex3f(-0.15, 0.5, -0.15)
-        glEnd()
-        
+        b.quad((-0.15, 0.25, -0.15), (0.15, 0.25, -0.15), (0.15, 0.5, -0.15), (-0.15, 0.5, -0.15))
+
         # Chair legs (adjusted height)
         for x_offset, z_offset in [(-0.12, -0.12), (0.12, -0.12), (-0.12, 0.12), (0.12, 0.12)]:
-            glBegin(GL_QUADS)
-            glVertex3f(x_offset-0.02, 0, z_offset-0.02)
-            glVertex3f(x_offset+0.02, 0, z_offset-0.02)
-            glVertex3f(x_offset+0.02, 0.25, z_offset-0.02)
-            glVertex3f(x_offset-0.02, 0.25, z_offset-0.02)
-            glEnd()
-            
-        glPopMatrix()
-    
-    def draw_plant(self, x, z):
-        glPushMatrix()
-        glTranslatef(x, 0, z)
-        
+            b.quad(
+                (x_offset - 0.02, 0, z_offset - 0.02),
+                (x_offset + 0.02, 0, z_offset - 0.02),
+                (x_offset + 0.02, 0.25, z_offset - 0.02),
+                (x_offset - 0.02, 0.25, z_offset - 0.02),
+            )
+
+        b.pop_matrix()
+
+    def draw_plant(self, b, x, z):
+        b.push_matrix()
+        b.translate(x, 0, z)
+
         # Plant pot (smaller)
-        glColor3f(0.4, 0.2, 0.1)  # Brown pot
+        b.set_material('pot', self.colors['pot'])
         pot_radius = 0.1
         pot_height = 0.15
         segments = 8
-        
-        # Draw the pot sides
-        glBegin(GL_QUADS)
+
+        # Pot sides
         for i in range(segments):
             angle1 = (i / segments) * 2 * math.pi
             angle2 = ((i + 1) / segments) * 2 * math.pi
@@ -106,105 +220,90 @@ class World:
             z1 = math.sin(angle1) * pot_radius
             x2 = math.cos(angle2) * pot_radius
             z2 = math.sin(angle2) * pot_radius
-            glVertex3f(x1, 0, z1)
-            glVertex3f(x2, 0, z2)
-            glVertex3f(x2, pot_height, z2)
-            glVertex3f(x1, pot_height, z1)
-        glEnd()
-        
+            b.quad((x2, 0, z2), (x1, 0, z1), (x1, pot_height, z1), (x2, pot_height, z2))
+
         # Plant leaves (smaller)
-        glColor3f(*self.colors['plant'])
-        glTranslatef(0, pot_height, 0)
+        b.set_material('plant', self.colors['plant'])
+        b.translate(0, pot_height, 0)
         leaf_size = 0.15
         num_leaves = 6
         for i in range(num_leaves):
             angle = (i / num_leaves) * 2 * math.pi
             x = math.cos(angle) * leaf_size
             z = math.sin(angle) * leaf_size
-            glBegin(GL_TRIANGLES)
-            glVertex3f(0, 0, 0)
-            glVertex3f(x, leaf_size, z)
-            glVertex3f(z, leaf_size/2, -x)
-            glEnd()
-        
-        glPopMatrix()
-        
-    def draw(self):
-        # Set material properties
-        glEnable(GL_COLOR_MATERIAL)
-        glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
-        
-        # Draw floor at Y=0
-        glBegin(GL_QUADS)
-        glColor3f(*self.colors['floor'])
-        glNormal3f(0, 1, 0)
-        glVertex3f(-self.size, 0, -self.size)
-        glVertex3f(-self.size, 0, self.size)
-        glVertex3f(self.size, 0, self.size)
-        glVertex3f(self.size, 0, -self.size)
-        glEnd()
-        
-        # Draw walls starting from floor level
-        glBegin(GL_QUADS)
-        glColor3f(*self.colors['walls'])
-        
-        # Front wall
-        glVertex3f(-self.size, 0, -self.size)
-        glVertex3f(self.size, 0, -self.size)
-        glVertex3f(self.size, 2, -self.size)
-        glVertex3f(-self.size, 2, -self.size)
-        
-        # Back wall
-        glVertex3f(-self.size, 0, self.size)
-        glVertex3f(self.size, 0, self.size)
-        glVertex3f(self.size, 2, self.size)
-        glVertex3f(-self.size, 2, self.size)
-        
-        # Left wall
-        glVertex3f(-self.size, 0, -self.size)
-        glVertex3f(-self.size, 0, self.size)
-        glVertex3f(-self.size, 2, self.size)
-        glVertex3f(-self.size, 2, -self.size)
-        
-        # Right wall
-        glVertex3f(self.size, 0, -self.size)
-        glVertex3f(self.size, 0, self.size)
-        glVertex3f(self.size, 2, self.size)
-        glVertex3f(self.size, 2, -self.size)
-        glEnd()
-        
-        # Draw office furniture in a more realistic arrangement
-        # HR Area (left side)
-        self.draw_desk(-4, -2, 90)
-        self.draw_chair(-3.5, -2, 90)
-        self.draw_partition_walls(-4, -2)  # Add booth walls for HR
-        
-        # CEO Area (right side)
-        self.draw_desk(4, 1, -90)
-        self.draw_chair(3.5, 1, -90)
-        self.draw_partition_walls(4, 1)  # Add booth walls for CEO
-        
-        # Plants in corners (moved closer to walls)
-        self.draw_plant(-4.5, -4.5)
-        self.draw_plant(4.5, -4.5)
-        self.draw_plant(-4.5, 4.5)
-        self.draw_plant(4.5, 4.5)
-
-    def draw_partition_walls(self, x, z):
-        """Draw booth partition walls - all surfaces in solid gray"""
-        glColor3f(0.3, 0.3, 0.3)  # Solid gray for all walls
-        
-        # Back wall (smaller and thinner)
-        glPushMatrix()
-        glTranslatef(x, 0, z)
-        glScalef(0.05, 1.0, 1.0)  # Thinner wall, normal height, shorter length
-        draw_cube()  # Replace glutSolidCube with draw_cube
-        glPopMatrix()
-        
-        # Side wall (smaller and thinner)
-        glPushMatrix()
-        glTranslatef(x, 0, z + 0.5)  # Moved closer
-        glRotatef(90, 0, 1, 0)
-        glScalef(0.05, 1.0, 0.8)  # Thinner wall, normal height, shorter length
-        draw_cube()  # Replace glutSolidCube with draw_cube
-        glPopMatrix()
+            b.triangle((0, 0, 0), (x, leaf_size, z), (z, leaf_size / 2, -x))
+
+        b.pop_matrix()
+
+    def draw_partition_walls(self, b, x, z):
+        """Booth partition walls - all surfaces in solid gray"""
+        for wall in PARTITION_WALLS:
+            self.draw_partition_wall(b, x, z, wall)
+
+    def draw_partition_wall(self, b, x, z, wall):
+        offset, rotation, size = wall
+        b.set_material('partition', self.colors['partition'])
+        b.push_matrix()
+        b.translate(x + offset[0], offset[1], z + offset[2])
+        b.rotate(rotation, 0, 1, 0)
+        b.scale(*size)
+        b.cube()
+        b.pop_matrix()
+
+    def collision_boxes(self):
+        """World-space (lo, hi) boxes around the furniture, one per solid piece"""
+        pieces = [(self.draw_desk, desk) for desk in self.desks]
+        pieces += [(self.draw_chair, chair) for chair in self.chairs]
+        pieces += [(self.draw_plant, plant) for plant in self.plants]
+        pieces += [
+            (self.draw_partition_wall, (x, z, wall))
+            for x, z in self.partitions for wall in PARTITION_WALLS
+        ]
+        boxes = []
+        for draw_fn, args in pieces:
+            builder = MeshBuilder()
+            draw_fn(builder, *args)
+            boxes.append(batch_bounds(builder.build()))
+        return boxes
+
+    def cells_visible_from(self, x, z):
+        """Resident chunks in a zone visible from (x, z), None if it is in no zone"""
+        zone = self.pvs.zone_at(x, z)
+        if zone < 0:
+            return None
+        cells = self.visible_cells.get(zone)
+        if cells is None:
+            mask = self.pvs.masks[zone]
+            cells = frozenset(cell for cell, zones in self.chunk_zones.items() if mask[zones].any())
+            self.visible_cells[zone] = cells
+        return cells
+
+    def draw(self, frustum=None, eye=None):
+        """Draw the resident chunks, only those inside `frustum` if given and
+        those in rooms the PVS says the (x, z) `eye` can see"""
+        state = get_gl_state()
+        if self.renderer is None:
+            # The light is baked into the vertex colors
+            state.disable(GL_LIGHTING)
+        if self.atlas is not None:
+            self.atlas.bind()
+
+        resident = self.streamer.resident
+        cells = list(resident) if frustum is None else self.index.query(frustum)
+        visible = None if eye is None else self.cells_visible_from(*eye)
+        if visible is not None:
+            cells = [cell for cell in cells if cell in visible]
+
+        # One call per material batch of each visible chunk
+        for cell in cells:
+            self.streamer.touch(cell)
+            if self.renderer is not None:
+                for material, mesh in resident[cell].items():
+                    self.renderer.draw_mesh(mesh, uv_rect=self.uv_rects.get(material, (0.0, 0.0, 1.0, 1.0)))
+            else:
+                for material, list_id in resident[cell].items():
+                    state.set_enabled(GL_TEXTURE_2D, material in self.uv_rects)
+                    glCallList(list_id)
+        if self.renderer is None:
+            # Vertex colors leave the current color undefined
+            state.invalidate("color")
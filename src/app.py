@@ -1,10 +1,13 @@
 # 3D Adventure Game Engine
+import argparse
 import os
 import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
-import Game3D
+from Constants import (
+    FAR_PLANE, FIELD_OF_VIEW, LIGHT_AMBIENT, LIGHT_DIFFUSE, LIGHT_POSITION, NEAR_PLANE
+)
 
 def initialize_pygame():
     """Configure Pygame with OpenGL settings"""
@@ -12,10 +15,17 @@ def initialize_pygame():
     pygame.init()
     return (800, 600)  # Default display dimensions
 
-def setup_opengl_context(display_size):
+def setup_opengl_context(display_size, core_profile=False):
     """Initialize OpenGL context with version and buffer settings"""
-    pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 2)
-    pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 1)
+    if core_profile:
+        # For CoreRenderer, forward compatible is required on macOS
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, pygame.GL_CONTEXT_PROFILE_CORE)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_FLAGS, pygame.GL_CONTEXT_FORWARD_COMPATIBLE_FLAG)
+    else:
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 2)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 1)
     return pygame.display.set_mode(display_size, DOUBLEBUF | OPENGL)
 
 def configure_3d_view(display_size):
@@ -23,7 +33,7 @@ def configure_3d_view(display_size):
     glEnable(GL_DEPTH_TEST)
     glMatrixMode(GL_PROJECTION)
     glLoadIdentity()
-    gluPerspective(45, (display_size[0] / display_size[1]), 0.1, 50.0)
+    gluPerspective(FIELD_OF_VIEW, (display_size[0] / display_size[1]), NEAR_PLANE, FAR_PLANE)
     glMatrixMode(GL_MODELVIEW)
     glTranslatef(0.0, 0.0, -5)  # Initial camera position
 
@@ -31,25 +41,59 @@ def setup_lighting():
     """Configure basic scene lighting"""
     glEnable(GL_LIGHTING)
     glEnable(GL_LIGHT0)
-    glLightfv(GL_LIGHT0, GL_POSITION, [0, 5, 5, 1])
-    glLightfv(GL_LIGHT0, GL_AMBIENT, [0.5, 0.5, 0.5, 1])
-    glLightfv(GL_LIGHT0, GL_DIFFUSE, [1.0, 1.0, 1.0, 1])
+    glLightfv(GL_LIGHT0, GL_POSITION, LIGHT_POSITION)
+    glLightfv(GL_LIGHT0, GL_AMBIENT, LIGHT_AMBIENT)
+    glLightfv(GL_LIGHT0, GL_DIFFUSE, LIGHT_DIFFUSE)
+    # NPC parts are drawn through glScalef, keep their normals unit length
+    glEnable(GL_NORMALIZE)
 
 def enable_transparency():
     """Enable alpha blending for transparent objects"""
     glEnable(GL_BLEND)
     glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Voice-based AI game")
+    parser.add_argument(
+        "--core-profile", action="store_true",
+        help="render through an OpenGL 3.3 core profile context with shaders (CoreRenderer)",
+    )
+    parser.add_argument(
+        "--dynamic-resolution", action="store_true",
+        help="render the 3D view offscreen at a scale that keeps frames within the FPS budget",
+    )
+    parser.add_argument(
+        "--count-gl-calls", action="store_true",
+        help="print how many GL calls each subsystem makes per frame (slows drawing down)",
+    )
+    return parser.parse_args(argv)
+
 def main():
     """Main game initialization and execution"""
+    args = parse_args()
     display_size = initialize_pygame()
-    screen = setup_opengl_context(display_size)
-    configure_3d_view(display_size)
-    setup_lighting()
-    enable_transparency()
+    screen = setup_opengl_context(display_size, args.core_profile)
+    renderer = None
+    if args.core_profile:
+        from CoreRenderer import CoreRenderer
+        renderer = CoreRenderer(display_size)
+    else:
+        configure_3d_view(display_size)
+        setup_lighting()
+        enable_transparency()
+    resolution = None
+    if args.dynamic_resolution:
+        from DynamicResolution import DynamicResolution
+        resolution = DynamicResolution(display_size)
     
-    # Initialize and run the game
-    adventure_game = Game3D.Game3D()
+    # Initialize and run the game (imported here so the GL setup helpers
+    # above can be used without the voice/AI dependencies)
+    import Game3D
+    gl_calls = None
+    if args.count_gl_calls:
+        from GLState import count_gl_calls
+        gl_calls = count_gl_calls()
+    adventure_game = Game3D.Game3D(renderer, resolution, gl_calls)
     adventure_game.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,400 @@
+"""Headless rendering benchmark for World, NPC and DialogueSystem drawing.
+
+Creates an offscreen GL context, builds a parameterized office scene and
+prints per-phase frame-time percentiles (milliseconds) as JSON:
+
+    python benchmark.py --desks 40 --npcs 200 --dialogue --frames 300
+    python benchmark.py --backend osmesa --output bench.json
+    python benchmark.py --renderer core --npcs 200
+    python benchmark.py --npcs 200 --dynamic-resolution --target-ms 16.7
+    python benchmark.py --dialogue --count-gl-calls
+    python benchmark.py --rooms 4 --desks 64 --npcs 200
+    python benchmark.py --rooms 4 --npcs 200 --minimap
+
+Backends: egl (surfaceless Mesa/llvmpipe, the default), osmesa, or pygame
+(a hidden window, e.g. under Xvfb).
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("egl", "osmesa", "pygame"), default="egl")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--desks", type=int, default=2, help="desks (each with a chair and booth)")
+    parser.add_argument("--npcs", type=int, default=2)
+    parser.add_argument("--dialogue", action="store_true", help="render with the dialogue box open")
+    parser.add_argument("--minimap", action="store_true", help="render the minimap overlay")
+    parser.add_argument("--npc-path", choices=("batched", "single"), default="batched",
+                        help="NPCRenderer (as in the game) or one recorded draw per NPC")
+    parser.add_argument("--renderer", choices=("fixed", "core"), default="fixed",
+                        help="fixed-function GL 2.1, or CoreRenderer on a GL 3.3 core profile")
+    parser.add_argument("--no-textures", action="store_true", help="flat colored level geometry")
+    parser.add_argument("--rooms", type=int, default=1,
+                        help="split the floor into a rooms x rooms grid joined by doorways")
+    parser.add_argument("--no-cull", action="store_true", help="disable frustum and PVS culling and LOD")
+    parser.add_argument("--dynamic-resolution", action="store_true",
+                        help="render the 3D pass offscreen, scaled to meet --target-ms")
+    parser.add_argument("--target-ms", type=float, default=1000.0 / 60,
+                        help="frame time target for --dynamic-resolution")
+    parser.add_argument("--count-gl-calls", action="store_true",
+                        help="report GL calls per frame and subsystem (adds overhead to the timings)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.renderer == "core" and args.backend == "osmesa":
+        parser.error("--renderer core needs the egl or pygame backend")
+    if args.renderer == "core" and args.npc_path == "single":
+        parser.error("--npc-path single draws in immediate mode, which the core profile lacks")
+    return args
+
+
+def create_context(backend, width, height, core_profile=False):
+    """Create and make current an offscreen GL context, returns a keep-alive handle.
+
+    `core_profile` asks for OpenGL 3.3 core instead of the default compatibility context.
+    """
+    if backend == "egl":
+        import ctypes
+        from OpenGL import EGL
+
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if not EGL.eglInitialize(display, None, None):
+            raise RuntimeError("eglInitialize failed")
+        config_attribs = (EGL.EGLint * 13)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE,
+        )
+        config = EGL.EGLConfig()
+        num_configs = EGL.EGLint()
+        EGL.eglChooseConfig(display, config_attribs, ctypes.pointer(config), 1, ctypes.pointer(num_configs))
+        if not num_configs.value:
+            raise RuntimeError("No EGL config with desktop OpenGL support")
+        pbuffer_attribs = (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+        surface = EGL.eglCreatePbufferSurface(display, config, pbuffer_attribs)
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attribs = None
+        if core_profile:
+            context_attribs = (EGL.EGLint * 7)(
+                EGL.EGL_CONTEXT_MAJOR_VERSION, 3, EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+                EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+                EGL.EGL_NONE,
+            )
+        context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, context_attribs)
+        if not EGL.eglMakeCurrent(display, surface, surface, context):
+            raise RuntimeError("eglMakeCurrent failed")
+        return (display, surface, context)
+
+    if backend == "osmesa":
+        from OpenGL import GL, arrays, osmesa
+
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        buffer = arrays.GLubyteArray.zeros((height, width, 4))
+        if not osmesa.OSMesaMakeCurrent(context, buffer, GL.GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("OSMesaMakeCurrent failed")
+        return (context, buffer)
+
+    import pygame
+
+    pygame.display.init()
+    if core_profile:
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, pygame.GL_CONTEXT_PROFILE_CORE)
+    else:
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 2)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 1)
+    return pygame.display.set_mode((width, height), pygame.DOUBLEBUF | pygame.OPENGL | pygame.HIDDEN)
+
+
+def room_map(size, tile_size, rooms=1):
+    """Tile map of a square floor with a side of 2 * size world units, split
+    into a rooms x rooms grid with a doorway in the middle of every inner wall"""
+    tiles = int(math.ceil(2 * size / tile_size)) + 2
+    grid = [["W"] * tiles] + [["W"] + ["."] * (tiles - 2) + ["W"] for _ in range(tiles - 2)] + [["W"] * tiles]
+    bounds = [round(i * (tiles - 1) / rooms) for i in range(rooms + 1)]
+    for wall in bounds[1:-1]:
+        for i in range(tiles):
+            grid[i][wall] = grid[wall][i] = "W"
+    for wall in bounds[1:-1]:
+        for start, end in zip(bounds, bounds[1:]):
+            middle = (start + end) // 2
+            grid[middle][wall] = grid[wall][middle] = "D"
+    return ["".join(row) for row in grid]
+
+
+def build_scene(args, renderer=None):
+    from Constants import MAP_TILE_SIZE
+    from Level import Level
+    from NPC import NPC
+    from TextureManager import TextureManager
+    from World import World
+
+    rng = random.Random(args.seed)
+
+    # Desks in rows, growing the room so they always fit
+    columns = max(1, math.ceil(math.sqrt(args.desks)))
+    spacing = 2.0
+    size = max(4.5, columns * spacing / 2 + 1)
+    textures = None if args.no_textures else TextureManager()
+    world = World(Level(room_map(size, MAP_TILE_SIZE, args.rooms)), textures, renderer)
+    world.desks, world.chairs, world.partitions = [], [], []
+    for i in range(args.desks):
+        x = (i % columns - (columns - 1) / 2) * spacing
+        z = (i // columns - (columns - 1) / 2) * spacing
+        world.desks.append((x, z, 90))
+        world.chairs.append((x + 0.5, z, 90))
+        world.partitions.append((x, z))
+    limit = size - 0.5
+    world.plants = [(-limit, -limit), (limit, -limit), (-limit, limit), (limit, limit)]
+    world.invalidate()
+
+    npcs = [
+        NPC(rng.uniform(-limit, limit), 0, rng.uniform(-limit, limit), rng.choice(("HR", "CEO")))
+        for _ in range(args.npcs)
+    ]
+    return world, npcs, size
+
+
+def percentiles(samples):
+    import numpy as np
+
+    samples = np.asarray(samples) * 1000.0
+    return {
+        "mean": round(float(samples.mean()), 3),
+        "p50": round(float(np.percentile(samples, 50)), 3),
+        "p90": round(float(np.percentile(samples, 90)), 3),
+        "p99": round(float(np.percentile(samples, 99)), 3),
+        "max": round(float(samples.max()), 3),
+    }
+
+
+def run(args):
+    # The platform has to be picked before PyOpenGL is first imported
+    if args.backend in ("egl", "osmesa"):
+        os.environ["PYOPENGL_PLATFORM"] = args.backend
+        if args.backend == "egl":
+            os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+    core_profile = args.renderer == "core"
+    handle = create_context(args.backend, args.width, args.height, core_profile)
+
+    import numpy as np
+    import pygame
+    from OpenGL.GL import glClear, glFinish, glGetString, glLoadIdentity, glPopMatrix, glPushMatrix
+    from OpenGL.GL import glLightfv, glRotatef, glTranslatef, GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT
+    from OpenGL.GL import GL_LIGHT0, GL_POSITION
+    from OpenGL.GL import GL_RENDERER, GL_VERSION
+
+    import app
+    from Constants import FAR_PLANE, FIELD_OF_VIEW, LIGHT_POSITION, NEAR_PLANE
+    from LODSelector import LODSelector
+    from NPC import LOD_DISTANCES
+    from NPCRenderer import NPCRenderer
+    from SceneIndex import Frustum, SceneIndex
+    from benchmark_recorder import draw_npc
+    from transforms import perspective_matrix, view_matrix
+
+    pygame.font.init()
+    renderer = None
+    if core_profile:
+        from CoreRenderer import CoreRenderer
+
+        renderer = CoreRenderer((args.width, args.height))
+    else:
+        app.configure_3d_view((args.width, args.height))
+        glLoadIdentity()
+        app.setup_lighting()
+        app.enable_transparency()
+
+    resolution = None
+    if args.dynamic_resolution:
+        from DynamicResolution import DynamicResolution
+
+        resolution = DynamicResolution((args.width, args.height), args.target_ms / 1000.0)
+
+    world, npcs, room_size = build_scene(args, renderer)
+    npc_renderer = NPCRenderer(renderer)
+    npc_lod = LODSelector(LOD_DISTANCES)
+    npc_ids = np.array([npc.id for npc in npcs], dtype=np.intp)
+    npc_index = SceneIndex(cell_size=4.0)
+    for i, npc in enumerate(npcs):
+        npc_index.insert(i, *npc.bounds())
+    projection = perspective_matrix(FIELD_OF_VIEW, args.width / args.height, NEAR_PLANE, FAR_PLANE)
+
+    dialogue = None
+    if args.dialogue:
+        # DialogueSystem needs a key at import time, no request is ever sent
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        from DialogeSystem import DialogueSystem
+
+        dialogue = DialogueSystem(None, renderer=renderer)
+        dialogue.start_conversation("HR")
+        dialogue.npc_message = " ".join(["This is a fairly long reply from the NPC."] * 6)
+
+    minimap = None
+    if args.minimap:
+        from Minimap import Minimap
+
+        minimap = Minimap(world.level, renderer)
+
+    gl_calls = None
+    if args.count_gl_calls:
+        from GLState import count_gl_calls
+
+        gl_calls = count_gl_calls(report_interval=None)
+    call_counts = []
+
+    phases = {"world": [], "npcs": [], "dialogue": [], "frame": []}
+    if minimap is not None:
+        phases["minimap"] = []
+    scales = []
+    pos = [0.0, 0.5, room_size * 0.6]
+    # Only the chunks around pos load at once, let the rest stream in so
+    # every measured frame draws the whole world
+    while not world.settled:
+        world.update(pos)
+        time.sleep(0.001)
+    for frame in range(args.warmup + args.frames):
+        # Turn slowly on the spot so culling sees every direction
+        rot = [0.0, frame * 360.0 / max(args.frames, 1), 0.0]
+        frame_start = time.perf_counter()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        if resolution is not None:
+            resolution.begin()
+        view = view_matrix(pos, rot)
+        if renderer is not None:
+            renderer.begin_frame(view)
+        else:
+            glPushMatrix()
+            glRotatef(rot[0], 1, 0, 0)
+            glRotatef(rot[1], 0, 1, 0)
+            glTranslatef(-pos[0], -pos[1], -pos[2])
+            glLightfv(GL_LIGHT0, GL_POSITION, LIGHT_POSITION)
+        frustum = None if args.no_cull else Frustum(projection @ view)
+
+        start = time.perf_counter()
+        if gl_calls is not None:
+            gl_calls.begin("world")
+        world.update(pos)
+        world.draw(frustum, None if frustum is None else (pos[0], pos[2]))
+        glFinish()
+        world_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if gl_calls is not None:
+            gl_calls.begin("npcs")
+        if args.npc_path == "single":
+            for npc in npcs:
+                draw_npc(npc)
+        elif frustum is None:
+            npc_renderer.draw(npcs)
+        else:
+            distances = npcs[0].store.distances(pos, npc_ids) if npcs else np.zeros(0)
+            positions = npcs[0].store.positions[npc_ids] if npcs else np.zeros((0, 3))
+            visible = world.pvs.cull(pos[0], pos[2], npc_index.query(frustum), positions)
+            npc_renderer.draw(npcs, visible, npc_lod.select(distances))
+        glFinish()
+        npc_time = time.perf_counter() - start
+        if renderer is None:
+            glPopMatrix()
+        if resolution is not None:
+            resolution.end()
+
+        minimap_time = None
+        if minimap is not None:
+            start = time.perf_counter()
+            if gl_calls is not None:
+                gl_calls.begin("minimap")
+            positions = npcs[0].store.positions[npc_ids] if npcs else np.zeros((0, 3))
+            forward = (math.sin(math.radians(rot[1])), -math.cos(math.radians(rot[1])))
+            minimap.render(pos, forward, positions)
+            glFinish()
+            minimap_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if gl_calls is not None:
+            gl_calls.begin("dialogue")
+        if dialogue is not None:
+            dialogue.render()
+        glFinish()
+        dialogue_time = time.perf_counter() - start
+        frame_time = time.perf_counter() - frame_start
+        if resolution is not None:
+            scales.append(resolution.scale)  # The scale this frame was drawn at
+            resolution.update(frame_time)
+
+        if gl_calls is not None:
+            gl_calls.begin("frame")
+            counts = gl_calls.end_frame()
+            if frame >= args.warmup:
+                call_counts.append(counts)
+        if frame >= args.warmup:
+            phases["world"].append(world_time)
+            phases["npcs"].append(npc_time)
+            if minimap_time is not None:
+                phases["minimap"].append(minimap_time)
+            phases["dialogue"].append(dialogue_time)
+            phases["frame"].append(frame_time)
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "backend", "renderer", "width", "height", "frames", "desks", "rooms", "npcs", "dialogue",
+                "minimap", "npc_path", "no_textures", "no_cull", "dynamic_resolution", "target_ms",
+                "count_gl_calls", "seed",
+            )
+        },
+        "renderer": glGetString(GL_RENDERER).decode(),
+        "gl_version": glGetString(GL_VERSION).decode(),
+        "phases_ms": {name: percentiles(samples) for name, samples in phases.items()},
+    }
+    if gl_calls is not None:
+        subsystems = sorted({name for counts in call_counts for name in counts})
+        report["gl_calls_per_frame"] = {
+            name: {
+                "calls": round(sum(counts.get(name, (0, 0))[0] for counts in call_counts) / len(call_counts), 1),
+                "skipped": round(sum(counts.get(name, (0, 0))[1] for counts in call_counts) / len(call_counts), 1),
+            }
+            for name in subsystems
+        }
+        gl_calls.release()
+    if resolution is not None:
+        measured = np.array(scales[args.warmup:])
+        report["resolution_scale"] = {
+            "mean": round(float(measured.mean()), 3),
+            "min": round(float(measured.min()), 3),
+            "max": round(float(measured.max()), 3),
+            "final": resolution.scale,
+        }
+    del handle
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Keep stdout clean for the JSON report, the game modules log with print
+    with contextlib.redirect_stdout(sys.stderr):
+        report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""Immediate-mode recording for benchmark.py --npc-path single.
+
+The game draws NPCs through NPCRenderer and builds the world on
+MeshBuilder, so it issues no immediate-mode geometry of its own. The
+benchmark keeps drawing NPCs one at a time with legacy GL calls as the
+reference path, and GLRecorder batches those calls into replayable
+arrays, one draw per primitive type and color.
+"""
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from OpenGL.GL import *
+
+import mesh_cache
+from EntityStore import COLOR_SLOTS
+from GLState import get_gl_state
+from NPC import BODY_PARTS, LOD_SPHERE_DETAIL
+from transforms import rotation_matrix, scale_matrix, translation_matrix
+from utils import draw_cube, draw_sphere
+
+# Each primitive type as the simple one it is recorded as: (output mode,
+# indices(n) of the output vertices for an input of n vertices)
+PRIMITIVES = {
+    GL_POINTS: (GL_POINTS, lambda n: np.arange(n)),
+    GL_LINES: (GL_LINES, lambda n: np.arange(n // 2 * 2)),
+    GL_LINE_STRIP: (GL_LINES, lambda n: np.stack((np.arange(n - 1), np.arange(1, n)), axis=1).ravel()),
+    GL_LINE_LOOP: (GL_LINES, lambda n: np.stack((np.arange(n), (np.arange(n) + 1) % n), axis=1).ravel()
+                   if n > 1 else np.zeros(0, dtype=int)),
+    GL_TRIANGLES: (GL_TRIANGLES, lambda n: np.arange(n // 3 * 3)),
+    GL_TRIANGLE_STRIP: (GL_TRIANGLES, lambda n: np.array(
+        [(i, i + 1, i + 2) if i % 2 == 0 else (i + 1, i, i + 2) for i in range(n - 2)], dtype=int
+    ).reshape(-1)),
+    GL_TRIANGLE_FAN: (GL_TRIANGLES, lambda n: np.array(
+        [(0, i, i + 1) for i in range(1, n - 1)], dtype=int
+    ).reshape(-1)),
+    GL_POLYGON: (GL_TRIANGLES, lambda n: np.array(
+        [(0, i, i + 1) for i in range(1, n - 1)], dtype=int
+    ).reshape(-1)),
+    GL_QUADS: (GL_TRIANGLES, lambda n: (
+        np.array((0, 1, 2, 0, 2, 3)) + 4 * np.arange(n // 4)[:, None]
+    ).ravel()),
+    GL_QUAD_STRIP: (GL_TRIANGLES, lambda n: (
+        np.array((0, 1, 3, 0, 3, 2)) + 2 * np.arange(max(n // 2 - 1, 0))[:, None]
+    ).ravel()),
+}
+
+
+class RecordedBatch:
+    """Vertices of one output primitive type and color"""
+
+    def __init__(self, mode, color, positions, normals, texcoords=None):
+        self.mode = mode
+        self.color = color
+        self.positions = np.ascontiguousarray(positions, dtype=np.float32)
+        self.normals = np.ascontiguousarray(normals, dtype=np.float32)
+        self.texcoords = None if texcoords is None else np.ascontiguousarray(texcoords, dtype=np.float32)
+
+
+class Recording:
+    """What a draw function produced, as one batch per primitive type and color.
+
+    draw() replays it with the current modelview matrix and GL state, the
+    way calling the function again would, without running any Python from it.
+    """
+
+    def __init__(self, batches):
+        self.batches = batches
+
+    @property
+    def draw_count(self):
+        return len(self.batches)
+
+    def draw(self):
+        state = get_gl_state()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        for batch in self.batches:
+            state.color(*batch.color)
+            glVertexPointer(3, GL_FLOAT, 0, batch.positions)
+            glNormalPointer(GL_FLOAT, 0, batch.normals)
+            if batch.texcoords is not None:
+                glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+                glTexCoordPointer(2, GL_FLOAT, 0, batch.texcoords)
+            glDrawArrays(batch.mode, 0, len(batch.positions))
+            if batch.texcoords is not None:
+                glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+
+class GLRecorder:
+    """Stands in for the legacy GL geometry calls while recording.
+
+    Supports glBegin/glEnd with glVertex, glNormal, glColor and glTexCoord,
+    client vertex arrays drawn with glDrawArrays, and the modelview stack
+    (glPushMatrix, glPopMatrix, glLoadIdentity, glTranslate, glRotate,
+    glScale). Vertices are transformed on the CPU, relative to whatever
+    modelview matrix is current when the recording is drawn. Any other GL
+    call goes straight to GL as usual and is not replayed, so set state
+    outside the recorded function.
+    """
+
+    def __init__(self):
+        self.matrix = np.identity(4)
+        self.stack = []
+        self.color = (1.0, 1.0, 1.0, 1.0)
+        self.normal = (0.0, 0.0, 1.0)
+        self.texcoord = None
+        self.mode = None  # Between glBegin and glEnd
+        self.vertices = []  # (position, normal, texcoord) of the open primitive
+        self.client_arrays = set()
+        self.pointers = {}  # client array -> (n, size) data
+        self.groups = OrderedDict()  # (mode, color, textured) -> [(positions, normals, texcoords)]
+
+    def functions(self):
+        """{GL function name: replacement} while recording"""
+        return {
+            "glPushMatrix": self.push_matrix, "glPopMatrix": self.pop_matrix,
+            "glLoadIdentity": self.load_identity,
+            "glTranslatef": self.translate, "glTranslated": self.translate,
+            "glRotatef": self.rotate, "glRotated": self.rotate,
+            "glScalef": self.scale, "glScaled": self.scale,
+            "glBegin": self.begin, "glEnd": self.end,
+            "glVertex2f": self.vertex, "glVertex3f": self.vertex,
+            "glNormal3f": self.set_normal, "glTexCoord2f": self.set_texcoord,
+            "glColor3f": self.set_color, "glColor4f": self.set_color,
+            "glEnableClientState": self.enable_client_state,
+            "glDisableClientState": self.disable_client_state,
+            "glVertexPointer": self.vertex_pointer, "glNormalPointer": self.normal_pointer,
+            "glTexCoordPointer": self.texcoord_pointer, "glDrawArrays": self.draw_arrays,
+        }
+
+    # Matrix stack
+    def push_matrix(self):
+        self.stack.append(self.matrix.copy())
+
+    def pop_matrix(self):
+        self.matrix = self.stack.pop()
+
+    def load_identity(self):
+        self.matrix = np.identity(4)
+
+    def translate(self, x, y, z):
+        self.matrix = self.matrix @ translation_matrix(x, y, z)
+
+    def rotate(self, angle, x, y, z):
+        self.matrix = self.matrix @ rotation_matrix(angle, x, y, z)
+
+    def scale(self, x, y, z):
+        self.matrix = self.matrix @ scale_matrix(x, y, z)
+
+    # Current vertex attributes
+    def set_color(self, r, g, b, a=1.0):
+        self.color = (float(r), float(g), float(b), float(a))
+
+    def set_normal(self, x, y, z):
+        self.normal = (x, y, z)
+
+    def set_texcoord(self, s, t):
+        self.texcoord = (s, t)
+
+    # Immediate mode
+    def begin(self, mode):
+        self.mode = mode
+        self.vertices = []
+
+    def vertex(self, x, y, z=0.0):
+        self.vertices.append(((x, y, z), self.normal, self.texcoord))
+
+    def end(self):
+        if self.vertices:
+            positions, normals, texcoords = zip(*self.vertices)
+            textured = all(texcoord is not None for texcoord in texcoords)
+            self.add(self.mode, positions, normals, texcoords if textured else None)
+        self.mode = None
+        self.vertices = []
+
+    # Client arrays
+    def enable_client_state(self, array):
+        self.client_arrays.add(array)
+
+    def disable_client_state(self, array):
+        self.client_arrays.discard(array)
+
+    def vertex_pointer(self, size, data_type, stride, pointer):
+        self.pointers[GL_VERTEX_ARRAY] = np.asarray(pointer, dtype=np.float32).reshape(-1, size)
+
+    def normal_pointer(self, data_type, stride, pointer):
+        self.pointers[GL_NORMAL_ARRAY] = np.asarray(pointer, dtype=np.float32).reshape(-1, 3)
+
+    def texcoord_pointer(self, size, data_type, stride, pointer):
+        self.pointers[GL_TEXTURE_COORD_ARRAY] = np.asarray(pointer, dtype=np.float32).reshape(-1, size)
+
+    def draw_arrays(self, mode, first, count):
+        if GL_COLOR_ARRAY in self.client_arrays:
+            raise ValueError("Color arrays cannot be recorded, set colors with glColor")
+        positions = self.pointers[GL_VERTEX_ARRAY][first:first + count]
+        if positions.shape[1] == 2:
+            positions = np.column_stack((positions, np.zeros(len(positions))))
+        if GL_NORMAL_ARRAY in self.client_arrays:
+            normals = self.pointers[GL_NORMAL_ARRAY][first:first + count]
+        else:
+            normals = np.tile(self.normal, (count, 1))
+        texcoords = None
+        if GL_TEXTURE_COORD_ARRAY in self.client_arrays:
+            texcoords = self.pointers[GL_TEXTURE_COORD_ARRAY][first:first + count, :2]
+        self.add(mode, positions, normals, texcoords)
+
+    def add(self, mode, positions, normals, texcoords):
+        """Transform one primitive's vertices and file them under its batch"""
+        output_mode, indices = PRIMITIVES[mode]
+        indices = indices(len(positions))
+        if not len(indices):
+            return
+        positions = np.asarray(positions, dtype=np.float64)[indices]
+        normals = np.asarray(normals, dtype=np.float64)[indices]
+        positions = positions @ self.matrix[:3, :3].T + self.matrix[:3, 3]
+        # Normals go through the inverse transpose so scaling keeps them correct
+        normals = normals @ np.linalg.inv(self.matrix[:3, :3])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals /= np.where(lengths > 0, lengths, 1)
+        if texcoords is not None:
+            texcoords = np.asarray(texcoords, dtype=np.float64)[indices]
+        key = (output_mode, self.color, texcoords is not None)
+        self.groups.setdefault(key, []).append((positions, normals, texcoords))
+
+    def recording(self):
+        batches = []
+        for (mode, color, textured), parts in self.groups.items():
+            positions, normals, texcoords = zip(*parts)
+            batches.append(RecordedBatch(
+                mode, color, np.concatenate(positions), np.concatenate(normals),
+                np.concatenate(texcoords) if textured else None,
+            ))
+        return Recording(batches)
+
+
+@contextmanager
+def recording(modules):
+    """Swap the recorder in for the GL functions of `modules` inside the
+    block, yields the GLRecorder. Name only the modules whose GL calls make
+    up the drawing, anything else drawn meanwhile would be recorded too."""
+    recorder = GLRecorder()
+    # GLState must not skip a color the recorder has not seen yet
+    get_gl_state().invalidate("color")
+    replaced = []
+    for module in modules:
+        for name, function in recorder.functions().items():
+            if name in vars(module):
+                replaced.append((module, name, vars(module)[name]))
+                setattr(module, name, function)
+    try:
+        yield recorder
+    finally:
+        for module, name, function in replaced:
+            setattr(module, name, function)
+        # The real current color was not touched either, forget what GLState was told
+        get_gl_state().invalidate("color")
+
+
+def record(modules, draw_fn, *args):
+    """Run draw_fn(*args) under a GLRecorder for `modules`, returns its Recording"""
+    with recording(modules) as recorder:
+        draw_fn(*args)
+    return recorder.recording()
+
+
+class RecordingCache:
+    """Replays draw functions from their recordings, keyed by their inputs.
+
+    The first draw() of a key runs the function under a recorder; later
+    ones only replay the arrays. Keys must cover everything the function's
+    output depends on. `modules` are the ones making its GL calls, as for
+    recording(). The least recently used recordings are dropped past
+    `cache_size`.
+    """
+
+    def __init__(self, modules, cache_size=256):
+        self.modules = tuple(modules)
+        self.cache_size = cache_size
+        self.recordings = OrderedDict()  # key -> Recording
+
+    def draw(self, key, draw_fn, *args):
+        recording = self.recordings.get(key)
+        if recording is None:
+            recording = record(self.modules, draw_fn, *args)
+            self.recordings[key] = recording
+            if len(self.recordings) > self.cache_size:
+                self.recordings.popitem(last=False)
+        else:
+            self.recordings.move_to_end(key)
+        recording.draw()
+
+    def clear(self):
+        self.recordings.clear()
+
+
+# Recorded NPC bodies. Only this module (matrices, colors) and mesh_cache
+# (the arrays) are recorded from
+BODY_RECORDINGS = RecordingCache((sys.modules[__name__], mesh_cache), cache_size=1024)
+
+
+def draw_npc(npc, lod=0):
+    """Draw one NPC on its own, recorded once per pose, colors and LOD and
+    replayed as one draw per color while none of them change"""
+    state = get_gl_state()
+    state.enable(GL_LIGHTING)
+    state.disable(GL_TEXTURE_2D)
+    state.color_material(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
+    state.enable(GL_COLOR_MATERIAL)
+    key = (lod, tuple(map(float, npc.pos)), float(npc.scale), npc.palette().tobytes())
+    BODY_RECORDINGS.draw(key, draw_npc_body, npc, lod)
+
+
+def draw_npc_body(npc, lod):
+    detail = LOD_SPHERE_DETAIL[lod]
+    colors = dict(zip(COLOR_SLOTS, npc.palette()))
+
+    glPushMatrix()
+    glTranslatef(npc.pos[0], npc.pos[1], npc.pos[2])
+    glScalef(npc.scale, npc.scale, npc.scale)
+
+    for slot, shape, offset, size in BODY_PARTS:
+        glColor3f(*colors[slot])
+        glPushMatrix()
+        glTranslatef(*offset)
+        if shape == "sphere" and detail is not None:
+            draw_sphere(size, detail, detail)
+        elif shape == "sphere":
+            glScalef(size * 2, size * 2, size * 2)
+            draw_cube()
+        else:
+            glScalef(*size)
+            draw_cube()
+        glPopMatrix()
+
+    glPopMatrix()
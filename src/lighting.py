@@ -0,0 +1,33 @@
+import numpy as np
+
+from Constants import LIGHT_AMBIENT, LIGHT_DIFFUSE, LIGHT_MODEL_AMBIENT, LIGHT_POSITION
+from mesh_builder import MeshBatch
+
+
+def light_vertices(positions, normals, color):
+    """(n, 3) float32 lit colors of the given vertices.
+
+    The same model as fixed-function GL_LIGHT0 with GL_COLOR_MATERIAL
+    driving ambient and diffuse: no specular, no attenuation, one-sided.
+    The light is a point light at LIGHT_POSITION in world space.
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    to_light = np.float32(LIGHT_POSITION[:3]) - positions
+    lengths = np.linalg.norm(to_light, axis=1, keepdims=True)
+    to_light /= np.where(lengths > 0, lengths, 1)
+    diffuse = np.maximum(np.einsum("ij,ij->i", normals, to_light), 0)[:, None]
+    ambient = np.float32(LIGHT_MODEL_AMBIENT[:3]) + np.float32(LIGHT_AMBIENT[:3])
+    light = ambient + np.float32(LIGHT_DIFFUSE[:3]) * diffuse
+    return np.minimum(np.float32(color) * light, 1).astype(np.float32)
+
+
+def bake_batches(batches):
+    """Copies of {material: MeshBatch} with the static light baked into
+    per-vertex colors. They have no normals left and are drawn unlit."""
+    return {
+        name: MeshBatch(
+            batch.positions, None, batch.color, batch.texcoords,
+            light_vertices(batch.positions, batch.normals, batch.color),
+        )
+        for name, batch in batches.items()
+    }
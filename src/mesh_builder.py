@@ -0,0 +1,180 @@
+import numpy as np
+from OpenGL.GL import *
+
+from mesh_cache import Mesh, draw_mesh, get_cube_mesh, get_sphere_mesh
+from transforms import rotation_matrix, scale_matrix, translation_matrix
+
+
+class MeshBatch(Mesh):
+    """Flat, non-indexed triangle list for a single material.
+
+    Batches with texcoords sample whatever texture is bound when they are
+    drawn (see World.draw), the color tints it. Batches with
+    baked lighting (see lighting.bake_batches) carry per-vertex `colors`
+    instead of normals and are drawn with lighting off.
+    """
+
+    def __init__(self, positions, normals, color, texcoords=None, colors=None):
+        super().__init__(positions, normals, texcoords)
+        self.color = color
+        self.colors = None if colors is None else np.ascontiguousarray(colors, dtype=np.float32)
+
+
+class MeshBuilder:
+    """Collects static geometry on the CPU, grouped by material.
+
+    Mirrors the bits of the fixed-function API the drawing code uses
+    (matrix stack, quads, triangles) so furniture can be described once and
+    compiled into a handful of batches instead of being re-issued every frame.
+    """
+
+    def __init__(self):
+        self.matrix = np.identity(4, dtype=np.float64)
+        self.stack = []
+        self.material = None
+        self.colors = {}
+        self.triangles = {}  # material -> list of (n, 3, 3) vertex arrays
+        self.normals = {}
+
+    # Matrix stack
+    def push_matrix(self):
+        self.stack.append(self.matrix.copy())
+
+    def pop_matrix(self):
+        self.matrix = self.stack.pop()
+
+    def translate(self, x, y, z):
+        self.matrix = self.matrix @ translation_matrix(x, y, z)
+
+    def rotate(self, angle, x, y, z):
+        """Rotate by `angle` degrees around (x, y, z), same as glRotatef"""
+        self.matrix = self.matrix @ rotation_matrix(angle, x, y, z)
+
+    def scale(self, x, y, z):
+        self.matrix = self.matrix @ scale_matrix(x, y, z)
+
+    # Geometry
+    def set_material(self, name, color):
+        self.material = name
+        self.colors[name] = color
+        self.triangles.setdefault(name, [])
+        self.normals.setdefault(name, [])
+
+    def transform(self, vertices):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        return vertices @ self.matrix[:3, :3].T + self.matrix[:3, 3]
+
+    def add_triangles(self, positions, normals=None):
+        """Append world-space (n, 3, 3) triangles, flat-shaded if no normals given"""
+        if normals is None:
+            normals = np.cross(
+                positions[:, 1] - positions[:, 0], positions[:, 2] - positions[:, 0]
+            )
+            normals = np.repeat(normals[:, None, :], 3, axis=1)
+        lengths = np.linalg.norm(normals, axis=2, keepdims=True)
+        normals = normals / np.where(lengths > 0, lengths, 1)
+        self.triangles[self.material].append(positions)
+        self.normals[self.material].append(normals)
+
+    def triangle(self, a, b, c):
+        self.add_triangles(self.transform((a, b, c))[None])
+
+    def quad(self, a, b, c, d):
+        a, b, c, d = self.transform((a, b, c, d))
+        self.add_triangles(np.array(((a, b, c), (a, c, d))))
+
+    def add_mesh(self, mesh):
+        """Append a cached Mesh under the current matrix and material"""
+        positions = self.transform(mesh.positions).reshape(-1, 3, 3)
+        # Normals go through the inverse transpose so scaling keeps them correct
+        normal_matrix = np.linalg.inv(self.matrix[:3, :3]).T
+        normals = (mesh.normals @ normal_matrix.T).reshape(-1, 3, 3)
+        self.add_triangles(positions, normals)
+
+    def cube(self):
+        """Unit cube centred on the origin, like utils.draw_cube"""
+        self.add_mesh(get_cube_mesh())
+
+    def sphere(self, radius, slices, stacks):
+        self.add_mesh(get_sphere_mesh(radius, slices, stacks))
+
+    def build(self):
+        """Return {material: MeshBatch}"""
+        batches = {}
+        for name, tris in self.triangles.items():
+            if not tris:
+                continue
+            positions = np.concatenate(tris)
+            normals = np.concatenate(self.normals[name])
+            batches[name] = MeshBatch(positions, normals, self.colors[name])
+        return batches
+
+
+def merge_attribute(arrays, name):
+    """Concatenated arrays, or None if no batch has the attribute"""
+    if all(array is None for array in arrays):
+        return None
+    if any(array is None for array in arrays):
+        raise ValueError(f"Cannot merge batches with and without {name}")
+    return np.concatenate(arrays)
+
+
+def merge_batches(batch_sets):
+    """Merge several {material: MeshBatch} dicts into one.
+
+    Baked and unbaked batches both merge, but a material's batches must
+    all have or all lack each of normals, texcoords and per-vertex colors.
+    """
+    merged = {}
+    for batches in batch_sets:
+        for name, batch in batches.items():
+            merged.setdefault(name, []).append(batch)
+    return {
+        name: MeshBatch(
+            np.concatenate([batch.positions for batch in group]),
+            merge_attribute([batch.normals for batch in group], "normals"),
+            group[0].color,
+            merge_attribute([batch.texcoords for batch in group], "texcoords"),
+            merge_attribute([batch.colors for batch in group], "colors"),
+        )
+        for name, group in merged.items()
+    }
+
+
+def batch_bounds(batches):
+    """Axis-aligned (lo, hi) corners around every vertex of the batches"""
+    positions = np.concatenate([batch.positions for batch in batches.values()])
+    return positions.min(axis=0), positions.max(axis=0)
+
+
+def draw_batch(batch):
+    """Draw a MeshBatch through client-side vertex arrays.
+
+    Leaves GL_TEXTURE_2D to the caller, so it is not toggled inside every
+    display list.
+    """
+    if batch.colors is None:
+        glColor3f(*batch.color)
+    else:
+        glEnableClientState(GL_COLOR_ARRAY)
+        glColorPointer(3, GL_FLOAT, 0, batch.colors)
+    draw_mesh(batch)
+    if batch.colors is not None:
+        glDisableClientState(GL_COLOR_ARRAY)
+
+
+def compile_batches(batches):
+    """Compile each batch into its own display list, returns {material: list_id}"""
+    lists = {}
+    for name, batch in batches.items():
+        list_id = glGenLists(1)
+        glNewList(list_id, GL_COMPILE)
+        draw_batch(batch)
+        glEndList()
+        lists[name] = list_id
+    return lists
+
+
+def delete_display_lists(lists):
+    for list_id in lists.values():
+        glDeleteLists(list_id, 1)
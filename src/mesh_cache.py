@@ -0,0 +1,105 @@
+from functools import lru_cache
+
+import numpy as np
+from OpenGL.GL import *
+
+from AssetPack import get_asset_pack
+
+
+class Mesh:
+    """Triangle list stored as contiguous float32 position/normal(/texcoord) arrays.
+
+    Meshes with baked lighting have no normals.
+    """
+
+    def __init__(self, positions, normals, texcoords=None):
+        self.positions = np.ascontiguousarray(positions, dtype=np.float32).reshape(-1, 3)
+        self.normals = (
+            None if normals is None
+            else np.ascontiguousarray(normals, dtype=np.float32).reshape(-1, 3)
+        )
+        self.texcoords = (
+            None if texcoords is None
+            else np.ascontiguousarray(texcoords, dtype=np.float32).reshape(-1, 2)
+        )
+
+    @property
+    def vertex_count(self):
+        return len(self.positions)
+
+
+def packed_mesh(name):
+    """Mesh mapped from the AssetPack, None if it is not baked there"""
+    pack = get_asset_pack()
+    if pack is None or f"{name}/positions" not in pack:
+        return None
+    return Mesh(pack.array(f"{name}/positions"), pack.array(f"{name}/normals"))
+
+
+# Unit cube centred on the origin, one outward normal per face
+CUBE_VERTICES = [
+    (-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (0.5, 0.5, 0.5), (-0.5, 0.5, 0.5),
+    (-0.5, -0.5, -0.5), (-0.5, 0.5, -0.5), (0.5, 0.5, -0.5), (0.5, -0.5, -0.5),
+]
+CUBE_FACES = [
+    ((0, 1, 2, 3), (0, 0, 1)),  # Front
+    ((3, 2, 6, 5), (0, 1, 0)),  # Top
+    ((0, 3, 5, 4), (-1, 0, 0)),  # Left
+    ((1, 7, 6, 2), (1, 0, 0)),  # Right
+    ((4, 5, 6, 7), (0, 0, -1)),  # Back
+    ((0, 4, 7, 1), (0, -1, 0)),  # Bottom
+]
+
+
+@lru_cache(maxsize=None)
+def get_cube_mesh():
+    mesh = packed_mesh("mesh/cube")
+    if mesh is not None:
+        return mesh
+    positions = []
+    normals = []
+    for (a, b, c, d), normal in CUBE_FACES:
+        for index in (a, b, c, a, c, d):
+            positions.append(CUBE_VERTICES[index])
+            normals.append(normal)
+    return Mesh(positions, normals)
+
+
+@lru_cache(maxsize=None)
+def get_sphere_mesh(radius, slices, stacks):
+    """Same parametrisation as the old quad-strip sphere (poles on the Z axis)"""
+    mesh = packed_mesh(f"mesh/sphere/{radius}/{slices}/{stacks}")
+    if mesh is not None:
+        return mesh
+    lat = np.pi * (-0.5 + np.arange(stacks + 1) / stacks)
+    lng = 2 * np.pi * np.arange(slices + 1) / slices
+    lat, lng = np.meshgrid(lat, lng, indexing="ij")
+    unit = np.stack(
+        (np.cos(lng) * np.cos(lat), np.sin(lng) * np.cos(lat), np.sin(lat)), axis=-1
+    )
+
+    # Two counter-clockwise triangles per (stack, slice) cell
+    v00 = unit[:-1, :-1]
+    v01 = unit[:-1, 1:]
+    v10 = unit[1:, :-1]
+    v11 = unit[1:, 1:]
+    normals = np.stack((v00, v01, v11, v00, v11, v10), axis=2).reshape(-1, 3)
+    return Mesh(normals * radius, normals)
+
+
+def draw_mesh(mesh):
+    """Draw a Mesh with a single glDrawArrays call"""
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, mesh.positions)
+    if mesh.normals is not None:
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, 0, mesh.normals)
+    if mesh.texcoords is not None:
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glTexCoordPointer(2, GL_FLOAT, 0, mesh.texcoords)
+    glDrawArrays(GL_TRIANGLES, 0, mesh.vertex_count)
+    if mesh.texcoords is not None:
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+    if mesh.normals is not None:
+        glDisableClientState(GL_NORMAL_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
@@ -1,32 +1,45 @@
 import pygame
 import os
 
-# Create textures directory if it doesn't exist
-if not os.path.exists("textures"):
-    os.makedirs("textures")
-
-# Initialize Pygame
-pygame.init()
-
-# Wall texture
-wall_size = (64, 64)
-wall = pygame.Surface(wall_size)
-wall.fill((128, 128, 128))  # Gray base
-pygame.draw.rect(wall, (100, 100, 100), (0, 0, 64, 32))
-pygame.draw.rect(wall, (140, 140, 140), (32, 32, 64, 64))
-pygame.image.save(wall, "textures/wall.png")
-
-# Floor texture
-floor_size = (64, 64)
-floor = pygame.Surface(floor_size)
-floor.fill((139, 69, 19))  # Brown base
-pygame.image.save(floor, "textures/floor.png")
-
-# Ceiling texture
-ceiling_size = (64, 64)
-ceiling = pygame.Surface(ceiling_size)
-ceiling.fill((200, 200, 200))  # Light gray base
-pygame.image.save(ceiling, "textures/ceiling.png")
-
-print("Textures generated successfully!")
-pygame.quit()
\ No newline at end of file
+from Constants import TEXTURE_DIR
+
+
+def generate_textures():
+    """Build the game's textures, returns {name: Surface}"""
+    # Wall texture
+    wall_size = (64, 64)
+    wall = pygame.Surface(wall_size)
+    wall.fill((128, 128, 128))  # Gray base
+    pygame.draw.rect(wall, (100, 100, 100), (0, 0, 64, 32))
+    pygame.draw.rect(wall, (140, 140, 140), (32, 32, 64, 64))
+
+    # Floor texture
+    floor_size = (64, 64)
+    floor = pygame.Surface(floor_size)
+    floor.fill((139, 69, 19))  # Brown base
+
+    # Ceiling texture
+    ceiling_size = (64, 64)
+    ceiling = pygame.Surface(ceiling_size)
+    ceiling.fill((200, 200, 200))  # Light gray base
+
+    return {"wall": wall, "floor": floor, "ceiling": ceiling}
+
+
+def main():
+    # Create textures directory if it doesn't exist
+    if not os.path.exists(TEXTURE_DIR):
+        os.makedirs(TEXTURE_DIR)
+
+    # Initialize Pygame
+    pygame.init()
+
+    for name, surface in generate_textures().items():
+        pygame.image.save(surface, os.path.join(TEXTURE_DIR, f"{name}.png"))
+
+    print("Textures generated successfully!")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
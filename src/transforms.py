@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+
+# 4x4 matrices for column vectors (M @ v), same conventions as the
+# fixed-function glTranslatef/glRotatef/gluPerspective calls they mirror.
+# Transpose before handing them to OpenGL, which expects column-major data.
+
+
+def translation_matrix(x, y, z):
+    m = np.identity(4)
+    m[:3, 3] = (x, y, z)
+    return m
+
+
+def scale_matrix(x, y, z):
+    return np.diag((x, y, z, 1.0))
+
+
+def rotation_matrix(angle, x, y, z):
+    """Rotate by `angle` degrees around (x, y, z), same as glRotatef"""
+    axis = np.array((x, y, z), dtype=np.float64)
+    axis /= np.linalg.norm(axis)
+    x, y, z = axis
+    c = math.cos(math.radians(angle))
+    s = math.sin(math.radians(angle))
+    t = 1 - c
+    m = np.identity(4)
+    m[:3, :3] = (
+        (t * x * x + c, t * x * y - s * z, t * x * z + s * y),
+        (t * x * y + s * z, t * y * y + c, t * y * z - s * x),
+        (t * x * z - s * y, t * y * z + s * x, t * z * z + c),
+    )
+    return m
+
+
+def perspective_matrix(fovy, aspect, near, far):
+    """Same matrix as gluPerspective"""
+    f = 1.0 / math.tan(math.radians(fovy) / 2)
+    m = np.zeros((4, 4))
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2 * far * near / (near - far)
+    m[3, 2] = -1
+    return m
+
+
+def view_matrix(pos, rot):
+    """Camera matrix for a player, matches the glRotatef/glTranslatef chain in Game3D"""
+    return (
+        rotation_matrix(rot[0], 1, 0, 0)
+        @ rotation_matrix(rot[1], 0, 1, 0)
+        @ translation_matrix(-pos[0], -pos[1], -pos[2])
+    )
+
+
+def ortho_matrix(left, right, bottom, top, near, far):
+    """Same matrix as glOrtho"""
+    m = np.identity(4)
+    m[0, 0] = 2 / (right - left)
+    m[1, 1] = 2 / (top - bottom)
+    m[2, 2] = -2 / (far - near)
+    m[:3, 3] = (
+        -(right + left) / (right - left),
+        -(top + bottom) / (top - bottom),
+        -(far + near) / (far - near),
+    )
+    return m
@@ -1,57 +1,12 @@
-import math
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from mesh_cache import draw_mesh, get_cube_mesh, get_sphere_mesh
 
-def draw_cube():
-    vertices = [
-        # Front face
-        [-0.5, -0.5, 0.5],
-        [0.5, -0.5, 0.5],
-        [0.5, 0.5, 0.5],
-        [-0.5, 0.5, 0.5],
-        # Back face
-        [-0.5, -0.5, -0.5],
-        [-0.5, 0.5, -0.5],
-        [0.5, 0.5, -0.5],
-        [0.5, -0.5, -0.5],
-    ]
-
-    surfaces = [
-        [0, 1, 2, 3],  # Front
-        [3, 2, 6, 5],  # Top
-        [0, 3, 5, 4],  # Left
-        [1, 7, 6, 2],  # Right
-        [4, 5, 6, 7],  # Back
-        [0, 4, 7, 1],  # Bottom
-    ]
 
-    glBegin(GL_QUADS)
-    for surface in surfaces:
-        glNormal3f(0, 0, 1)  # Simple normal for lighting
-        for vertex in surface:
-            glVertex3fv(vertices[vertex])
-    glEnd()
+def draw_cube():
+    draw_mesh(get_cube_mesh())
 
 
 def draw_sphere(radius, slices, stacks):
-    for i in range(stacks):
-        lat0 = math.pi * (-0.5 + float(i) / stacks)
-        z0 = math.sin(lat0)
-        zr0 = math.cos(lat0)
-
-        lat1 = math.pi * (-0.5 + float(i + 1) / stacks)
-        z1 = math.sin(lat1)
-        zr1 = math.cos(lat1)
-
-        glBegin(GL_QUAD_STRIP)
-        for j in range(slices + 1):
-            lng = 2 * math.pi * float(j) / slices
-            x = math.cos(lng)
-            y = math.sin(lng)
-
-            glNormal3f(x * zr0, y * zr0, z0)
-            glVertex3f(x * zr0 * radius, y * zr0 * radius, z0 * radius)
-            glNormal3f(x * zr1, y * zr1, z1)
-            glVertex3f(x * zr1 * radius, y * zr1 * radius, z1 * radius)
-        glEnd()
\ No newline at end of file
+    draw_mesh(get_sphere_mesh(radius, slices, stacks))